@@ -1,5 +1,6 @@
 const { PythonShell } = require('python-shell');
 const path = require('path');
+const os = require('os');
 
 async function ejecutarScript(script, args) {
     return new Promise((resolve, reject) => {
@@ -42,20 +43,43 @@ async function main() {
             'output/log.txt'
         ]);
 
-        // 2. Ejecutar detect.py
-        await ejecutarScript('detect.py', [
+        // 2 y 3. Ejecutar detect.py y detect2.py a la vez: cada uno procesa solo su formato
+        // de factura y el almacén se bloquea al guardar. Se reparten los núcleos entre los dos.
+        const workers = String(Math.max(1, Math.floor(os.cpus().length / 2)));
+        await Promise.all([
+            ejecutarScript('detect.py', [
+                'PDF-FACTURAS',
+                'output/data.xlsx',
+                '--log_file',
+                'output/log_facturas.txt',
+                '--workers',
+                workers
+            ]),
+            ejecutarScript('detect2.py', [
+                'PDF-FACTURAS',
+                'output/data.xlsx',
+                '--log_file',
+                'output/log_facturas_nuevas.txt',
+                '--workers',
+                workers
+            ])
+        ]);
+
+        // 4. Ejecutar reconcile.py
+        await ejecutarScript('reconcile.py', [
             'PDF-FACTURAS',
             'output/data.xlsx',
+            '--output',
+            'output/conciliacion.xlsx',
             '--log_file',
-            'output/log_facturas.txt'
+            'output/log_conciliacion.txt'
         ]);
 
-        // 3. Ejecutar detect2.py
-        await ejecutarScript('detect2.py', [
-            'PDF-FACTURAS',
+        // 5. Ejecutar summary.py
+        await ejecutarScript('summary.py', [
             'output/data.xlsx',
-            '--log_file',
-            'output/log_facturas_nuevas.txt'
+            '--output',
+            'output/resumen.xlsx'
         ]);
 
     } catch (error) {
@@ -0,0 +1,108 @@
+import io
+import re
+import xml.etree.ElementTree as ET
+from money import parse_cents
+
+# Las facturas son CFDI y el XML timbrado suele venir junto al PDF con el mismo nombre
+# (factura.pdf / factura.xml). Ahí la serie, el folio, la fecha de emisión, las descripciones
+# de los conceptos y los totales son atributos, así que se leen con un parser de flujo
+# (iterparse) sin pasar el PDF por pdfminer. El texto del PDF queda como respaldo cuando no
+# hay XML, está dañado o no trae referencias.
+PEDIDO_NUMBER = re.compile(r'\b\d{10}\b')
+EXPEDIENTE_NUMBER = re.compile(r'\b\d{8}\b')
+SEPARATED_NUMBER = re.compile(r'\b\d{4}[\s.\-_]\d{4,6}\b')
+SEPARATORS = re.compile(r'[\s.\-_]')
+CLAVE_ARRASTRE = '78101803'  # Clave SAT del servicio de grúa; no es un expediente
+
+def local_name(tag):
+    """Nombre del nodo sin el espacio de nombres ('{http://www.sat.gob.mx/cfd/4}Concepto' → 'Concepto')"""
+    return tag.rsplit('}', 1)[-1]
+
+def attribute(elem, name):
+    """Atributo de un nodo; el CFDI 3.2 usa los mismos nombres con minúscula inicial"""
+    return elem.get(name) or elem.get(name[0].lower() + name[1:])
+
+def emission_date(value):
+    """'2024-10-08T12:34:56' → '08/10/2024' (el formato de detect2.py)"""
+    parts = (value or '')[:10].split('-')
+    return f"{parts[2]}/{parts[1]}/{parts[0]}" if len(parts) == 3 else None
+
+def references(descriptions):
+    """Pedidos (10 dígitos) y expedientes (8 dígitos) en las descripciones de los conceptos"""
+    orders, expedientes = [], []
+    for text in descriptions:
+        numbers = PEDIDO_NUMBER.findall(text) + EXPEDIENTE_NUMBER.findall(text)
+        numbers += [SEPARATORS.sub('', match) for match in SEPARATED_NUMBER.findall(text)]
+        for number in numbers:
+            if len(number) == 10 and number not in orders:
+                orders.append(number)
+            elif len(number) == 8 and number != CLAVE_ARRASTRE and number not in expedientes:
+                expedientes.append(number)
+    return orders, expedientes
+
+def analyze_invoice(source):
+    """
+    Lee un CFDI (ruta, bytes o BytesIO) y devuelve el mismo diccionario que analyze_invoice
+    de detect.py y detect2.py, más los totales en centavos y el UUID del timbre. Cada nodo se
+    descarta al cerrarse, así que la memoria no depende del número de conceptos.
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    comprobante = None
+    descriptions = []
+    impuesto = None
+    uuid = None
+    depth = 0
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        if event == 'end':
+            depth -= 1
+            elem.clear()
+            continue
+        depth += 1
+        tag = local_name(elem.tag)
+        if depth == 1:
+            if tag != 'Comprobante':
+                raise ValueError(f"no es un CFDI (el nodo principal es {tag})")
+            comprobante = dict(elem.attrib)
+            serie, folio = attribute(elem, 'Serie') or '', attribute(elem, 'Folio') or ''
+            fecha = emission_date(attribute(elem, 'Fecha'))
+            subtotal, total = attribute(elem, 'SubTotal'), attribute(elem, 'Total')
+        elif tag == 'Concepto':
+            descriptions.append(attribute(elem, 'Descripcion') or '')
+        elif tag == 'Impuestos' and depth == 2:
+            # Solo los del comprobante; cada concepto trae además los suyos
+            impuesto = elem.get('TotalImpuestosTrasladados') or elem.get('totalImpuestosTrasladados')
+        elif tag == 'TimbreFiscalDigital':
+            uuid = elem.get('UUID')
+    if comprobante is None:
+        raise ValueError("el XML está vacío")
+
+    orders, expedientes = references(descriptions)
+    return {
+        'layout': 'CFDI',
+        'folio': f"{serie}{folio}" or None,
+        'fecha': fecha,
+        'orders': orders,
+        'expedientes': expedientes,
+        'text': '\n'.join(descriptions),
+        'totals': {name: parse_cents(value) if value else None
+                   for name, value in (('subtotal', subtotal), ('impuesto', impuesto), ('total', total))},
+        'uuid': uuid,
+    }
+
+def for_invoice(name, xml):
+    """
+    Campos del CFDI que acompaña a una factura, o None si hay que analizar su PDF: el XML
+    no se puede leer, no es un CFDI o sus conceptos no traen pedidos ni expedientes
+    """
+    try:
+        result = analyze_invoice(xml)
+    except (ET.ParseError, ValueError, OSError) as e:
+        print(f"{name}: no se pudo leer su XML ({e}); se analiza el PDF")
+        return None
+    if not result['orders'] and not result['expedientes']:
+        print(f"{name}: los conceptos de su XML no traen pedidos ni expedientes; se analiza el PDF")
+        return None
+    print(f"{name}: leída de su XML (folio {result['folio']}, {len(result['orders'])} pedidos, "
+          f"{len(result['expedientes'])} expedientes)")
+    return result
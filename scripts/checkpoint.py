@@ -0,0 +1,61 @@
+import os
+import json
+import store
+
+# Cada cuántos documentos se guardan los resultados en el almacén y se registra el avance
+CHUNK_SIZE = 100
+
+def checkpoint_path(excel_path, stage):
+    """Archivo de avance de una etapa (extract, detect, detect2) junto a las particiones"""
+    return os.path.join(store.partition_dir(excel_path), f"avance_{stage}.jsonl")
+
+def load_checkpoint(path):
+    """
+    Documentos ya aplicados por una corrida interrumpida (una línea JSON por documento).
+    Si el proceso murió escribiendo, la última línea queda incompleta y se descarta.
+    """
+    entries = []
+    if not os.path.exists(path):
+        return entries
+    with open(path, encoding='utf-8') as f:
+        lines = f.readlines()
+    for line in lines:
+        try:
+            entries.append(json.loads(line))
+        except json.JSONDecodeError:
+            break
+    if len(entries) < len(lines):
+        _rewrite(path, entries)
+    if entries:
+        print(f"Reanudando corrida interrumpida: {len(entries)} documentos ya aplicados ({os.path.basename(path)})")
+    return entries
+
+def _rewrite(path, entries):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    os.replace(tmp_path, path)
+
+def append_checkpoint(path, entries):
+    """Registra los documentos de un bloque; se llama después de guardar sus resultados"""
+    if not entries:
+        return
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+def clear_checkpoint(path):
+    """La corrida terminó: la siguiente empieza desde cero"""
+    if os.path.exists(path):
+        os.remove(path)
+
+def seen_digests(entries):
+    """Huellas de los documentos ya aplicados, en el formato de inputs.unique_documents"""
+    return {entry['huella']: entry['documento'] for entry in entries if entry.get('huella')}
+
+def digests_by_name(seen):
+    return {name: digest for digest, name in seen.items()}
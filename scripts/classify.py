@@ -0,0 +1,107 @@
+import io
+import re
+from collections import Counter
+try:
+    import pypdfium2 as pdfium  # Se instala con pdfplumber; lee el texto sin análisis de diseño
+except ImportError:
+    pdfium = None
+import pdfplumber
+
+# Clasificación previa de cada PDF, antes de extraer el texto con pdfminer: con el encabezado
+# del archivo, sus metadatos, el número de páginas y el texto crudo de las primeras páginas se
+# decide qué analizador le corresponde. Los archivos dañados o escaneados (sin texto) se
+# reportan sin pagar la extracción completa.
+PEDIDO = 'pedido'
+FACTURA_A = 'factura_a'  # Formato de detect.py (SERIE: / FOLIO:)
+FACTURA_B = 'factura_b'  # Formato de detect2.py (Folio A... / Fecha emisión)
+IMAGEN = 'imagen'
+CORRUPTO = 'corrupto'
+DESCONOCIDO = 'desconocido'  # Con texto pero sin marcas conocidas: pasa por todos los analizadores
+
+DESCRIPCIONES = {
+    PEDIDO: 'pedido de compra',
+    FACTURA_A: 'factura (formato detect.py)',
+    FACTURA_B: 'factura (formato detect2.py)',
+    IMAGEN: 'PDF sin texto (escaneado o imagen)',
+    CORRUPTO: 'archivo dañado o que no es PDF',
+    DESCONOCIDO: 'sin formato reconocido',
+}
+
+HEADER_BYTES = 1024  # El encabezado %PDF- puede venir después de algunos bytes de basura
+PROBE_PAGES = 2  # Páginas cuyo texto crudo se revisa
+PEDIDO_MARK = re.compile(r'Pedido de compra:')
+FACTURA_A_MARKS = (re.compile(r'SERIE:\s*[A-Za-z]'), re.compile(r'FOLIO:\s*\d+'))
+FACTURA_B_MARK = re.compile(r'Folio\s+A\d+')
+
+class Rejected(Exception):
+    """Documento que la clasificación previa descarta para esta etapa"""
+    def __init__(self, clase, detalle):
+        super().__init__(f"clasificado como {describe(clase, detalle)}")
+        self.clase = clase
+
+def describe(clase, detalle):
+    return f"{DESCRIPCIONES[clase]} ({detalle})"
+
+def classify_text(text):
+    """Clase de un documento con texto según las marcas que buscan los analizadores"""
+    if FACTURA_B_MARK.search(text):
+        return FACTURA_B
+    if all(mark.search(text) for mark in FACTURA_A_MARKS):
+        return FACTURA_A
+    if PEDIDO_MARK.search(text):
+        return PEDIDO
+    return DESCONOCIDO
+
+def probe(data):
+    """(número de páginas, metadatos, texto crudo de las primeras páginas) de un PDF en bytes"""
+    if pdfium is not None:
+        pdf = pdfium.PdfDocument(data)
+        try:
+            texts = []
+            for i in range(min(PROBE_PAGES, len(pdf))):
+                page = pdf[i]
+                textpage = page.get_textpage()
+                texts.append(textpage.get_text_range())
+                textpage.close()
+                page.close()
+            return len(pdf), pdf.get_metadata_dict(), '\n'.join(texts)
+        finally:
+            pdf.close()
+    # Sin pypdfium2 el texto se extrae con pdfplumber, solo de las primeras páginas
+    with pdfplumber.open(io.BytesIO(data)) as pdf:
+        pages = pdf.pages
+        return len(pages), pdf.metadata, '\n'.join(page.extract_text() or '' for page in pages[:PROBE_PAGES])
+
+def classify(source):
+    """Clasifica un documento (BytesIO o ruta) y devuelve (clase, detalle del motivo)"""
+    try:
+        if isinstance(source, io.BytesIO):
+            data = source.getvalue()
+        else:
+            with open(source, 'rb') as f:
+                data = f.read()
+    except OSError as e:
+        return CORRUPTO, f"no se pudo leer: {e}"
+    if b'%PDF-' not in data[:HEADER_BYTES]:
+        return CORRUPTO, "no tiene encabezado %PDF-"
+    try:
+        num_pages, metadata, text = probe(data)
+    except Exception as e:
+        return CORRUPTO, f"no se pudo abrir el PDF: {e}"
+    if num_pages == 0:
+        return CORRUPTO, "el PDF no tiene páginas"
+    paginas = f"{num_pages} página" + ("s" if num_pages != 1 else "")
+    if not text.strip():
+        productor = (metadata or {}).get('Producer') or (metadata or {}).get('Creator')
+        return IMAGEN, f"{paginas}, sin texto al inicio" + (f", generado por {productor}" if productor else "")
+    return classify_text(text), paginas
+
+def report_lines(classes):
+    """Líneas para el log con cuántos documentos hubo de cada clase"""
+    if not classes:
+        return []
+    counts = Counter(classes.values())
+    lines = ["\nClasificación previa de los documentos:"]
+    for clase, count in counts.most_common():
+        lines.append(f"- {DESCRIPCIONES[clase]}: {count}")
+    return lines
@@ -0,0 +1,100 @@
+from functools import lru_cache
+import pandas as pd
+
+# Diccionario de meses en español (abreviaturas de 3 y 4 letras y nombres completos)
+MESES = {
+    'ene': '01', 'enero': '01',
+    'feb': '02', 'febrero': '02',
+    'mar': '03', 'marzo': '03',
+    'abr': '04', 'abril': '04',
+    'may': '05', 'mayo': '05',
+    'jun': '06', 'junio': '06',
+    'jul': '07', 'julio': '07',
+    'ago': '08', 'agosto': '08',
+    'sep': '09', 'sept': '09', 'septiembre': '09', 'set': '09', 'setiembre': '09',
+    'oct': '10', 'octubre': '10',
+    'nov': '11', 'noviembre': '11',
+    'dic': '12', 'diciembre': '12',
+}
+
+# Palabras que marcan la columna "Fecha para la que se requiere" en los pedidos
+FECHA_KEYWORDS = ["Fecha para la que se", "Cant.", "(Unidad)", "requiere"]
+
+FORMATO_FECHA = "%d/%m/%Y"
+
+def month_number(token):
+    """
+    Devuelve el número de mes ('01'..'12') para un token como 'oct', 'Sept.' o 'octubre',
+    o None si el token no es un mes
+    """
+    token = token.lower().strip('.,')
+    if token in MESES:
+        return MESES[token]
+    return MESES.get(token[:3])
+
+def is_month(word):
+    """Indica si una palabra suelta es exactamente un mes (sin aceptar prefijos)"""
+    return word.lower().strip('.,') in MESES
+
+@lru_cache(maxsize=4096)
+def parse_date(date_str):
+    """
+    Convierte una fecha en formato '8 oct 2024' a 'DD/MM/AAAA'.
+    El resultado se memoiza: en un lote sólo hay unas pocas fechas distintas.
+    """
+    parts = date_str.lower().split()
+    if len(parts) < 3:
+        return None
+
+    # Buscar el mes primero; el día va antes y el año después
+    mes_idx = next((i for i, part in enumerate(parts) if month_number(part)), -1)
+    if mes_idx == -1:
+        return None
+    mes = month_number(parts[mes_idx])
+
+    dia = parts[mes_idx - 1] if mes_idx > 0 else parts[0]
+    dia = ''.join(c for c in dia if c.isdigit()).zfill(2)
+    año = parts[mes_idx + 1] if mes_idx < len(parts) - 1 else parts[-1]
+    año = ''.join(c for c in año if c.isdigit())
+
+    if dia and año and len(año) == 4:
+        return f"{dia}/{mes}/{año}"
+    return None
+
+def find_required_date(lines):
+    """
+    Busca la fecha requerida en las líneas de una página: por cada línea con palabras
+    clave de la columna de fecha, revisa esa línea y las dos siguientes
+    """
+    for i, line in enumerate(lines):
+        if not any(keyword in line for keyword in FECHA_KEYWORDS):
+            continue
+        for current_line in lines[i:i + 3]:
+            words = current_line.split()
+            for k, word in enumerate(words):
+                if is_month(word):
+                    # Ventana con el día y el año alrededor del mes
+                    potential_date = ' '.join(words[max(0, k - 1):k + 2])
+                    parsed_date = parse_date(potential_date)
+                    if parsed_date:
+                        return parsed_date
+    return None
+
+def to_datetime_column(serie, formato=FORMATO_FECHA):
+    """
+    Convierte una columna completa a datetime64 en una sola pasada vectorizada.
+    Acepta textos 'DD/MM/AAAA' y valores que ya son fechas; lo demás queda como NaT.
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    if pd.api.types.is_string_dtype(serie) and serie.dtype != object:
+        # Columnas de texto 'str'/'string' (las de pandas 3 al leer un Excel): se tratan como object
+        serie = serie.astype(object).where(serie.notna(), None)
+    elif serie.dtype != object:
+        return pd.Series(pd.NaT, index=serie.index, dtype='datetime64[ns]')
+
+    es_texto = serie.str.len().notna()
+    con_barra = serie.str.contains('/', na=False, regex=False)
+    fechas = pd.to_datetime(serie.where(con_barra), format=formato, errors='coerce')
+    ya_fechas = pd.to_datetime(serie.where(~es_texto), errors='coerce')
+    return fechas.where(con_barra, ya_fechas)
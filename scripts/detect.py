@@ -1,9 +1,18 @@
-import pdfplumber
 import os
 import re
 import argparse
-import pandas as pd
 import time
+import inputs
+import store
+import schema
+import checkpoint
+import pipeline
+import classify
+import quarantine
+import scheduler
+import textindex
+import keyindex
+from money import invoice_totals
 
 def clean_text(text):
     """Limpia el texto eliminando espacios extras y caracteres especiales"""
@@ -39,236 +48,343 @@ def is_valid_context(line, number, context_keywords):
             
     return False
 
-def extract_order_from_invoice(pdf_folder, log_file):
+# Palabras clave expandidas para contexto
+PEDIDO_KEYWORDS = [
+    "PEDIDO", "ORDEN", "COMPRA", "SERVICIO", "REFERENCIA",
+    "PED", "OC", "O C", "NUM", "NUMERO", "NO", "Nº",
+    "REALIZADO", "SERVICIO REALIZADO", "MUERTO", "ARRASTRE",
+    "GRUA", "FACTURA", "REMISION"
+]
+
+EXPEDIENTE_KEYWORDS = [
+    "EXPEDIENTE", "ARRASTRE", "GRUA", "EXP", "EXPTE",
+    "SINIESTRO", "SERVICIO", "NUM", "NUMERO", "NO", "Nº"
+]
+
+def analyze_invoice(page_texts):
+    """
+    Analiza el texto de una factura (una cadena por página) y devuelve los pedidos,
+    expedientes y el número de factura (SERIE + FOLIO) encontrados
+    """
+    full_text = ""
+    current_orders = []
+    current_expedientes = []
+    invoice_number = None
+    
+    # Buscar SERIE y FOLIO al inicio del documento
+    first_page_text = page_texts[0] if page_texts else ""
+    serie_match = re.search(r'SERIE:\s*([A-Za-z])', first_page_text)
+    folio_match = re.search(r'FOLIO:\s*(\d+)', first_page_text)
+    
+    if serie_match and folio_match:
+        serie = serie_match.group(1)
+        folio = folio_match.group(1)
+        invoice_number = f"{serie}{folio}"
+    
+    for text in page_texts:
+        if not text:
+            continue
+            
+        full_text += text + "\n"
+
+        lines = text.split('\n')
+        in_description_section = False
+        for line in lines:
+            # Detectar si estamos en la sección de DESCRIPCIÓN
+            if 'DESCRIPCIÓN' in line.upper():
+                in_description_section = True
+                continue
+            
+            # Si estamos en la sección de DESCRIPCIÓN y encontramos una línea que contiene 
+            # IMPUESTOS FEDERALES, salimos de la sección
+            if in_description_section and 'IMPUESTOS FEDERALES' in line.upper():
+                in_description_section = False
+                continue
+            
+            # Solo procesar líneas dentro de la sección de DESCRIPCIÓN
+            if in_description_section:
+                # Buscar números de 10 dígitos (pedidos)
+                pedidos = re.finditer(r'\b\d{10}\b', line)
+                for match in pedidos:
+                    order_number = match.group()
+                    current_orders.append(order_number)
+                    print(f"Pedido detectado en DESCRIPCIÓN: {order_number} en: {line.strip()}")
+                
+                # Buscar números de 8 dígitos (expedientes)
+                expedientes = re.finditer(r'\b\d{8}\b', line)
+                for match in expedientes:
+                    expediente = match.group()
+                    current_expedientes.append(expediente)
+                    print(f"Expediente detectado en DESCRIPCIÓN: {expediente} en: {line.strip()}")
+                    
+                # Buscar números que puedan estar separados
+                separated_numbers = re.finditer(r'\b\d{4}[\s\.\-_]\d{4,6}\b', line)
+                for match in separated_numbers:
+                    number = re.sub(r'[\s\.\-_]', '', match.group())
+                    if len(number) == 10:
+                        current_orders.append(number)
+                        print(f"Pedido detectado (formato separado) en DESCRIPCIÓN: {number} en: {line.strip()}")
+                    elif len(number) == 8:
+                        current_expedientes.append(number)
+                        print(f"Expediente detectado (formato separado) en DESCRIPCIÓN: {number} en: {line.strip()}")
+
+            # Finalmente, buscar números de 10 dígitos con contexto general
+            pedidos = re.finditer(r'\b\d{10}\b', line)
+            for match in pedidos:
+                order_number = match.group()
+                if is_valid_context(line, order_number, PEDIDO_KEYWORDS):
+                    current_orders.append(order_number)
+                    print(f"Pedido detectado: {order_number} en: {line.strip()}")
+            
+            # Buscar expedientes (8 dígitos)
+            expedientes = re.finditer(r'\b\d{8}\b', line)
+            for match in expedientes:
+                expediente = match.group()
+                if is_valid_context(line, expediente, EXPEDIENTE_KEYWORDS):
+                    current_expedientes.append(expediente)
+                    print(f"Expediente detectado: {expediente} en: {line.strip()}")
+            
+            # Buscar números que puedan estar separados por espacios o caracteres
+            # Por ejemplo: "1234 5678" o "1234.5678"
+            separated_numbers = re.finditer(r'\b\d{4}[\s\.\-_]\d{4,6}\b', line)
+            for match in separated_numbers:
+                number = re.sub(r'[\s\.\-_]', '', match.group())
+                if len(number) == 10 and is_valid_context(line, match.group(), PEDIDO_KEYWORDS):
+                    current_orders.append(number)
+                    print(f"Pedido detectado (formato separado): {number} en: {line.strip()}")
+                elif len(number) == 8 and is_valid_context(line, match.group(), EXPEDIENTE_KEYWORDS):
+                    current_expedientes.append(number)
+                    print(f"Expediente detectado (formato separado): {number} en: {line.strip()}")
+
+    return {
+        'layout': 'A',
+        'folio': invoice_number,
+        'fecha': None,
+        'orders': current_orders,
+        'expedientes': current_expedientes,
+        'text': full_text
+    }
+
+def collect_references(entries):
+    """Junta los pedidos/expedientes de varias facturas y el folio de cada uno (la última factura gana)"""
     orders_detected = []
     expedientes_detected = []
     invoice_numbers = {}  # Diccionario para almacenar número de factura por pedido/expediente
-    invalid_pdfs = []
-    total_processed = 0
-    pdf_files = [f for f in os.listdir(pdf_folder) if f.lower().endswith('.pdf')]
-    
-    # Palabras clave expandidas para contexto
-    pedido_keywords = [
-        "PEDIDO", "ORDEN", "COMPRA", "SERVICIO", "REFERENCIA",
-        "PED", "OC", "O C", "NUM", "NUMERO", "NO", "Nº",
-        "REALIZADO", "SERVICIO REALIZADO", "MUERTO", "ARRASTRE",
-        "GRUA", "FACTURA", "REMISION"
-    ]
-    
-    expediente_keywords = [
-        "EXPEDIENTE", "ARRASTRE", "GRUA", "EXP", "EXPTE",
-        "SINIESTRO", "SERVICIO", "NUM", "NUMERO", "NO", "Nº"
-    ]
+    for entry in entries:
+        for order in entry['orders']:
+            orders_detected.append(order)
+            if entry['folio']:
+                invoice_numbers[order] = entry['folio']
+        for expediente in entry['expedientes']:
+            expedientes_detected.append(expediente)
+            if entry['folio']:
+                invoice_numbers[expediente] = entry['folio']
+    return list(set(orders_detected)), list(set(expedientes_detected)), invoice_numbers
+
+def write_unmatched(log, entry):
+    log.write(f"\n=== {entry['documento']} ===\n")
+    log.write(entry['detalle'])
+    log.write("-" * 50 + "\n")
+
+def apply_chunk(excel_path, checkpoint_file, chunk, seen, texts=None):
+    """
+    Actualiza el Excel con las referencias de un bloque de facturas, indexa su texto
+    ({nombre: (formato, texto)}, ver textindex.py), registra lo leído de cada factura para
+    la conciliación (ver keyindex.record_invoices) y después registra su avance
+    """
+    orders, expedientes, invoice_numbers = collect_references(chunk)
+    if orders or expedientes:
+        update_excel_with_status(excel_path, orders, expedientes, invoice_numbers)
+    digests = checkpoint.digests_by_name(seen)
+    for entry in chunk:
+        entry['huella'] = digests.get(entry['documento'])
+    texts = texts or {}
+    textindex.add_documents(excel_path, [
+        (entry['huella'], entry['documento'], 'detect', texts[entry['documento']][0], entry['folio'],
+         texts[entry['documento']][1])
+        for entry in chunk if entry['documento'] in texts])
+    keyindex.record_invoices(excel_path, 'detect', chunk)
+    checkpoint.append_checkpoint(checkpoint_file, chunk)
+    print(f"Avance guardado: {len(chunk)} facturas")
+    return chunk
+
+def extract_order_from_invoice(pdf_folder, log_file, excel_path, processed_archives=None,
+                               chunk_size=checkpoint.CHUNK_SIZE, workers=1,
+                               memory_limit=None, budget=None):
+    """
+    Detecta las referencias de cada factura y actualiza el Excel por bloques de chunk_size
+    facturas. Si una corrida anterior se interrumpió, continúa desde su último bloque guardado.
+    """
+    checkpoint_file = checkpoint.checkpoint_path(excel_path, 'detect')
+    completed = checkpoint.load_checkpoint(checkpoint_file)
+    seen = checkpoint.seen_digests(completed)
+    chunk = []
+    # La entrada puede ser una carpeta con PDFs y/o lotes ZIP/TAR, o un lote directamente
+    pdf_paths, archives = inputs.discover(pdf_folder, processed_archives)
+    failed_archives = []
+    aliases = {}  # Copias idénticas de una misma factura: se procesa solo la primera
 
     with open(log_file, 'w', encoding='utf-8') as log:
         log.write("=== REPORTE DE PROCESAMIENTO DE FACTURAS ===\n\n")
         log.write("1. ARCHIVOS SIN REFERENCIAS ENCONTRADAS\n")
         log.write("==========================================\n")
+        for entry in completed:
+            if entry['detalle']:
+                write_unmatched(log, entry)
         
-        for pdf_file in pdf_files:
-            pdf_path = os.path.join(pdf_folder, pdf_file)
+        # El texto de las siguientes facturas se extrae en otros procesos mientras se analiza y guarda.
+        # Antes se clasifica cada PDF: las facturas del otro formato se omiten y los pedidos,
+        # escaneados y dañados se reportan sin extraer su texto. Una factura que pasa su tiempo
+        # límite queda en cuarentena sin detener el lote. Las facturas con su XML timbrado (CFDI)
+        # al lado se leen de él, sin extraer el texto del PDF
+        classes = {}
+        cfdis = {}
+        chunk_texts = {}  # Formato y texto de cada factura del bloque para el índice de texto
+        quarantined = quarantine.load(excel_path, 'detect')
+        documents = pipeline.stream_documents(pdf_paths, archives, failed_archives, aliases, seen, workers,
+                                              memory_limit, accept={classify.FACTURA_A}, skip={classify.FACTURA_B},
+                                              classes=classes, budget=budget, quarantined=quarantined,
+                                              cfdis=cfdis)
+        for pdf_file, pdf_path, page_texts, error in documents:
+            entry = {'documento': pdf_file, 'formato': None, 'folio': None, 'totales': None, 'orders': [],
+                     'expedientes': [], 'detalle': None, 'xml': False}
             try:
                 print(f"Procesando factura: {pdf_file}")
+                if error:
+                    raise error
                 
-                with pdfplumber.open(pdf_path) as pdf:
-                    full_text = ""
-                    current_orders = []
-                    current_expedientes = []
-                    has_description_section = False
-                    invoice_number = None
-                    
-                    # Buscar SERIE y FOLIO al inicio del documento
-                    first_page_text = pdf.pages[0].extract_text()
-                    serie_match = re.search(r'SERIE:\s*([A-Za-z])', first_page_text)
-                    folio_match = re.search(r'FOLIO:\s*(\d+)', first_page_text)
-                    
-                    if serie_match and folio_match:
-                        serie = serie_match.group(1)
-                        folio = folio_match.group(1)
-                        invoice_number = f"{serie}{folio}"
-                    
-                    for page in pdf.pages:
-                        text = page.extract_text()
-                        if not text:
-                            continue
-                            
-                        full_text += text + "\n"
-                        
-                        # Verificar si tiene sección de DESCRIPCIÓN
-                        if 'DESCRIPCIÓN' in text.upper():
-                            has_description_section = True
-
-                        lines = text.split('\n')
-                        in_description_section = False
-                        for line in lines:
-                            # Detectar si estamos en la sección de DESCRIPCIÓN
-                            if 'DESCRIPCIÓN' in line.upper():
-                                in_description_section = True
-                                continue
-                            
-                            # Si estamos en la sección de DESCRIPCIÓN y encontramos una línea que contiene 
-                            # IMPUESTOS FEDERALES, salimos de la sección
-                            if in_description_section and 'IMPUESTOS FEDERALES' in line.upper():
-                                in_description_section = False
-                                continue
-                            
-                            # Solo procesar líneas dentro de la sección de DESCRIPCIÓN
-                            if in_description_section:
-                                # Buscar números de 10 dígitos (pedidos)
-                                pedidos = re.finditer(r'\b\d{10}\b', line)
-                                for match in pedidos:
-                                    order_number = match.group()
-                                    current_orders.append(order_number)
-                                    print(f"Pedido detectado en DESCRIPCIÓN: {order_number} en: {line.strip()}")
-                                
-                                # Buscar números de 8 dígitos (expedientes)
-                                expedientes = re.finditer(r'\b\d{8}\b', line)
-                                for match in expedientes:
-                                    expediente = match.group()
-                                    current_expedientes.append(expediente)
-                                    print(f"Expediente detectado en DESCRIPCIÓN: {expediente} en: {line.strip()}")
-                                    
-                                # Buscar números que puedan estar separados
-                                separated_numbers = re.finditer(r'\b\d{4}[\s\.\-_]\d{4,6}\b', line)
-                                for match in separated_numbers:
-                                    number = re.sub(r'[\s\.\-_]', '', match.group())
-                                    if len(number) == 10:
-                                        current_orders.append(number)
-                                        print(f"Pedido detectado (formato separado) en DESCRIPCIÓN: {number} en: {line.strip()}")
-                                    elif len(number) == 8:
-                                        current_expedientes.append(number)
-                                        print(f"Expediente detectado (formato separado) en DESCRIPCIÓN: {number} en: {line.strip()}")
-
-                            # Finalmente, buscar números de 10 dígitos con contexto general
-                            pedidos = re.finditer(r'\b\d{10}\b', line)
-                            for match in pedidos:
-                                order_number = match.group()
-                                if is_valid_context(line, order_number, pedido_keywords):
-                                    current_orders.append(order_number)
-                                    print(f"Pedido detectado: {order_number} en: {line.strip()}")
-                            
-                            # Buscar expedientes (8 dígitos)
-                            expedientes = re.finditer(r'\b\d{8}\b', line)
-                            for match in expedientes:
-                                expediente = match.group()
-                                if is_valid_context(line, expediente, expediente_keywords):
-                                    current_expedientes.append(expediente)
-                                    print(f"Expediente detectado: {expediente} en: {line.strip()}")
-                            
-                            # Buscar números que puedan estar separados por espacios o caracteres
-                            # Por ejemplo: "1234 5678" o "1234.5678"
-                            separated_numbers = re.finditer(r'\b\d{4}[\s\.\-_]\d{4,6}\b', line)
-                            for match in separated_numbers:
-                                number = re.sub(r'[\s\.\-_]', '', match.group())
-                                if len(number) == 10 and is_valid_context(line, match.group(), pedido_keywords):
-                                    current_orders.append(number)
-                                    print(f"Pedido detectado (formato separado): {number} en: {line.strip()}")
-                                elif len(number) == 8 and is_valid_context(line, match.group(), expediente_keywords):
-                                    current_expedientes.append(number)
-                                    print(f"Expediente detectado (formato separado): {number} en: {line.strip()}")
-
-                    # Solo incrementar total_processed si encontramos referencias válidas
-                    if current_orders or current_expedientes:
-                        if current_orders:
-                            for order in current_orders:
-                                orders_detected.append(order)
-                                if invoice_number:
-                                    invoice_numbers[order] = invoice_number
-                        if current_expedientes:
-                            for expediente in current_expedientes:
-                                expedientes_detected.append(expediente)
-                                if invoice_number:
-                                    invoice_numbers[expediente] = invoice_number
-                        total_processed += 1
-                    else:
-                        invalid_pdfs.append(pdf_file)
-                        log.write(f"\n=== {pdf_file} ===\n")
-                        log.write("Primeras 10 líneas del contenido:\n")
-                        preview_lines = full_text.split('\n')[:10]
-                        for line in preview_lines:
-                            log.write(f"{line}\n")
-                        log.write("-" * 50 + "\n")
+                result = cfdis.pop(pdf_file, None)
+                entry['xml'] = result is not None
+                if result is None:
+                    result = analyze_invoice(page_texts)
+                chunk_texts[pdf_file] = (result['layout'], result['text'])
+                entry['formato'] = result['layout']
+                entry['folio'] = result['folio']
+                entry['totales'] = invoice_totals(result)
+                entry['orders'] = result['orders']
+                entry['expedientes'] = result['expedientes']
+
+                # Sin referencias válidas el archivo se lista para revisión
+                if not result['orders'] and not result['expedientes']:
+                    preview_lines = result['text'].split('\n')[:10]
+                    entry['detalle'] = "Primeras 10 líneas del contenido:\n" + "".join(f"{line}\n" for line in preview_lines)
                         
             except Exception as e:
-                invalid_pdfs.append(pdf_file)
-                log.write(f"\n=== {pdf_file} ===\n")
-                log.write(f"Error al procesar el archivo: {str(e)}\n")
-                log.write("-" * 50 + "\n")
+                entry['detalle'] = f"Error al procesar el archivo: {str(e)}\n"
+            if entry['detalle']:
+                write_unmatched(log, entry)
+
+            chunk.append(entry)
+            if len(chunk) >= chunk_size:
+                completed.extend(apply_chunk(excel_path, checkpoint_file, chunk, seen, chunk_texts))
+                chunk = []
+                chunk_texts = {}
+        if chunk:
+            completed.extend(apply_chunk(excel_path, checkpoint_file, chunk, seen, chunk_texts))
+        quarantine.save(excel_path, 'detect', quarantined)
+
+        invalid_pdfs = [entry['documento'] for entry in completed if entry['detalle']]
+        total_processed = len(completed) - len(invalid_pdfs)
 
         # Resumen final
         log.write("\n\n=== RESUMEN ===\n")
-        log.write(f"Total de PDFs encontrados: {len(pdf_files)}\n")
+        log.write(f"Total de PDFs encontrados: {len(completed) + sum(len(v) for v in aliases.values())}\n")
+        log.write(f"PDFs únicos (sin copias idénticas): {len(completed)}\n")
         log.write(f"PDFs procesados exitosamente: {total_processed}\n")
         log.write(f"PDFs sin referencias encontradas: {len(invalid_pdfs)}\n")
+        log.write(f"Facturas leídas de su XML (CFDI): {sum(1 for entry in completed if entry.get('xml'))}\n")
         log.write("\nLista de archivos a revisar:\n")
         for pdf in invalid_pdfs:
             log.write(f"- {pdf}\n")
+        for line in inputs.alias_report_lines(aliases):
+            log.write(f"{line}\n")
+        for line in classify.report_lines(classes) + quarantine.report_lines(quarantined):
+            log.write(f"{line}\n")
     
-    return list(set(orders_detected)), list(set(expedientes_detected)), invoice_numbers
+    orders_detected, expedientes_detected, invoice_numbers = collect_references(completed)
+    checkpoint.clear_checkpoint(checkpoint_file)
+    # Lotes completos y PDFs sueltos con referencias (estos últimos solo para poder archivarlos)
+    ok_names = [entry['documento'] for entry in completed if not entry['detalle']]
+    ok_names += [name for name, clase in classes.items() if clase == classify.FACTURA_B]  # Las procesa la otra etapa
+    completed_archives = [a for a in archives if a not in failed_archives] + inputs.completed_pdfs(pdf_paths, ok_names, aliases)
+    return orders_detected, expedientes_detected, invoice_numbers, completed_archives
+
+def rows_to_update(df, orders_detected, expedientes_detected, invoice_numbers):
+    """
+    Marca las filas cuyo estatus cambia: por pedido, o por expediente si el pedido no está
+    entre los detectados. Devuelve (por_pedido, por_expediente, factura de cada fila).
+    """
+    pedidos = df['Numero de Pedido']
+    expedientes = df['Nº de pieza']
+    por_pedido = pedidos.isin(set(orders_detected)).fillna(False).astype(bool)
+    por_expediente = ~por_pedido & expedientes.isin(set(expedientes_detected)).fillna(False).astype(bool)
+    folios = {schema.to_key(ref): folio for ref, folio in invoice_numbers.items()}
+    factura = pedidos.where(por_pedido, expedientes).map(folios).astype('string').fillna('')
+
+    # Si ya está facturado, solo se actualiza cuando llega un folio distinto
+    status = df['Status'].astype('string').fillna('') if 'Status' in df.columns else ''
+    no_factura = df['No factura'].fillna('') if 'No factura' in df.columns else ''
+    cambia_factura = (no_factura != factura) & (factura != '')
+    por_pedido &= (status != 'FACTURADO') | cambia_factura
+    por_expediente &= (status != 'FACTURADO POR EXPEDIENTE') | cambia_factura
+    return por_pedido, por_expediente, factura
 
 def update_excel_with_status(excel_path, orders_detected, expedientes_detected, invoice_numbers):
     try:
         print("Iniciando actualización del Excel...")
-        # Leer el archivo Excel
-        df = pd.read_excel(excel_path)
-        print(f"Excel leído correctamente. Columnas actuales: {df.columns.tolist()}")
-        
-        # Crear las columnas si no existen, pero NO resetear valores existentes
-        if 'Status' not in df.columns:
-            df['Status'] = 'NO FACTURADO'
-        if 'No factura' not in df.columns:
-            df['No factura'] = ''
-        
-        print(f"Columnas después de verificar: {df.columns.tolist()}")
-        
-        # Asegurar que las columnas sean string y limpiar espacios
-        df['Numero de Pedido'] = df['Numero de Pedido'].astype(str).str.strip()
-        df['Nº de pieza'] = df['Nº de pieza'].astype(str).str.strip()
-        
-        # Limpiar números de pedido detectados
-        orders_detected = [str(order).strip() for order in orders_detected]
-        expedientes_detected = [str(exp).strip() for exp in expedientes_detected]
-        
+        # Las claves del Excel son enteras (ver schema.py)
+        orders_detected = [key for key in map(schema.to_key, orders_detected) if key is not None]
+        expedientes_detected = [key for key in map(schema.to_key, expedientes_detected) if key is not None]
         print(f"Procesando {len(orders_detected)} pedidos y {len(expedientes_detected)} expedientes")
-        
-        # Actualizar solo los registros encontrados en los PDFs actuales
-        actualizados = 0
-        for index, row in df.iterrows():
-            pedido = str(row['Numero de Pedido']).strip()
-            expediente = str(row['Nº de pieza']).strip()
-            
-            # Solo actualizar si el registro está en los detectados actualmente
-            if pedido in orders_detected:
-                # Si ya está facturado, verificar si es la misma factura
-                current_factura = invoice_numbers.get(pedido, '')
-                if row['Status'] != 'FACTURADO' or (row['No factura'] != current_factura and current_factura != ''):
-                    df.at[index, 'Status'] = 'FACTURADO'
-                    df.at[index, 'No factura'] = current_factura
-                    actualizados += 1
-                    print(f"Actualizando pedido {pedido} con factura {current_factura}")
-                    
-            elif expediente in expedientes_detected:
-                # Si ya está facturado por expediente, verificar si es la misma factura
-                current_factura = invoice_numbers.get(expediente, '')
-                if row['Status'] != 'FACTURADO POR EXPEDIENTE' or (row['No factura'] != current_factura and current_factura != ''):
-                    df.at[index, 'Status'] = 'FACTURADO POR EXPEDIENTE'
-                    df.at[index, 'No factura'] = current_factura
-                    actualizados += 1
-                    print(f"Actualizando expediente {expediente} con factura {current_factura}")
-            
-            # Si no está en los detectados, mantener su estado actual
-        
-        print(f"Total de registros actualizados: {actualizados}")
-        
-        # Guardar el Excel con las modificaciones
-        df.to_excel(excel_path, index=False)
-        print(f"Excel guardado exitosamente en: {excel_path}")
-        
-        # Verificar que los cambios se guardaron
-        df_verification = pd.read_excel(excel_path)
-        print(f"Verificación - Columnas en el archivo guardado: {df_verification.columns.tolist()}")
+
+        # Las filas se leen, actualizan y guardan con el almacén bloqueado: si otro proceso
+        # guardó mientras se analizaban las facturas, el cambio se aplica sobre su versión
+        with store.locked(excel_path):
+            # Buscar las filas a actualizar leyendo solo las columnas clave y de estatus
+            # de las particiones que contienen los pedidos/expedientes detectados
+            store_index = store.load_index(excel_path)
+            partitions = store.partitions_for(store_index, orders_detected, expedientes_detected)
+            if not partitions:
+                print("Ningún pedido o expediente detectado existe en el Excel; no hay nada que actualizar.")
+                return
+            keys = store.load_partitions(excel_path, partitions, store.KEY_COLUMNS + ['Status', 'No factura'])
+            por_pedido, por_expediente, _ = rows_to_update(keys, orders_detected, expedientes_detected, invoice_numbers)
+            changed = sorted(keys.loc[por_pedido | por_expediente, store.PARTITION_COLUMN].unique())
+            if not changed:
+                print("Los registros detectados ya tenían su estatus y factura; no hay nada que actualizar.")
+                return
+
+            # Solo las particiones con cambios se cargan completas y se reescriben
+            df = store.load_partitions(excel_path, changed)
+            print(f"Particiones con cambios: {', '.join(changed)}. Columnas actuales: {df.columns.tolist()}")
+
+            # Crear las columnas si no existen, pero NO resetear valores existentes
+            if 'Status' not in df.columns:
+                df['Status'] = 'NO FACTURADO'
+            if 'No factura' not in df.columns:
+                df['No factura'] = None
+            schema.apply(df)  # Las columnas nuevas toman su tipo (Status categórica con sus valores)
+
+            # Actualizar solo los registros encontrados en los PDFs actuales
+            por_pedido, por_expediente, factura = rows_to_update(df, orders_detected, expedientes_detected, invoice_numbers)
+            df.loc[por_pedido, 'Status'] = 'FACTURADO'
+            df.loc[por_expediente, 'Status'] = 'FACTURADO POR EXPEDIENTE'
+            df.loc[por_pedido | por_expediente, 'No factura'] = factura[por_pedido | por_expediente]
+            for pedido, folio in df.loc[por_pedido, ['Numero de Pedido', 'No factura']].drop_duplicates().itertuples(index=False):
+                print(f"Actualizando pedido {pedido} con factura {folio}")
+            for expediente, folio in df.loc[por_expediente, ['Nº de pieza', 'No factura']].drop_duplicates().itertuples(index=False):
+                print(f"Actualizando expediente {expediente} con factura {folio}")
+            actualizados = int((por_pedido | por_expediente).sum())
+            print(f"Total de registros actualizados: {actualizados}")
+
+            # Guardar solo las particiones modificadas
+            store.save_partitions(excel_path, df, store_index)
+            print(f"Excel guardado exitosamente en: {store.partition_dir(excel_path)}/")
+
+        # Verificar que los cambios se guardaron (solo la columna de factura)
+        df_verification = store.load_partitions(excel_path, changed, ['No factura'])
         print(f"Verificación - Número de registros con factura: {df_verification['No factura'].notna().sum()}")
-        
+
     except Exception as e:
         print(f"Error al actualizar el Excel: {str(e)}")
         raise  # Re-lanzar la excepción para ver el stack trace completo
@@ -282,7 +398,7 @@ Ejemplo de uso:
     python scripts/detect.py PDF-FACTURAS output/data.xlsx --log_file output/log_facturas.txt
 
 Estructura de carpetas:
-    PDF-FACTURAS/     → Carpeta con las facturas a procesar
+    PDF-FACTURAS/     → Carpeta con las facturas a procesar (PDFs y/o lotes .zip/.tar)
     output/           → Carpeta donde se guardan los resultados
         data.xlsx     → Excel con los datos
         log_facturas.txt → Archivo de log del proceso
@@ -290,22 +406,40 @@ Estructura de carpetas:
     )
     
     parser.add_argument("facturas_folder", 
-                      help="Ruta de la carpeta PDF-FACTURAS que contiene los PDFs de facturas")
+                      help="Ruta de la carpeta PDF-FACTURAS (o lote ZIP/TAR) con los PDFs de facturas")
     parser.add_argument("excel_path", 
                       help="Ruta del archivo Excel (output/data.xlsx) que se actualizará")
     parser.add_argument("--log_file", 
                       default="output/log_facturas.txt", 
                       help="Ruta del archivo de logs (default: output/log_facturas.txt)")
+    parser.add_argument("--workers", type=int,
+                      help="Procesos para extraer el texto de las facturas (default: según núcleos y memoria disponibles)")
+    parser.add_argument("--memoria_max", type=int,
+                      help="Tope de memoria de la corrida en MB; cerca del tope no se envían más documentos a los procesos (default: 80%% de la memoria disponible)")
+    parser.add_argument("--limite_documento", type=int, default=pipeline.DOCUMENT_SECONDS,
+                      help=f"Segundos base que puede tardar una factura; al pasarlos se termina su proceso y queda en cuarentena (0 = sin límite; default: {pipeline.DOCUMENT_SECONDS})")
+    parser.add_argument("--limite_pagina", type=int, default=pipeline.PAGE_SECONDS,
+                      help=f"Segundos adicionales por cada página (default: {pipeline.PAGE_SECONDS})")
+    parser.add_argument("--bloque", type=int, default=checkpoint.CHUNK_SIZE,
+                      help=f"Facturas por bloque guardado; una corrida interrumpida continúa desde el último bloque (default: {checkpoint.CHUNK_SIZE})")
     args = parser.parse_args()
 
     print("\n=== Iniciando Procesamiento de Facturas ===")
     print(f"Carpeta de facturas: {args.facturas_folder}")
     print(f"Archivo Excel: {args.excel_path}")
     print(f"Archivo de log: {args.log_file}")
+    memory_limit = scheduler.memory_limit(args.memoria_max)
+    workers = args.workers or scheduler.auto_workers(memory_limit)
+    print(scheduler.describe(workers, memory_limit))
 
     os.makedirs(os.path.dirname(args.log_file), exist_ok=True)
 
-    orders_detected, expedientes_detected, invoice_numbers = extract_order_from_invoice(args.facturas_folder, args.log_file)
+    # Los lotes ya aplicados en corridas anteriores se reconocen por su huella y no se releen
+    registry = inputs.registry_path(args.excel_path)
+    # El Excel se actualiza por bloques durante la detección
+    orders_detected, expedientes_detected, invoice_numbers, archives = extract_order_from_invoice(
+        args.facturas_folder, args.log_file, args.excel_path, inputs.load_processed(registry, 'detect'), args.bloque,
+        workers, memory_limit, pipeline.time_budget(args.limite_documento, args.limite_pagina))
     if not orders_detected and not expedientes_detected:
         print("\n⚠️  No se detectaron números de pedido ni expedientes en los PDFs de facturas.")
     else:
@@ -316,4 +450,4 @@ Estructura de carpetas:
             print(f"\n✓ Números de expediente detectados ({len(expedientes_detected)}):")
             print(f"  {', '.join(expedientes_detected)}")
 
-    update_excel_with_status(args.excel_path, orders_detected, expedientes_detected, invoice_numbers)
\ No newline at end of file
+    inputs.mark_processed(registry, 'detect', archives)
\ No newline at end of file
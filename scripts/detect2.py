@@ -1,9 +1,20 @@
-import pdfplumber
 import os
 import re
 import argparse
 import pandas as pd
 import time
+import inputs
+import store
+import schema
+import checkpoint
+import pipeline
+import classify
+import quarantine
+import scheduler
+import textindex
+import keyindex
+from money import invoice_totals
+from dates import to_datetime_column
 
 def clean_text(text):
     """Limpia el texto eliminando espacios extras y caracteres especiales"""
@@ -39,302 +50,348 @@ def is_valid_context(line, number, context_keywords):
             
     return False
 
-def extract_order_from_invoice(pdf_folder, log_file):
+EXPEDIENTE_KEYWORDS = [
+    "EXPEDIENTE", "ARRASTRE", "GRUA", "EXP", "EXPTE",
+    "SINIESTRO", "SERVICIO", "NUM", "NUMERO", "NO", "Nº"
+]
+
+def analyze_invoice(page_texts):
+    """
+    Analiza el texto de una factura del nuevo formato (una cadena por página) y devuelve
+    los pedidos, expedientes, el folio (A...) y la fecha de emisión en formato DD/MM/AAAA
+    """
+    current_orders = []
+    current_expedientes = []
+    invoice_number = None
+    emission_date = None
+    
+    # Buscar SERIE, FOLIO y FECHA DE EMISIÓN al inicio del documento
+    first_page_text = page_texts[0] if page_texts else ""
+    
+    # Buscar fecha de emisión
+    emission_date_match = re.search(r'Fecha emisión\s+(\d{4}-\d{2}-\d{2})\s+(\d{2}:\d{2}:\d{2})', first_page_text)
+    if emission_date_match:
+        # Extraer solo la parte de la fecha (sin hora) para mejor compatibilidad con Excel
+        fecha_parte = emission_date_match.group(1)
+        hora_parte = emission_date_match.group(2)
+        # Convertir de YYYY-MM-DD a DD/MM/YYYY (formato más compatible con Excel)
+        partes_fecha = fecha_parte.split('-')
+        if len(partes_fecha) == 3:
+            fecha_formateada = f"{partes_fecha[2]}/{partes_fecha[1]}/{partes_fecha[0]}"
+            emission_date = fecha_formateada
+        else:
+            emission_date = fecha_parte
+        print(f"Fecha de emisión detectada: {emission_date} (original: {fecha_parte} {hora_parte})")
+    
+    # Buscar el folio de la factura directamente
+    folio_match = re.search(r'Folio\s+A(\d+)', first_page_text)
+    if folio_match:
+        invoice_number = f"A{folio_match.group(1)}"
+        print(f"Número de factura detectado: {invoice_number}")
+    
+    # Primero, buscar todos los números de 10 dígitos en todo el texto del documento
+    # y su posible asociación con "PEDIDO DE COMPRA"
+    all_text = ""
+    for page_text in page_texts:
+        if page_text:
+            all_text += page_text + "\n"
+    
+    # Buscar específicamente números de 10 dígitos que comiencen con "51009" o "51008"
+    # ya que todos los pedidos observados tienen ese patrón
+    pedido_numbers = re.findall(r'\b(51009\d{5}|51008\d{5})\b', all_text)
+    
+    if pedido_numbers:
+        for pedido in pedido_numbers:
+            if pedido not in current_orders:
+                current_orders.append(pedido)
+                print(f"Número de pedido detectado en documento: {pedido}")
+    
+    # Buscar específicamente la sección donde están los pedidos
+    for text in page_texts:
+        if not text:
+            continue
+        
+        # Imprimir un fragmento del texto para depuración
+        print(f"Fragmento de texto: {text[:200]}...")
+        
+        # Buscar la línea completa donde aparece "ARRASTRE DE GRUA PEDIDO DE COMPRA"
+        lines = text.split('\n')
+        for line in lines:
+            if 'ARRASTRE DE GRUA PEDIDO DE COMPRA' in line.upper():
+                print(f"Línea con Arrastre de grúa: {line.strip()}")
+                
+                # Verificar si hay un número de pedido en la misma línea
+                # que coincida con los patrones de pedido
+                for pedido in pedido_numbers:
+                    if pedido in line:
+                        if pedido not in current_orders:
+                            current_orders.append(pedido)
+                            print(f"Número de pedido encontrado en línea con PEDIDO DE COMPRA: {pedido}")
+            
+            # Buscar expedientes (8 dígitos) - ignorando el código 78101803
+            expedientes = re.finditer(r'\b\d{8}\b', line)
+            for match in expedientes:
+                expediente = match.group()
+                if expediente != "78101803" and expediente not in current_expedientes and is_valid_context(line, expediente, EXPEDIENTE_KEYWORDS):
+                    current_expedientes.append(expediente)
+                    print(f"Expediente detectado: {expediente} en: {line.strip()}")
+
+    return {
+        'layout': 'B',
+        'folio': invoice_number,
+        'fecha': emission_date,
+        'orders': current_orders,
+        'expedientes': current_expedientes,
+        'text': all_text
+    }
+
+def collect_references(entries):
+    """Junta los pedidos/expedientes de varias facturas con su folio y fecha (la última factura gana)"""
     orders_detected = []
     expedientes_detected = []
     invoice_info = {}  # Diccionario para almacenar información de factura por pedido/expediente
-    invalid_pdfs = []
-    total_processed = 0
-    pdf_files = [f for f in os.listdir(pdf_folder) if f.lower().endswith('.pdf')]
-    
-    # Palabras clave expandidas para contexto
-    pedido_keywords = [
-        "PEDIDO", "ORDEN", "COMPRA", "SERVICIO", "REFERENCIA",
-        "PED", "OC", "O C", "NUM", "NUMERO", "NO", "Nº",
-        "REALIZADO", "SERVICIO REALIZADO", "MUERTO", "ARRASTRE",
-        "GRUA", "FACTURA", "REMISION"
-    ]
-    
-    expediente_keywords = [
-        "EXPEDIENTE", "ARRASTRE", "GRUA", "EXP", "EXPTE",
-        "SINIESTRO", "SERVICIO", "NUM", "NUMERO", "NO", "Nº"
-    ]
+    for entry in entries:
+        info = {'folio': entry['folio'], 'fecha': entry['fecha'] if entry['fecha'] else ''}
+        for order in entry['orders']:
+            orders_detected.append(order)
+            if entry['folio']:
+                invoice_info[order] = info
+        for expediente in entry['expedientes']:
+            expedientes_detected.append(expediente)
+            if entry['folio']:
+                invoice_info[expediente] = info
+    return list(set(orders_detected)), list(set(expedientes_detected)), invoice_info
+
+def write_unmatched(log, entry):
+    log.write(f"\n=== {entry['documento']} ===\n")
+    log.write(entry['detalle'])
+    log.write("-" * 50 + "\n")
+
+def apply_chunk(excel_path, checkpoint_file, chunk, seen, texts=None):
+    """
+    Actualiza el Excel con las referencias de un bloque de facturas, indexa su texto
+    ({nombre: (formato, texto)}, ver textindex.py), registra lo leído de cada factura para
+    la conciliación (ver keyindex.record_invoices) y después registra su avance
+    """
+    orders, expedientes, invoice_info = collect_references(chunk)
+    if orders or expedientes:
+        update_excel_with_status(excel_path, orders, expedientes, invoice_info)
+    digests = checkpoint.digests_by_name(seen)
+    for entry in chunk:
+        entry['huella'] = digests.get(entry['documento'])
+    texts = texts or {}
+    textindex.add_documents(excel_path, [
+        (entry['huella'], entry['documento'], 'detect2', texts[entry['documento']][0], entry['folio'],
+         texts[entry['documento']][1])
+        for entry in chunk if entry['documento'] in texts])
+    keyindex.record_invoices(excel_path, 'detect2', chunk)
+    checkpoint.append_checkpoint(checkpoint_file, chunk)
+    print(f"Avance guardado: {len(chunk)} facturas")
+    return chunk
+
+def extract_order_from_invoice(pdf_folder, log_file, excel_path, processed_archives=None,
+                               chunk_size=checkpoint.CHUNK_SIZE, workers=1,
+                               memory_limit=None, budget=None):
+    """
+    Detecta las referencias, folio y fecha de emisión de cada factura y actualiza el Excel por
+    bloques de chunk_size facturas. Si una corrida anterior se interrumpió, continúa desde su
+    último bloque guardado.
+    """
+    checkpoint_file = checkpoint.checkpoint_path(excel_path, 'detect2')
+    completed = checkpoint.load_checkpoint(checkpoint_file)
+    seen = checkpoint.seen_digests(completed)
+    chunk = []
+    # La entrada puede ser una carpeta con PDFs y/o lotes ZIP/TAR, o un lote directamente
+    pdf_paths, archives = inputs.discover(pdf_folder, processed_archives)
+    failed_archives = []
+    aliases = {}  # Copias idénticas de una misma factura: se procesa solo la primera
 
     with open(log_file, 'w', encoding='utf-8') as log:
         log.write("=== REPORTE DE PROCESAMIENTO DE FACTURAS ===\n\n")
         log.write("1. ARCHIVOS SIN REFERENCIAS ENCONTRADAS\n")
         log.write("==========================================\n")
-        
-        for pdf_file in pdf_files:
-            pdf_path = os.path.join(pdf_folder, pdf_file)
+        for entry in completed:
+            if entry['detalle']:
+                write_unmatched(log, entry)
+
+        # El texto de las siguientes facturas se extrae en otros procesos mientras se analiza y guarda.
+        # Antes se clasifica cada PDF: las facturas del otro formato se omiten y los pedidos,
+        # escaneados y dañados se reportan sin extraer su texto. Una factura que pasa su tiempo
+        # límite queda en cuarentena sin detener el lote. Las facturas con su XML timbrado (CFDI)
+        # al lado se leen de él, sin extraer el texto del PDF
+        classes = {}
+        cfdis = {}
+        chunk_texts = {}  # Formato y texto de cada factura del bloque para el índice de texto
+        quarantined = quarantine.load(excel_path, 'detect2')
+        documents = pipeline.stream_documents(pdf_paths, archives, failed_archives, aliases, seen, workers,
+                                              memory_limit, accept={classify.FACTURA_B}, skip={classify.FACTURA_A},
+                                              classes=classes, budget=budget, quarantined=quarantined,
+                                              cfdis=cfdis)
+        for pdf_file, pdf_path, page_texts, error in documents:
+            entry = {'documento': pdf_file, 'formato': None, 'folio': None, 'fecha': None, 'totales': None,
+                     'orders': [], 'expedientes': [], 'detalle': None, 'xml': False}
             try:
                 print(f"Procesando factura: {pdf_file}")
-                
-                with pdfplumber.open(pdf_path) as pdf:
-                    full_text = ""
-                    current_orders = []
-                    current_expedientes = []
-                    has_description_section = False
-                    invoice_number = None
-                    emission_date = None
-                    
-                    # Buscar SERIE, FOLIO y FECHA DE EMISIÓN al inicio del documento
-                    first_page_text = pdf.pages[0].extract_text()
-                    
-                    # Buscar fecha de emisión
-                    emission_date_match = re.search(r'Fecha emisión\s+(\d{4}-\d{2}-\d{2})\s+(\d{2}:\d{2}:\d{2})', first_page_text)
-                    if emission_date_match:
-                        # Extraer solo la parte de la fecha (sin hora) para mejor compatibilidad con Excel
-                        fecha_parte = emission_date_match.group(1)
-                        hora_parte = emission_date_match.group(2)
-                        # Convertir de YYYY-MM-DD a DD/MM/YYYY (formato más compatible con Excel)
-                        partes_fecha = fecha_parte.split('-')
-                        if len(partes_fecha) == 3:
-                            fecha_formateada = f"{partes_fecha[2]}/{partes_fecha[1]}/{partes_fecha[0]}"
-                            emission_date = fecha_formateada
-                        else:
-                            emission_date = fecha_parte
-                        print(f"Fecha de emisión detectada: {emission_date} (original: {fecha_parte} {hora_parte})")
-                    
-                    # Buscar el folio de la factura directamente
-                    folio_match = re.search(r'Folio\s+A(\d+)', first_page_text)
-                    if folio_match:
-                        invoice_number = f"A{folio_match.group(1)}"
-                        print(f"Número de factura detectado: {invoice_number}")
-                    
-                    # Variable para indicar si encontramos al menos un pedido/expediente
-                    references_found = False
-                    
-                    # Primero, buscar todos los números de 10 dígitos en todo el texto del documento
-                    # y su posible asociación con "PEDIDO DE COMPRA"
-                    all_text = ""
-                    for page in pdf.pages:
-                        page_text = page.extract_text()
-                        if page_text:
-                            all_text += page_text + "\n"
-                    
-                    # Buscar específicamente números de 10 dígitos que comiencen con "51009" o "51008"
-                    # ya que todos los pedidos observados tienen ese patrón
-                    pedido_numbers = re.findall(r'\b(51009\d{5}|51008\d{5})\b', all_text)
-                    
-                    if pedido_numbers:
-                        for pedido in pedido_numbers:
-                            if pedido not in current_orders:
-                                current_orders.append(pedido)
-                                references_found = True
-                                print(f"Número de pedido detectado en documento: {pedido}")
-                    
-                    # Buscar específicamente la sección donde están los pedidos
-                    for page in pdf.pages:
-                        text = page.extract_text()
-                        if not text:
-                            continue
-                            
-                        full_text += text + "\n"
-                        
-                        # Imprimir un fragmento del texto para depuración
-                        print(f"Fragmento de texto: {text[:200]}...")
-                        
-                        # Buscar la línea completa donde aparece "ARRASTRE DE GRUA PEDIDO DE COMPRA"
-                        lines = text.split('\n')
-                        for line in lines:
-                            if 'ARRASTRE DE GRUA PEDIDO DE COMPRA' in line.upper():
-                                print(f"Línea con Arrastre de grúa: {line.strip()}")
-                                
-                                # Verificar si hay un número de pedido en la misma línea
-                                # que coincida con los patrones de pedido
-                                for pedido in pedido_numbers:
-                                    if pedido in line:
-                                        if pedido not in current_orders:
-                                            current_orders.append(pedido)
-                                            references_found = True
-                                            print(f"Número de pedido encontrado en línea con PEDIDO DE COMPRA: {pedido}")
-                            
-                            # Buscar expedientes (8 dígitos) - ignorando el código 78101803
-                            expedientes = re.finditer(r'\b\d{8}\b', line)
-                            for match in expedientes:
-                                expediente = match.group()
-                                if expediente != "78101803" and expediente not in current_expedientes and is_valid_context(line, expediente, expediente_keywords):
-                                    current_expedientes.append(expediente)
-                                    references_found = True
-                                    print(f"Expediente detectado: {expediente} en: {line.strip()}")
-                    
-                    # Registrar que se procesó correctamente si se encontraron referencias
-                    if references_found:
-                        total_processed += 1
-                        # Registrar los números de pedido
-                        for order in current_orders:
-                            orders_detected.append(order)
-                            if invoice_number:
-                                invoice_info[order] = {
-                                    'folio': invoice_number,
-                                    'fecha': emission_date if emission_date else ''
-                                }
-                                print(f"Registrando pedido {order} con factura {invoice_number} y fecha {emission_date}")
-                        
-                        # Registrar los expedientes
-                        for expediente in current_expedientes:
-                            expedientes_detected.append(expediente)
-                            if invoice_number:
-                                invoice_info[expediente] = {
-                                    'folio': invoice_number,
-                                    'fecha': emission_date if emission_date else ''
-                                }
-                                print(f"Registrando expediente {expediente} con factura {invoice_number} y fecha {emission_date}")
-                    else:
-                        invalid_pdfs.append(pdf_file)
-                        log.write(f"\n=== {pdf_file} ===\n")
-                        log.write("Primeras 10 líneas del contenido:\n")
-                        preview_lines = full_text.split('\n')[:10]
-                        for line in preview_lines:
-                            log.write(f"{line}\n")
-                        log.write("-" * 50 + "\n")
-                        
+                if error:
+                    raise error
+
+                result = cfdis.pop(pdf_file, None)
+                entry['xml'] = result is not None
+                if result is None:
+                    result = analyze_invoice(page_texts)
+                chunk_texts[pdf_file] = (result['layout'], result['text'])
+                invoice_number = result['folio']
+                emission_date = result['fecha']
+                entry.update(formato=result['layout'], folio=invoice_number, fecha=emission_date,
+                             totales=invoice_totals(result), orders=result['orders'],
+                             expedientes=result['expedientes'])
+
+                if result['orders'] or result['expedientes']:
+                    if invoice_number:
+                        for order in result['orders']:
+                            print(f"Registrando pedido {order} con factura {invoice_number} y fecha {emission_date}")
+                        for expediente in result['expedientes']:
+                            print(f"Registrando expediente {expediente} con factura {invoice_number} y fecha {emission_date}")
+                else:
+                    # Sin referencias válidas el archivo se lista para revisión
+                    preview_lines = result['text'].split('\n')[:10]
+                    entry['detalle'] = "Primeras 10 líneas del contenido:\n" + "".join(f"{line}\n" for line in preview_lines)
+
             except Exception as e:
-                invalid_pdfs.append(pdf_file)
-                log.write(f"\n=== {pdf_file} ===\n")
-                log.write(f"Error al procesar el archivo: {str(e)}\n")
-                log.write("-" * 50 + "\n")
+                entry['detalle'] = f"Error al procesar el archivo: {str(e)}\n"
+            if entry['detalle']:
+                write_unmatched(log, entry)
+
+            chunk.append(entry)
+            if len(chunk) >= chunk_size:
+                completed.extend(apply_chunk(excel_path, checkpoint_file, chunk, seen, chunk_texts))
+                chunk = []
+                chunk_texts = {}
+        if chunk:
+            completed.extend(apply_chunk(excel_path, checkpoint_file, chunk, seen, chunk_texts))
+        quarantine.save(excel_path, 'detect2', quarantined)
+
+        invalid_pdfs = [entry['documento'] for entry in completed if entry['detalle']]
+        total_processed = len(completed) - len(invalid_pdfs)
+        orders_detected, expedientes_detected, invoice_info = collect_references(completed)
 
         # Resumen final
         log.write("\n\n=== RESUMEN ===\n")
-        log.write(f"Total de PDFs encontrados: {len(pdf_files)}\n")
+        log.write(f"Total de PDFs encontrados: {len(completed) + sum(len(v) for v in aliases.values())}\n")
+        log.write(f"PDFs únicos (sin copias idénticas): {len(completed)}\n")
         log.write(f"PDFs procesados exitosamente: {total_processed}\n")
         log.write(f"PDFs sin referencias encontradas: {len(invalid_pdfs)}\n")
+        log.write(f"Facturas leídas de su XML (CFDI): {sum(1 for entry in completed if entry.get('xml'))}\n")
         log.write("\nLista de archivos a revisar:\n")
         for pdf in invalid_pdfs:
             log.write(f"- {pdf}\n")
-        
+        for line in inputs.alias_report_lines(aliases):
+            log.write(f"{line}\n")
+        for line in classify.report_lines(classes) + quarantine.report_lines(quarantined):
+            log.write(f"{line}\n")
+
         # Añadir los pedidos y expedientes detectados al reporte
         if orders_detected:
             log.write("\nNúmeros de pedido detectados:\n")
             for order in orders_detected:
                 log.write(f"- {order}: Factura {invoice_info.get(order, {}).get('folio', 'N/A')}, Fecha {invoice_info.get(order, {}).get('fecha', 'N/A')}\n")
-        
+
         if expedientes_detected:
             log.write("\nNúmeros de expediente detectados:\n")
             for exp in expedientes_detected:
                 log.write(f"- {exp}: Factura {invoice_info.get(exp, {}).get('folio', 'N/A')}, Fecha {invoice_info.get(exp, {}).get('fecha', 'N/A')}\n")
-    
-    return list(set(orders_detected)), list(set(expedientes_detected)), invoice_info
+
+    checkpoint.clear_checkpoint(checkpoint_file)
+    # Lotes completos y PDFs sueltos con referencias (estos últimos solo para poder archivarlos)
+    ok_names = [entry['documento'] for entry in completed if not entry['detalle']]
+    ok_names += [name for name, clase in classes.items() if clase == classify.FACTURA_A]  # Las procesa la otra etapa
+    completed_archives = [a for a in archives if a not in failed_archives] + inputs.completed_pdfs(pdf_paths, ok_names, aliases)
+    return orders_detected, expedientes_detected, invoice_info, completed_archives
+
+def rows_to_update(df, orders_detected, expedientes_detected):
+    """Filas que coinciden por pedido, o por expediente si el pedido no está entre los detectados"""
+    pedidos = df['Numero de Pedido']
+    expedientes = df['Nº de pieza']
+    por_pedido = pedidos.isin(set(orders_detected)).fillna(False).astype(bool)
+    por_expediente = ~por_pedido & expedientes.isin(set(expedientes_detected)).fillna(False).astype(bool)
+    return por_pedido, por_expediente, pedidos.where(por_pedido, expedientes)
 
 def update_excel_with_status(excel_path, orders_detected, expedientes_detected, invoice_info):
     try:
         print("Iniciando actualización del Excel...")
-        # Leer el archivo Excel
-        df = pd.read_excel(excel_path)
-        print(f"Excel leído correctamente. Columnas actuales: {df.columns.tolist()}")
-        
-        # Crear las columnas si no existen, pero NO resetear valores existentes
-        if 'Status' not in df.columns:
-            df['Status'] = 'NO FACTURADO'
-        if 'No factura' not in df.columns:
-            df['No factura'] = ''
-        # Crear columna para fecha de emisión si no existe
-        if 'Fecha emisión' not in df.columns:
-            df['Fecha emisión'] = ''
-        
-        print(f"Columnas después de verificar: {df.columns.tolist()}")
-        
-        # Asegurar que las columnas sean string y limpiar espacios
-        df['Numero de Pedido'] = df['Numero de Pedido'].astype(str).str.strip()
-        df['Nº de pieza'] = df['Nº de pieza'].astype(str).str.strip()
-        
-        # Limpiar números de pedido detectados y convertir a strings
-        orders_detected = [str(order).strip() for order in orders_detected]
-        expedientes_detected = [str(exp).strip() for exp in expedientes_detected]
-        
+        # Limpiar números de pedido detectados; las claves del Excel son enteras (ver schema.py)
+        orders_detected = [key for key in map(schema.to_key, orders_detected) if key is not None]
+        expedientes_detected = [key for key in map(schema.to_key, expedientes_detected) if key is not None]
+
         print(f"Procesando {len(orders_detected)} pedidos y {len(expedientes_detected)} expedientes")
         print(f"Lista de pedidos detectados: {orders_detected}")
         print(f"Lista de expedientes detectados: {expedientes_detected}")
-        
+
         # Debug: Imprimir información sobre los invoice_info
         print("\nInformación de facturas detectadas:")
         for pedido, info in invoice_info.items():
             print(f"Pedido: {pedido} - Factura: {info.get('folio', 'N/A')} - Fecha: {info.get('fecha', 'N/A')}")
-        
-        # Debug: Imprimir algunos registros del Excel para verificar los datos
-        print("\nPrimeros 5 registros del Excel:")
-        for i, row in df.head().iterrows():
-            print(f"Índice {i}: Pedido={row['Numero de Pedido']}, Expediente={row['Nº de pieza']}")
-        
-        # Actualizar solo los registros encontrados en los PDFs actuales
-        actualizados = 0
-        for index, row in df.iterrows():
-            pedido = str(row['Numero de Pedido']).strip()
-            expediente = str(row['Nº de pieza']).strip()
-            
-            # Debug: imprimir algunos valores para comparación
-            if index < 5:
-                print(f"Comparando - Row[{index}]: Pedido='{pedido}' vs pedidos detectados: {orders_detected[:3] if orders_detected else 'vacío'}")
-            
-            # Solo actualizar si el registro está en los detectados actualmente
-            if pedido in orders_detected:
-                # Obtener información de la factura para este pedido
-                invoice_data = invoice_info.get(pedido, {})
-                current_factura = invoice_data.get('folio', '')
-                current_fecha = invoice_data.get('fecha', '')
-                
-                print(f"¡Coincidencia encontrada! Pedido {pedido} corresponde a factura {current_factura}")
-                
-                # Actualizar siempre para asegurar que se actualice
-                df.at[index, 'Status'] = 'FACTURADO'
-                df.at[index, 'No factura'] = current_factura
-                df.at[index, 'Fecha emisión'] = current_fecha
-                actualizados += 1
-                print(f"Actualizando pedido {pedido} con factura {current_factura} y fecha {current_fecha}")
-                    
-            elif expediente in expedientes_detected:
-                # Obtener información de la factura para este expediente
-                invoice_data = invoice_info.get(expediente, {})
-                current_factura = invoice_data.get('folio', '')
-                current_fecha = invoice_data.get('fecha', '')
-                
-                print(f"¡Coincidencia encontrada! Expediente {expediente} corresponde a factura {current_factura}")
-                
-                # Actualizar siempre para asegurar que se actualice
-                df.at[index, 'Status'] = 'FACTURADO POR EXPEDIENTE'
-                df.at[index, 'No factura'] = current_factura
-                df.at[index, 'Fecha emisión'] = current_fecha
-                actualizados += 1
-                print(f"Actualizando expediente {expediente} con factura {current_factura} y fecha {current_fecha}")
-            
-            # Si no está en los detectados, mantener su estado actual
-        
-        print(f"Total de registros actualizados: {actualizados}")
-        
-        # Convertir las fechas de emisión a formato de fecha de Excel
-        # Primero asegurarse de que todas las fechas sean strings
-        df['Fecha emisión'] = df['Fecha emisión'].astype(str)
-        
-        # Ahora intentamos convertir a fechas de pandas donde sea posible
-        # pero sin afectar las celdas que no tengan un formato reconocible
-        try:
-            # Crear una máscara para identificar valores que parecen fechas
-            fecha_mask = df['Fecha emisión'].str.contains(r'\d{2}/\d{2}/\d{4}')
-            # Aplicar la conversión solo a esas celdas
-            if fecha_mask.any():
-                df.loc[fecha_mask, 'Fecha emisión'] = pd.to_datetime(
-                    df.loc[fecha_mask, 'Fecha emisión'], 
-                    format='%d/%m/%Y',
-                    errors='coerce'
-                )
-            print("Conversión de fechas realizada correctamente")
-        except Exception as e:
-            print(f"Advertencia al convertir fechas: {str(e)} - Continuando sin conversión")
-        
-        # Guardar el Excel con las modificaciones
-        df.to_excel(excel_path, index=False)
-        print(f"Excel guardado exitosamente en: {excel_path}")
-        
-        # Verificar que los cambios se guardaron
-        df_verification = pd.read_excel(excel_path)
-        print(f"Verificación - Columnas en el archivo guardado: {df_verification.columns.tolist()}")
-        factura_count = df_verification['No factura'].astype(str).str.strip().apply(lambda x: len(x) > 0).sum()
-        fecha_count = df_verification['Fecha emisión'].astype(str).str.strip().apply(lambda x: len(x) > 0).sum()
+
+        # Las filas se leen, actualizan y guardan con el almacén bloqueado: si otro proceso
+        # guardó mientras se analizaban las facturas, el cambio se aplica sobre su versión
+        with store.locked(excel_path):
+            # Buscar las filas a actualizar leyendo solo las columnas clave de las
+            # particiones que contienen los pedidos/expedientes detectados
+            store_index = store.load_index(excel_path)
+            partitions = store.partitions_for(store_index, orders_detected, expedientes_detected)
+            if not partitions:
+                print("Ningún pedido o expediente detectado existe en el Excel; no hay nada que actualizar.")
+                return
+            keys = store.load_partitions(excel_path, partitions, store.KEY_COLUMNS)
+            por_pedido, por_expediente, _ = rows_to_update(keys, orders_detected, expedientes_detected)
+            changed = sorted(keys.loc[por_pedido | por_expediente, store.PARTITION_COLUMN].unique())
+            if not changed:
+                print("Ningún registro del Excel coincide con lo detectado; no hay nada que actualizar.")
+                return
+
+            # Solo las particiones con coincidencias se cargan completas y se reescriben
+            df = store.load_partitions(excel_path, changed)
+            print(f"Particiones con cambios: {', '.join(changed)}. Columnas actuales: {df.columns.tolist()}")
+
+            # Crear las columnas si no existen, pero NO resetear valores existentes
+            if 'Status' not in df.columns:
+                df['Status'] = 'NO FACTURADO'
+            if 'No factura' not in df.columns:
+                df['No factura'] = None
+            # Crear columna para fecha de emisión si no existe
+            if 'Fecha emisión' not in df.columns:
+                df['Fecha emisión'] = None
+            schema.apply(df)  # Las columnas nuevas toman su tipo (Status categórica con sus valores)
+
+            # Actualizar siempre los registros encontrados en los PDFs actuales
+            por_pedido, por_expediente, referencia = rows_to_update(df, orders_detected, expedientes_detected)
+            coincide = por_pedido | por_expediente
+            folios = {schema.to_key(ref): info.get('folio') for ref, info in invoice_info.items()}
+            fechas = {schema.to_key(ref): info.get('fecha') for ref, info in invoice_info.items()}
+            df.loc[por_pedido, 'Status'] = 'FACTURADO'
+            df.loc[por_expediente, 'Status'] = 'FACTURADO POR EXPEDIENTE'
+            df.loc[coincide, 'No factura'] = referencia[coincide].map(folios).astype('string')
+            # Las fechas 'DD/MM/AAAA' detectadas pasan a datetime64 en una sola pasada
+            df.loc[coincide, 'Fecha emisión'] = to_datetime_column(referencia[coincide].map(fechas).astype(object))
+            for tipo, mascara in (('pedido', por_pedido), ('expediente', por_expediente)):
+                detalle = pd.DataFrame({'ref': referencia[mascara], 'folio': df.loc[mascara, 'No factura'],
+                                        'fecha': df.loc[mascara, 'Fecha emisión']}).drop_duplicates()
+                for ref, folio, fecha in detalle.itertuples(index=False):
+                    print(f"Actualizando {tipo} {ref} con factura {folio} y fecha {fecha}")
+            actualizados = int(coincide.sum())
+            print(f"Total de registros actualizados: {actualizados}")
+
+            # Guardar solo las particiones modificadas
+            store.save_partitions(excel_path, df, store_index)
+            print(f"Excel guardado exitosamente en: {store.partition_dir(excel_path)}/")
+
+        # Verificar que los cambios se guardaron (solo las columnas de factura y fecha)
+        df_verification = store.load_partitions(excel_path, changed, ['No factura', 'Fecha emisión'])
+        factura_count = df_verification['No factura'].str.strip().fillna('').str.len().gt(0).sum()
+        fecha_count = df_verification['Fecha emisión'].notna().sum()
         print(f"Verificación - Número de registros con factura: {factura_count}")
         print(f"Verificación - Número de registros con fecha de emisión: {fecha_count}")
-        
+
     except Exception as e:
         print(f"Error al actualizar el Excel: {str(e)}")
         raise  # Re-lanzar la excepción para ver el stack trace completo
@@ -348,7 +405,7 @@ Ejemplo de uso:
     python scripts/detect.py PDF-FACTURAS output/data.xlsx --log_file output/log_facturas.txt
 
 Estructura de carpetas:
-    PDF-FACTURAS/     → Carpeta con las facturas a procesar
+    PDF-FACTURAS/     → Carpeta con las facturas a procesar (PDFs y/o lotes .zip/.tar)
     output/           → Carpeta donde se guardan los resultados
         data.xlsx     → Excel con los datos
         log_facturas.txt → Archivo de log del proceso
@@ -356,22 +413,40 @@ Estructura de carpetas:
     )
     
     parser.add_argument("facturas_folder", 
-                      help="Ruta de la carpeta PDF-FACTURAS que contiene los PDFs de facturas")
+                      help="Ruta de la carpeta PDF-FACTURAS (o lote ZIP/TAR) con los PDFs de facturas")
     parser.add_argument("excel_path", 
                       help="Ruta del archivo Excel (output/data.xlsx) que se actualizará")
     parser.add_argument("--log_file", 
                       default="output/log_facturas.txt", 
                       help="Ruta del archivo de logs (default: output/log_facturas.txt)")
+    parser.add_argument("--workers", type=int,
+                      help="Procesos para extraer el texto de las facturas (default: según núcleos y memoria disponibles)")
+    parser.add_argument("--memoria_max", type=int,
+                      help="Tope de memoria de la corrida en MB; cerca del tope no se envían más documentos a los procesos (default: 80%% de la memoria disponible)")
+    parser.add_argument("--limite_documento", type=int, default=pipeline.DOCUMENT_SECONDS,
+                      help=f"Segundos base que puede tardar una factura; al pasarlos se termina su proceso y queda en cuarentena (0 = sin límite; default: {pipeline.DOCUMENT_SECONDS})")
+    parser.add_argument("--limite_pagina", type=int, default=pipeline.PAGE_SECONDS,
+                      help=f"Segundos adicionales por cada página (default: {pipeline.PAGE_SECONDS})")
+    parser.add_argument("--bloque", type=int, default=checkpoint.CHUNK_SIZE,
+                      help=f"Facturas por bloque guardado; una corrida interrumpida continúa desde el último bloque (default: {checkpoint.CHUNK_SIZE})")
     args = parser.parse_args()
 
     print("\n=== Iniciando Procesamiento de Facturas ===")
     print(f"Carpeta de facturas: {args.facturas_folder}")
     print(f"Archivo Excel: {args.excel_path}")
     print(f"Archivo de log: {args.log_file}")
+    memory_limit = scheduler.memory_limit(args.memoria_max)
+    workers = args.workers or scheduler.auto_workers(memory_limit)
+    print(scheduler.describe(workers, memory_limit))
 
     os.makedirs(os.path.dirname(args.log_file), exist_ok=True)
 
-    orders_detected, expedientes_detected, invoice_info = extract_order_from_invoice(args.facturas_folder, args.log_file)
+    # Los lotes ya aplicados en corridas anteriores se reconocen por su huella y no se releen
+    registry = inputs.registry_path(args.excel_path)
+    # El Excel se actualiza por bloques durante la detección
+    orders_detected, expedientes_detected, invoice_info, archives = extract_order_from_invoice(
+        args.facturas_folder, args.log_file, args.excel_path, inputs.load_processed(registry, 'detect2'), args.bloque,
+        workers, memory_limit, pipeline.time_budget(args.limite_documento, args.limite_pagina))
     if not orders_detected and not expedientes_detected:
         print("\n⚠️  No se detectaron números de pedido ni expedientes en los PDFs de facturas.")
     else:
@@ -396,4 +471,4 @@ Estructura de carpetas:
                     fecha = invoice_info[exp]['fecha']
                     print(f"  Expediente: {exp} - Factura: {factura} - Fecha emisión: {fecha}")
 
-    update_excel_with_status(args.excel_path, orders_detected, expedientes_detected, invoice_info)
\ No newline at end of file
+    inputs.mark_processed(registry, 'detect2', archives)
\ No newline at end of file
@@ -1,27 +1,23 @@
 import os
+import re
 import json
-import pdfplumber
 import pandas as pd
-import sys
-from decimal import Decimal, ROUND_HALF_UP
+import argparse
+from dates import find_required_date
+import store
+import schema
+import inputs
+import checkpoint
+import pipeline
+import classify
+import quarantine
+import scheduler
+import textindex
+from money import MONEY_COLUMNS, parse_cents, to_cents, format_cents
 
 def clean_text(text):
     return ' '.join(text.split())
 
-def format_currency(value_str):
-    try:
-        clean_value = value_str.replace('$', '').replace('MXN', '').strip()
-        if '.' in clean_value and ',' in clean_value:
-            clean_value = clean_value.replace('.', '').replace(',', '.')
-        elif ',' in clean_value:
-            clean_value = clean_value.replace(',', '.')
-        decimal_value = Decimal(clean_value)
-        formatted_value = decimal_value.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-        return float(formatted_value)
-    except Exception as e:
-        print(f"Error en format_currency: {e} para valor: {value_str}")
-        return 0.00
-
 def convert_to_number(value):
     try:
         clean_value = ''.join(c for c in str(value) if c.isdigit() or c == '.')
@@ -29,181 +25,115 @@ def convert_to_number(value):
     except (ValueError, TypeError):
         return value
 
-def parse_date(date_str):
+# Líneas de Material de un pedido ("10 1 12345678 87654321 Material ... $1,500.50 $240.00"): una
+# sola expresión recorre el texto de la página y captura en cada línea la posición, los repartos,
+# la pieza, la pieza del cliente y el primer y último importe con '$' (precio e impuesto). Las
+# líneas con "Material" que no siguen ese formato quedan en 'malformada' para el reporte.
+MATERIAL_ROW = re.compile(r"""
+    ^(?=[^\n]*Material)
+    (?:
+        [^\S\n]*(?P<linea>\d+)[^\S\n]+(?P<repartos>\d+)[^\S\n]+(?P<pieza>\d+)[^\S\n]+(?P<cliente>\S+)
+        (?:[^\n$]*?(?<!\S)(?P<precio>\S*\$\S*)(?:[^\n]*(?<!\S)(?P<impuesto>\S*\$\S*))?)?
+        [^\n]*
+    |
+        (?P<malformada>[^\n]*)
+    )$""", re.MULTILINE | re.VERBOSE)
+
+def parse_material_rows(text):
     """
-    Convierte una fecha en formato '8 oct 2024' a 'DD/MM/AAAA'
+    Lee en una pasada las líneas de Material de una página y las devuelve por columnas
+    ({'linea', 'repartos', 'pieza', 'pieza_cliente', 'precio', 'impuesto'}: listas del mismo
+    largo; importes en centavos) junto con las líneas que no se pudieron leer.
     """
-    from datetime import datetime
-    
-    # Diccionario de meses en español
-    meses = {
-        'ene': '01', 'feb': '02', 'mar': '03', 'abr': '04',
-        'may': '05', 'jun': '06', 'jul': '07', 'ago': '08',
-        'sept': '09', 'oct': '10', 'nov': '11', 'dic': '12'
-    }
+    columns = {'linea': [], 'repartos': [], 'pieza': [], 'pieza_cliente': [], 'precio': [], 'impuesto': []}
+    malformed = []
+    for match in MATERIAL_ROW.finditer(text):
+        if match['malformada'] is not None:
+            malformed.append(match['malformada'].strip())
+            continue
+        cliente = match['cliente']
+        precio = match['precio'] or "$0"
+        columns['linea'].append(int(match['linea']))
+        columns['repartos'].append(int(match['repartos']))
+        columns['pieza'].append(int(match['pieza']))
+        # La pieza del cliente puede traer letras; se convierte como siempre
+        columns['pieza_cliente'].append(int(cliente) if cliente.isdigit() else convert_to_number(cliente))
+        columns['precio'].append(parse_cents(precio))
+        columns['impuesto'].append(parse_cents(match['impuesto'] or precio))
+    return columns, malformed
+
+def parse_page(text, pedido_number, malformed=None):
+    """
+    Extrae los registros de las líneas de Material de una página. La fecha requerida
+    se busca en la misma página, así que cada página se puede procesar por separado.
+    Las líneas de Material que no se pudieron leer se agregan a `malformed` si se da.
+    """
+    page_entries = []
+    if not text:
+        return page_entries
+    lines = text.split('\n')
     
-    try:
-        # Limpiar y normalizar el texto
-        date_str = date_str.lower().strip()
-        print(f"Intentando parsear fecha: {date_str}")
-        
-        # Separar la fecha en partes
-        parts = [part for part in date_str.split() if part]
-        print(f"Partes de la fecha: {parts}")
-        
-        # Validar que tengamos suficientes partes
-        if len(parts) < 3:
-            print("No hay suficientes partes en la fecha")
-            return None
-            
-        # Intentar encontrar el mes primero
-        mes = None
-        mes_idx = -1
-        for i, part in enumerate(parts):
-            if part[:3] in meses:
-                mes = meses[part[:3]]
-                mes_idx = i
-                break
-        
-        if mes is None:
-            print("No se encontró el mes")
-            return None
-            
-        # Una vez encontrado el mes, buscar día y año
-        try:
-            # El día debería estar antes del mes
-            dia = parts[mes_idx - 1] if mes_idx > 0 else parts[0]
-            # Limpiar el día de cualquier carácter no numérico
-            dia = ''.join(c for c in dia if c.isdigit())
-            dia = dia.zfill(2)  # Añadir cero al inicio si es necesario
-            
-            # El año debería estar después del mes
-            año = parts[mes_idx + 1] if mes_idx < len(parts) - 1 else parts[-1]
-            # Limpiar el año de cualquier carácter no numérico
-            año = ''.join(c for c in año if c.isdigit())
-            
-            if dia and año and len(año) == 4:
-                fecha_formateada = f"{dia}/{mes}/{año}"
-                print(f"Fecha parseada exitosamente: {fecha_formateada}")
-                return fecha_formateada
-        except Exception as e:
-            print(f"Error procesando día/año: {e}")
-            
-    except Exception as e:
-        print(f"Error general al parsear fecha '{date_str}': {e}")
+    # Debug: Imprimir todas las líneas para ver qué estamos procesando
+    print("Procesando líneas del PDF:")
+    for idx, line in enumerate(lines):
+        print(f"Línea {idx}: {line}")
+
+    # Primero buscamos la fecha
+    fecha_requerida = find_required_date(lines)
+    if fecha_requerida:
+        print(f"¡Fecha encontrada y parseada!: {fecha_requerida}")
+
+    # Luego procesamos las líneas de Material
+    columns, bad_lines = parse_material_rows(text)
+    for line in bad_lines:
+        print(f"Línea de Material con formato inesperado: {line}")
+    if malformed is not None:
+        malformed.extend(bad_lines)
+    for linea, repartos, pieza, cliente, precio, impuesto in zip(
+            columns['linea'], columns['repartos'], columns['pieza'],
+            columns['pieza_cliente'], columns['precio'], columns['impuesto']):
+        page_entries.append({
+            "Numero de Pedido": pedido_number,
+            "Numero de linea": linea,
+            "Numero de repartos": repartos,
+            "Nº de pieza": pieza,
+            "pieza de cliente": cliente,
+            "Tipo": "Material",
+            "Devolución": 1,
+            "Fecha": fecha_requerida if fecha_requerida else "Sin fecha",
+            "Descripcion": "Arrastre/M (SER)",
+            "Cantidad": "(SER)",
+            "Precio por unidad": precio,  # Importes en centavos enteros
+            "Subtotal": precio,
+            "Impuesto": impuesto
+        })
+    return page_entries
+
+def find_pedido_number(first_page_text):
+    """Número de pedido del encabezado ("Pedido de compra: ...") de la primera página"""
+    for line in (first_page_text or '').split('\n'):
+        if "Pedido de compra:" in line:
+            pedido_str = line.split(':')[1].strip()
+            return convert_to_number(pedido_str)
     return None
 
-def process_pdf(pdf_path, existing_records):
-    data = []  # Para el Excel
-    report_data = []  # Para el reporte
-    pedido_number = None
-    
-    # Crear un conjunto de tuplas (expediente, pedido) para verificación rápida
-    existing_pieces = {(rec.get("Nº de pieza"), rec.get("Numero de Pedido")) 
-                      for rec in existing_records}
-    
-    try:
-        with pdfplumber.open(pdf_path) as pdf:
-            first_page_text = pdf.pages[0].extract_text()
-            for line in first_page_text.split('\n'):
-                if "Pedido de compra:" in line:
-                    pedido_str = line.split(':')[1].strip()
-                    pedido_number = convert_to_number(pedido_str)
-                    break
-            
-            for page in pdf.pages:
-                text = page.extract_text()
-                if not text:
-                    continue
-                lines = text.split('\n')
-                fecha_requerida = None
-                
-                # Debug: Imprimir todas las líneas para ver qué estamos procesando
-                print("Procesando líneas del PDF:")
-                for idx, line in enumerate(lines):
-                    print(f"Línea {idx}: {line}")
-
-                # Primero buscamos la fecha
-                fecha_requerida = None
-                for i, line in enumerate(lines):
-                    # Debug: Imprimir la línea que estamos analizando
-                    print(f"Analizando línea {i}: {line}")
-                    
-                    # Buscar específicamente en la columna de fecha
-                    if any(keyword in line for keyword in ["Fecha para la que se", "Cant.", "(Unidad)", "requiere"]):
-                        print(f"Encontrada línea con palabras clave: {line}")
-                        
-                        # Analizar esta línea y las siguientes
-                        for j in range(i, min(i + 3, len(lines))):
-                            current_line = lines[j]
-                            words = current_line.split()
-                            
-                            # Debug: Mostrar las palabras que estamos analizando
-                            print(f"Analizando palabras en línea {j}: {words}")
-                            
-                            for k, word in enumerate(words):
-                                word_lower = word.lower()
-                                if word_lower in ['ene', 'feb', 'mar', 'abr', 'may', 'jun', 'jul', 'ago', 'sept', 'oct', 'nov', 'dic']:
-                                    print(f"Encontrado mes: {word}")
-                                    # Buscar el día y año alrededor del mes
-                                    start_idx = max(0, k - 1)
-                                    end_idx = min(len(words), k + 2)
-                                    potential_date = ' '.join(words[start_idx:end_idx])
-                                    print(f"Intentando parsear fecha: {potential_date}")
-                                    parsed_date = parse_date(potential_date)
-                                    if parsed_date:
-                                        fecha_requerida = parsed_date
-                                        print(f"¡Fecha encontrada y parseada!: {fecha_requerida}")
-                                        break
-                            if fecha_requerida:
-                                break
-                        if fecha_requerida:
-                            break
-                
-                # Luego procesamos las líneas de Material
-                for i, line in enumerate(lines):  # CORRECCIÓN: Este bucle debe estar dentro del bucle de páginas
-                    if "Material" in line:
-                        try:
-                            parts = line.split()
-                            precio_str = next((p for p in parts if '$' in p), "$0")
-                            impuesto_str = next((p for p in reversed(parts) if '$' in p), "$0")
-                            
-                            # Crear el registro
-                            num_pieza = convert_to_number(parts[2])
-                            
-                            data_entry = {
-                                "Numero de Pedido": pedido_number,
-                                "Numero de linea": convert_to_number(parts[0]),
-                                "Numero de repartos": convert_to_number(parts[1]),
-                                "Nº de pieza": num_pieza,
-                                "pieza de cliente": convert_to_number(parts[3]),
-                                "Tipo": "Material",
-                                "Devolución": 1,
-                                "Fecha": fecha_requerida if fecha_requerida else "Sin fecha",
-                                "Descripcion": "Arrastre/M (SER)",
-                                "Cantidad": "(SER)",
-                                "Precio por unidad": '{:.2f}'.format(format_currency(precio_str)),
-                                "Subtotal": '{:.2f}'.format(format_currency(precio_str)),
-                                "Impuesto": '{:.2f}'.format(format_currency(impuesto_str))
-                            }
-                            
-                            # Siempre agregar al reporte
-                            report_data.append(data_entry)
-                            
-                            # Solo agregar al Excel si no es duplicado
-                            if (num_pieza, pedido_number) not in existing_pieces:
-                                data.append(data_entry)
-                                existing_pieces.add((num_pieza, pedido_number))
-                            else:
-                                print(f"Saltando registro duplicado - Pieza: {num_pieza}, Pedido: {pedido_number}")
-                        except Exception as e:
-                            print(f"Error procesando línea: {line} en {pdf_path}. Error: {str(e)}")
-                            continue
-        
-        return data, report_data
-    except Exception as e:
-        print(f"Error al abrir o procesar el archivo {pdf_path}: {e}")
-        return [], []
+def parse_texts(page_texts, malformed=None):
+    """Registros de un pedido a partir del texto ya extraído de sus páginas"""
+    pedido_number = find_pedido_number(page_texts[0] if page_texts else '')
+    return [entry for text in page_texts for entry in parse_page(text, pedido_number, malformed)]
+
+def malformed_report_lines(completed):
+    """Líneas para el log con las líneas de Material que no se pudieron leer, por pedido"""
+    # Los avances de versiones anteriores no traen 'malformadas'
+    documents = [(entry['documento'], entry.get('malformadas')) for entry in completed if entry.get('malformadas')]
+    if not documents:
+        return []
+    lines = [f"\nLíneas de Material con formato inesperado (no se extrajeron): "
+             f"{sum(len(bad) for _, bad in documents)}"]
+    for name, bad_lines in documents:
+        lines.append(f"- {name}:")
+        lines.extend(f"     {line}" for line in bad_lines)
+    return lines
 
 def collect_duplicates(all_data, duplicate_items):
     duplicate_analysis = {}
@@ -214,17 +144,9 @@ def collect_duplicates(all_data, duplicate_items):
         if pieza:
             if pieza not in pieza_ocurrencias:
                 pieza_ocurrencias[pieza] = []
-            # Convertir precio a float si es string
-            precio = registro.get('Precio por unidad')
-            if isinstance(precio, str):
-                try:
-                    precio = float(precio.replace(',', ''))
-                except (ValueError, TypeError):
-                    precio = 0.0
-            
             pieza_ocurrencias[pieza].append({
                 'pedido': registro.get('Numero de Pedido'),
-                'precio': precio,  # Ahora siempre será float
+                'precio': to_cents(registro.get('Precio por unidad')),  # Centavos enteros o None
                 'descripcion': registro.get('Descripcion')
             })
     
@@ -267,16 +189,10 @@ def generate_duplicate_report(duplicate_analysis):
         
         # Detalles de cada ocurrencia
         report_lines.append("\nDetalles de ocurrencias:")
-        # Convertir valores antes de ordenar
+        # Normalizar valores antes de ordenar; los precios ya son centavos enteros
         ocurrencias_normalizadas = []
         for ocurrencia in info['ocurrencias']:
-            precio = ocurrencia['precio']
-            if isinstance(precio, str):
-                try:
-                    precio = float(precio.replace('$', '').replace(',', ''))
-                except (ValueError, TypeError):
-                    precio = 0.0
-                    
+            precio = to_cents(ocurrencia['precio'])
             pedido = ocurrencia['pedido']
             if isinstance(pedido, str):
                 try:
@@ -287,26 +203,107 @@ def generate_duplicate_report(duplicate_analysis):
             ocurrencias_normalizadas.append({
                 'pedido': pedido,
                 'precio': precio,
-                'pedido_original': ocurrencia['pedido'],
-                'precio_original': ocurrencia['precio']
+                'pedido_original': ocurrencia['pedido']
             })
         
-        ocurrencias_ordenadas = sorted(ocurrencias_normalizadas, key=lambda x: (x['pedido'], x['precio']))
+        ocurrencias_ordenadas = sorted(ocurrencias_normalizadas,
+                                       key=lambda x: (x['pedido'], x['precio'] if x['precio'] is not None else -1))
         for ocurrencia in ocurrencias_ordenadas:
             report_lines.append(f"   - Pedido: {ocurrencia['pedido_original']}")
-            report_lines.append(f"     Precio: ${ocurrencia['precio_original']}")
+            report_lines.append(f"     Precio: ${format_cents(ocurrencia['precio'])}")
         
-        # Verificar diferencias en precios
-        precios = {o['precio'] for o in ocurrencias_normalizadas}
+        # Verificar diferencias en precios (comparación exacta en centavos)
+        precios = {o['precio'] for o in ocurrencias_normalizadas if o['precio'] is not None}
         if len(precios) > 1:
             report_lines.append("\n   ¡ALERTA! Diferentes precios encontrados:")
             for precio in sorted(precios):
-                report_lines.append(f"     - ${precio}")
+                report_lines.append(f"     - ${format_cents(precio)}")
     
     return "\n".join(report_lines)
 
-def extract_data(input_folder, output_json, output_excel, report_txt):
-    import time  # Agregar al inicio de la función
+def load_records(output_excel_path, index, pedidos, expedientes):
+    """Carga las particiones que contienen los pedidos/expedientes dados, con importes en centavos"""
+    partitions = store.partitions_for(index, pedidos, expedientes)
+    df_existing = store.load_partitions(output_excel_path, partitions)
+    print(f"Particiones cargadas: {', '.join(partitions) if partitions else 'ninguna'}")
+    # Los vacíos (<NA>, NaT) pasan a None para compararlos como en los registros recién extraídos
+    return df_existing.astype(object).where(df_existing.notna(), None).to_dict(orient='records')
+
+def merge_records(output_excel_path, new_data):
+    """
+    Agrega al almacén los registros nuevos que no existan ya en el historial. Para
+    deduplicar solo se leen las columnas clave de las particiones con sus pedidos/expedientes;
+    completas se cargan únicamente las particiones que reciben registros. Devuelve los
+    registros omitidos por duplicados (para el análisis del reporte) y el índice.
+    """
+    # Con el almacén bloqueado, los duplicados se buscan en la última versión de cada partición
+    with store.locked(output_excel_path):
+        index = store.load_index(output_excel_path)
+        partitions = store.partitions_for(index,
+                                          {r.get("Numero de Pedido") for r in new_data},
+                                          {r.get("Nº de pieza") for r in new_data})
+        keys = store.load_partitions(output_excel_path, partitions, store.KEY_COLUMNS)
+
+        # Solo agregar al Excel los registros que no existan ya en el historial
+        pairs = keys[["Nº de pieza", "Numero de Pedido"]]
+        existing_pieces = set(pairs.astype(object).where(pairs.notna(), None).itertuples(index=False, name=None))
+        added = []
+        skipped = []
+        for rec in new_data:
+            key = (schema.to_key(rec.get("Nº de pieza")), schema.to_key(rec.get("Numero de Pedido")))
+            if key in existing_pieces:
+                print(f"Saltando registro duplicado - Pieza: {key[0]}, Pedido: {key[1]}")
+                skipped.append(rec)
+                continue
+            existing_pieces.add(key)
+            added.append(rec)
+        if not added:
+            return skipped, index
+
+        # Crear el DataFrame de los registros nuevos (importes en centavos, como en el almacén)
+        df = pd.DataFrame(added)
+        # Claves enteras, categorías y 'Fecha' como datetime ("Sin fecha" queda vacía y así se escribe)
+        schema.apply(df)
+
+        # Cada registro nuevo va a su partición (mes de 'Fecha'); esas se reescriben completas
+        store.assign_partitions(df, index)
+        df_existing = store.load_partitions(output_excel_path, sorted(df[store.PARTITION_COLUMN].unique()))
+        store.save_partitions(output_excel_path, pd.concat([df_existing, df], ignore_index=True), index)
+        return skipped, index
+
+def apply_chunk(output_excel_path, checkpoint_file, chunk_docs, seen, texts=None, malformed=None):
+    """
+    Guarda en el almacén los registros de un bloque de documentos [(nombre, registros)], indexa
+    su texto ({nombre: texto}, ver textindex.py) y después registra el bloque en el archivo de
+    avance junto con las líneas de Material que no se pudieron leer ({nombre: líneas}).
+    Devuelve las entradas del avance.
+    """
+    malformed = malformed or {}
+    skipped, _ = merge_records(output_excel_path, [rec for _, rows in chunk_docs for rec in rows])
+    skipped_ids = {id(rec) for rec in skipped}
+    digests = checkpoint.digests_by_name(seen)
+    entries = []
+    for name, rows in chunk_docs:
+        entries.append({
+            'documento': name,
+            'huella': digests.get(name),
+            'invalido': not rows,
+            'pedidos': sorted({store.normalize_key(r.get("Numero de Pedido")) for r in rows}),
+            'expedientes': sorted({store.normalize_key(r.get("Nº de pieza")) for r in rows}),
+            # Los registros omitidos no quedan en el almacén pero cuentan para el reporte de duplicados
+            'omitidos': [r for r in rows if id(r) in skipped_ids],
+            'malformadas': malformed.get(name, [])
+        })
+    texts = texts or {}
+    textindex.add_documents(output_excel_path, [
+        (entry['huella'], entry['documento'], 'extract', 'pedido', ', '.join(entry['pedidos']), texts[entry['documento']])
+        for entry in entries if entry['documento'] in texts])
+    checkpoint.append_checkpoint(checkpoint_file, entries)
+    print(f"Avance guardado: {len(entries)} documentos")
+    return entries
+
+def extract_data(input_folder, output_json, output_excel, report_txt, workers=1, chunk_size=checkpoint.CHUNK_SIZE,
+                 memory_limit=None, budget=None):
     # Extraer directorio base desde el archivo Excel para asegurar consistencia
     output_dir = os.path.dirname(output_excel)
     os.makedirs(output_dir, exist_ok=True)  # Asegurarse de que la carpeta de salida exista
@@ -316,33 +313,61 @@ def extract_data(input_folder, output_json, output_excel, report_txt):
     output_excel_path = output_excel
     report_file_path = report_txt
 
-    all_data = []  # Para el Excel
-    all_report_data = []  # Para el reporte
-    invalid_pdfs = []
-
-    # Cargar datos existentes
-    if os.path.exists(output_excel_path):
-        try:
-            df_existing = pd.read_excel(output_excel_path)
-            df_existing['Precio por unidad'] = pd.to_numeric(df_existing['Precio por unidad'], errors='coerce')
-            all_data.extend(df_existing.to_dict(orient='records'))
-            all_report_data.extend(df_existing.to_dict(orient='records'))
-        except Exception as e:
-            print(f"Error al leer {output_excel_path}: {e}")
-
-    pdf_files = [f for f in os.listdir(input_folder) if f.lower().endswith('.pdf')]
+    # Si una corrida anterior se interrumpió, se continúa desde su último bloque guardado
+    checkpoint_file = checkpoint.checkpoint_path(output_excel_path, 'extract')
+    completed = checkpoint.load_checkpoint(checkpoint_file)
+    seen = checkpoint.seen_digests(completed)
+
+    # La entrada puede ser una carpeta con PDFs y/o lotes ZIP/TAR, o un lote directamente
+    registry = inputs.registry_path(output_excel_path)
+    pdf_paths, archives = inputs.discover(input_folder, inputs.load_processed(registry, 'extract'))
+    failed_archives = []
+    aliases = {}  # Copias idénticas de un mismo PDF: se procesa solo la primera
     
-    for pdf_filename in pdf_files:
-        pdf_path = os.path.join(input_folder, pdf_filename)
-        print(f"Procesando {pdf_path}...")
-        excel_data, report_data = process_pdf(pdf_path, all_data)
-        if not excel_data and not report_data:
-            invalid_pdfs.append(pdf_filename)
-            continue
-        
-        all_data.extend(excel_data)  # Solo datos no duplicados para Excel
-        all_report_data.extend(report_data)  # Todos los datos para el reporte
-        time.sleep(0.5)
+    # Los registros se guardan por bloques: la memoria depende del tamaño del bloque y no del lote.
+    # La lectura y la extracción de texto de los siguientes PDFs avanzan mientras se parsea y guarda.
+    chunk_docs = []
+    chunk_texts = {}  # Texto de cada pedido del bloque para el índice de texto
+    chunk_malformed = {}  # Líneas de Material que no se pudieron leer, por pedido
+    # Las facturas, los PDFs escaneados y los dañados se reportan sin extraer su texto, y un
+    # PDF que pasa su tiempo límite queda en cuarentena sin detener el lote
+    classes = {}
+    quarantined = quarantine.load(output_excel_path, 'extract')
+    documents = pipeline.stream_documents(pdf_paths, archives, failed_archives, aliases, seen, workers, memory_limit,
+                                          accept={classify.PEDIDO}, classes=classes,
+                                          budget=budget, quarantined=quarantined)
+    for pdf_filename, pdf_path, page_texts, error in documents:
+        print(f"Procesando {pdf_filename}...")
+        if error:
+            print(f"Error al abrir o procesar el archivo {pdf_filename}: {error}")
+            report_data = []
+        else:
+            malformed = []
+            report_data = parse_texts(page_texts, malformed)
+            chunk_texts[pdf_filename] = '\n'.join(page_texts)
+            if malformed:
+                chunk_malformed[pdf_filename] = malformed
+        chunk_docs.append((pdf_filename, report_data))  # Todos los registros (el almacén deduplica)
+        if len(chunk_docs) >= chunk_size:
+            completed.extend(apply_chunk(output_excel_path, checkpoint_file, chunk_docs, seen, chunk_texts,
+                                         chunk_malformed))
+            chunk_docs = []
+            chunk_texts = {}
+            chunk_malformed = {}
+    if chunk_docs:
+        completed.extend(apply_chunk(output_excel_path, checkpoint_file, chunk_docs, seen, chunk_texts,
+                                     chunk_malformed))
+    quarantine.save(output_excel_path, 'extract', quarantined)
+
+    pdf_files = [entry['documento'] for entry in completed]
+    invalid_pdfs = [entry['documento'] for entry in completed if entry['invalido']]
+
+    # Registros de las particiones afectadas + los omitidos por duplicados (para el reporte)
+    index = store.load_index(output_excel_path)
+    all_data = load_records(output_excel_path, index,
+                            {p for entry in completed for p in entry['pedidos']},
+                            {e for entry in completed for e in entry['expedientes']})
+    all_report_data = all_data + [rec for entry in completed for rec in entry['omitidos']]
 
     # Crear lista de items duplicados para el reporte (incluye todos los duplicados)
     duplicate_items = []
@@ -375,31 +400,17 @@ def extract_data(input_folder, output_json, output_excel, report_txt):
                     if len(item['ocurrencias']) > 1]
 
     # Aplicar la conversión antes de guardar
-    all_data_safe = convert_datetime_to_str(all_data)
+    all_data_safe = convert_datetime_to_str(
+        [{k: v for k, v in rec.items() if k != store.PARTITION_COLUMN} for rec in all_data])
 
-    # 1. PRIMERO guardar JSON (asegurando que no hay objetos datetime)
+    # Guardar JSON de las particiones afectadas (asegurando que no hay objetos datetime)
     with open(output_json_path, 'w', encoding='utf-8') as json_file:
         json.dump(all_data_safe, json_file, ensure_ascii=False, indent=4)
 
-    # 2. DESPUÉS crear el DataFrame y procesar datos numéricos
-    df = pd.DataFrame(all_data)
-    numeric_columns = ['Precio por unidad', 'Subtotal', 'Impuesto']
-    for col in numeric_columns:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-    if "Numero de Pedido" in df.columns:
-        df["Numero de Pedido"] = pd.to_numeric(df["Numero de Pedido"], errors='coerce')
-
-    # 3. Convertir columna 'Fecha' a datetime para que Excel la reconozca correctamente
-    if 'Fecha' in df.columns:
-        # Crear una máscara para identificar fechas válidas en formato DD/MM/YYYY
-        fecha_valida = df['Fecha'].apply(lambda x: isinstance(x, str) and x != "Sin fecha" and "/" in x)
-        
-        # Convertir solo las fechas válidas a formato datetime
-        df.loc[fecha_valida, 'Fecha'] = pd.to_datetime(df.loc[fecha_valida, 'Fecha'], format="%d/%m/%Y", errors='coerce')
-
-    # 4. Guardar el Excel con las fechas ya convertidas
-    df.to_excel(output_excel_path, index=False)
+    # Lotes completos y PDFs sueltos con registros (estos últimos solo para poder archivarlos)
+    ok_names = [entry['documento'] for entry in completed if not entry['invalido']]
+    inputs.mark_processed(registry, 'extract', [a for a in archives if a not in failed_archives] +
+                          inputs.completed_pdfs(pdf_paths, ok_names, aliases))
 
     # Análisis de duplicados para el reporte
     duplicate_analysis = {
@@ -415,15 +426,21 @@ def extract_data(input_folder, output_json, output_excel, report_txt):
     # Crear el reporte de texto mejorado
     reporte_texto = []
     reporte_texto.append("=== REPORTE DE EXTRACCIÓN DE PDF ===\n")
-    reporte_texto.append(f"Total de PDFs encontrados: {len(pdf_files)}")
+    num_copias = sum(len(copias) for copias in aliases.values())
+    reporte_texto.append(f"Total de PDFs encontrados: {len(pdf_files) + num_copias}")
+    reporte_texto.append(f"PDFs únicos (sin copias idénticas): {len(pdf_files)}")
     reporte_texto.append(f"PDFs procesados con éxito: {len(pdf_files) - len(invalid_pdfs)}")
     reporte_texto.append(f"PDFs inválidos: {len(invalid_pdfs)}")
     if invalid_pdfs:
         reporte_texto.append("\nArchivos inválidos:")
         reporte_texto.append("   " + ", ".join(invalid_pdfs))
+    reporte_texto.extend(inputs.alias_report_lines(aliases))
+    reporte_texto.extend(classify.report_lines(classes))
+    reporte_texto.extend(quarantine.report_lines(quarantined))
+    reporte_texto.extend(malformed_report_lines(completed))
     
     reporte_texto.append(f"\nRegistros duplicados encontrados: {len(duplicate_items)}")
-    reporte_texto.append(f"Registros extraídos totales: {len(all_data)}\n")
+    reporte_texto.append(f"Registros extraídos totales: {store.total_rows(index)}\n")
     
     # Agregar el análisis de duplicados al reporte
     if duplicate_items:
@@ -437,12 +454,16 @@ def extract_data(input_folder, output_json, output_excel, report_txt):
     with open(report_file_path, 'w', encoding='utf-8') as rep_file:
         rep_file.write(reporte_texto)
 
-    print(f"Extracción completada. Se encontraron {len(all_data)} registros en total.")
+    # La corrida terminó: la siguiente empieza desde cero
+    checkpoint.clear_checkpoint(checkpoint_file)
+
+    print(f"Extracción completada. Se encontraron {store.total_rows(index)} registros en total.")
     print(f"Reporte guardado en: {report_file_path}")
 
 def convert_datetime_to_str(data):
     """
     Convierte cualquier objeto datetime a string en formato DD/MM/YYYY
+    y los importes en centavos a texto con dos decimales,
     manejando valores NaT y None
     """
     import datetime as dt
@@ -455,6 +476,8 @@ def convert_datetime_to_str(data):
         for key, value in record.items():
             if pd.isna(value):  # Maneja NaT, NaN, y None
                 new_record[key] = ''
+            elif key in MONEY_COLUMNS:
+                new_record[key] = format_cents(value)
             elif isinstance(value, (dt.datetime, pd.Timestamp)):
                 try:
                     new_record[key] = value.strftime('%d/%m/%Y')
@@ -467,34 +490,52 @@ def convert_datetime_to_str(data):
     return processed_data
 
 if __name__ == "__main__":
-    if len(sys.argv) != 4:
-        print("""
-=== Procesador de Pedidos de Compra ===
-
-Uso: python scripts/extract.py PDF-PEDIDOS output/data.xlsx output/log.txt
-
+    parser = argparse.ArgumentParser(
+        description="=== Procesador de Pedidos de Compra ===",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
 Estructura de carpetas:
-    PDF-PEDIDOS/      → Carpeta con los pedidos a procesar
+    PDF-PEDIDOS/      → Carpeta con los pedidos a procesar (PDFs y/o lotes .zip/.tar)
     output/           → Carpeta donde se guardan los resultados
         data.xlsx     → Excel con los datos
         log.txt       → Archivo de log del proceso
 
 Ejemplo:
     python scripts/extract.py PDF-PEDIDOS output/data.xlsx output/log.txt
-        """)
-        sys.exit(1)
-
-    input_folder = sys.argv[1]
-    output_excel = sys.argv[2]
-    report_txt = sys.argv[3]
+    python scripts/extract.py PDF-PEDIDOS output/data.xlsx output/log.txt --workers 4
+    python scripts/extract.py PDF-PEDIDOS/lote_pedidos.zip output/data.xlsx output/log.txt
+        """
+    )
+    parser.add_argument("input_folder", help="Carpeta PDF-PEDIDOS (o lote ZIP/TAR) con los pedidos a procesar")
+    parser.add_argument("output_excel", help="Ruta del archivo Excel (output/data.xlsx)")
+    parser.add_argument("report_txt", help="Ruta del archivo de log (output/log.txt)")
+    parser.add_argument("--workers", type=int,
+                        help="Procesos para extraer el texto de los PDFs; los pedidos grandes se reparten por páginas (default: según núcleos y memoria disponibles)")
+    parser.add_argument("--memoria_max", type=int,
+                        help="Tope de memoria de la corrida en MB; cerca del tope no se envían más documentos a los procesos (default: 80%% de la memoria disponible)")
+    parser.add_argument("--limite_documento", type=int, default=pipeline.DOCUMENT_SECONDS,
+                        help=f"Segundos base que puede tardar un pedido; al pasarlos se termina su proceso y queda en cuarentena (0 = sin límite; default: {pipeline.DOCUMENT_SECONDS})")
+    parser.add_argument("--limite_pagina", type=int, default=pipeline.PAGE_SECONDS,
+                        help=f"Segundos adicionales por cada página (default: {pipeline.PAGE_SECONDS})")
+    parser.add_argument("--bloque", type=int, default=checkpoint.CHUNK_SIZE,
+                        help=f"Documentos por bloque guardado; una corrida interrumpida continúa desde el último bloque (default: {checkpoint.CHUNK_SIZE})")
+    args = parser.parse_args()
+
+    input_folder = args.input_folder
+    output_excel = args.output_excel
+    report_txt = args.report_txt
 
     print("\n=== Iniciando Procesamiento de Pedidos ===")
     print(f"Carpeta de pedidos: {input_folder}")
     print(f"Archivo Excel: {output_excel}")
     print(f"Archivo de log: {report_txt}")
+    memory_limit = scheduler.memory_limit(args.memoria_max)
+    workers = args.workers or scheduler.auto_workers(memory_limit)
+    print(scheduler.describe(workers, memory_limit))
 
     # Se crea un JSON temporal para almacenar datos acumulados
     output_dir = os.path.dirname(output_excel)
     output_json = os.path.join(output_dir, "output_temp.json")
 
-    extract_data(input_folder, output_json, output_excel, report_txt)
\ No newline at end of file
+    extract_data(input_folder, output_json, output_excel, report_txt, workers, args.bloque, memory_limit,
+                 pipeline.time_budget(args.limite_documento, args.limite_pagina))
@@ -0,0 +1,340 @@
+import io
+import sys
+import hashlib
+import os
+import json
+import shutil
+import argparse
+import tarfile
+import zipfile
+from datetime import datetime
+import store
+
+# Lotes comprimidos que se aceptan como entrada (además de PDFs sueltos)
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+REGISTRY_FILE = 'lotes_procesados.json'
+# Subcarpeta de cada carpeta de entrada donde se archivan los documentos ya aplicados (archive/2026/10/)
+ARCHIVE_DIR = 'archive'
+
+def is_pdf(name):
+    return name.lower().endswith('.pdf')
+
+def is_archive(name):
+    return name.lower().endswith(ARCHIVE_EXTENSIONS)
+
+def is_xml(name):
+    return name.lower().endswith('.xml')
+
+def companion_xml(pdf_path):
+    """XML con el mismo nombre que un PDF suelto (el CFDI timbrado de una factura), o None"""
+    stem = os.path.splitext(pdf_path)[0]
+    for ext in ('.xml', '.XML'):
+        if os.path.isfile(stem + ext):
+            return stem + ext
+    return None
+
+def archive_fingerprint(path, st=None):
+    """
+    Huella barata de un lote o PDF (tamaño y fecha de modificación): no lee su contenido.
+    `st` permite reutilizar el stat que os.scandir ya obtuvo.
+    """
+    st = st or os.stat(path)
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+def registry_path(excel_path):
+    return os.path.join(store.partition_dir(excel_path), REGISTRY_FILE)
+
+def load_processed(registry, stage):
+    """Lotes ya procesados por una etapa (extract, detect, detect2): {nombre: huella}"""
+    if not os.path.exists(registry):
+        return {}
+    with open(registry, encoding='utf-8') as f:
+        return json.load(f).get(stage, {})
+
+def mark_processed(registry, stage, archives):
+    """
+    Registra los lotes (y PDFs sueltos) procesados por una etapa; se llama después de
+    guardar resultados. Los lotes registrados se omiten en corridas posteriores; los PDFs
+    sueltos solo se registran para poder archivarlos (ver archive_processed).
+    """
+    if not archives:
+        return
+    # Las etapas comparten el registro y pueden terminar a la vez
+    with store.locked_dir(os.path.dirname(registry) or '.'):
+        data = _load_registry(registry)
+        processed = data.setdefault(stage, {})
+        for archive in archives:
+            processed[os.path.basename(archive)] = archive_fingerprint(archive)
+        _save_registry(registry, data)
+
+def _load_registry(registry):
+    if not os.path.exists(registry):
+        return {}
+    with open(registry, encoding='utf-8') as f:
+        return json.load(f)
+
+def _save_registry(registry, data):
+    os.makedirs(os.path.dirname(registry) or '.', exist_ok=True)
+    tmp_path = registry + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, registry)
+
+def _scan(folder):
+    """Archivos de una carpeta (sin subcarpetas) como DirEntry, en orden por nombre"""
+    with os.scandir(folder) as entries:
+        return sorted((e for e in entries if e.is_file()), key=lambda e: e.name)
+
+def discover(input_path, processed_archives=None, include_archived=False):
+    """
+    Busca los documentos de entrada: input_path puede ser una carpeta (con PDFs y/o lotes
+    comprimidos) o un lote comprimido. Devuelve (pdfs, archives) con las rutas de los PDFs
+    sueltos y de los lotes pendientes; los lotes con la misma huella ya registrada se omiten.
+    La carpeta se lee con os.scandir y la huella usa el stat que ya trae cada entrada; la
+    subcarpeta archive/ solo se recorre con include_archived.
+    """
+    processed_archives = processed_archives or {}
+    if os.path.isdir(input_path):
+        entries = _scan(input_path)
+        if include_archived:
+            entries += _scan_archived(input_path)
+        pdfs = [e.path for e in entries if is_pdf(e.name)]
+        candidates = [(e.path, e.stat()) for e in entries if is_archive(e.name)]
+    elif is_archive(input_path):
+        pdfs, candidates = [], [(input_path, None)]
+    else:
+        pdfs, candidates = ([input_path] if is_pdf(input_path) else []), []
+
+    archives = []
+    for archive, st in candidates:
+        if processed_archives.get(os.path.basename(archive)) == archive_fingerprint(archive, st):
+            print(f"Lote ya procesado, se omite: {os.path.basename(archive)}")
+            continue
+        archives.append(archive)
+    return pdfs, archives
+
+def _scan_archived(input_path):
+    archive_root = os.path.join(input_path, ARCHIVE_DIR)
+    entries = []
+    if os.path.isdir(archive_root):
+        for year in _scan_dirs(archive_root):
+            for month in _scan_dirs(year.path):
+                entries += _scan(month.path)
+    return entries
+
+def _scan_dirs(folder):
+    with os.scandir(folder) as entries:
+        return sorted((e for e in entries if e.is_dir()), key=lambda e: e.name)
+
+def completed_pdfs(pdf_paths, ok_names, aliases):
+    """PDFs sueltos procesados con éxito, incluidas sus copias idénticas (para mark_processed)"""
+    ok = set(ok_names)
+    for name in list(ok):
+        ok.update(aliases.get(name, []))
+    return [path for path in pdf_paths if os.path.basename(path) in ok]
+
+def archive_processed(input_path, registry, stages, dry_run=False):
+    """
+    Mueve a input_path/archive/AAAA/MM/ los PDFs y lotes que todas las etapas indicadas ya
+    aplicaron con su huella actual. Sus resultados siguen en el almacén; el registro se
+    limpia para que no crezca con el historial. Devuelve los archivos movidos.
+    """
+    with store.locked_dir(os.path.dirname(registry) or '.'):
+        return _archive_processed(input_path, registry, stages, dry_run)
+
+def _archive_processed(input_path, registry, stages, dry_run):
+    data = _load_registry(registry)
+    processed = [data.get(stage, {}) for stage in stages]
+    now = datetime.now()
+    target_dir = os.path.join(input_path, ARCHIVE_DIR, f"{now:%Y}", f"{now:%m}")
+    moved = []
+    for entry in _scan(input_path):
+        if not (is_pdf(entry.name) or is_archive(entry.name)):
+            continue
+        fingerprint = archive_fingerprint(entry.path, entry.stat())
+        if not all(stage_files.get(entry.name) == fingerprint for stage_files in processed):
+            continue
+        moved.append(entry.name)
+        if dry_run:
+            continue
+        os.makedirs(target_dir, exist_ok=True)
+        target = os.path.join(target_dir, entry.name)
+        stem, ext = os.path.splitext(entry.name)
+        copy = 1
+        while os.path.exists(target):
+            target = os.path.join(target_dir, f"{stem} ({copy}){ext}")
+            copy += 1
+        # El XML de una factura se archiva junto con su PDF
+        xml = companion_xml(entry.path) if is_pdf(entry.name) else None
+        shutil.move(entry.path, target)
+        if xml:
+            shutil.move(xml, os.path.splitext(target)[0] + os.path.splitext(xml)[1])
+        for stage_files in processed:
+            stage_files.pop(entry.name, None)
+    if moved and not dry_run:
+        _save_registry(registry, data)
+    return moved
+
+def iter_archive(archive_path, companions=None):
+    """
+    Genera (nombre, BytesIO) por cada PDF de un lote ZIP/TAR leyendo los miembros en memoria,
+    sin desempacarlos a disco; el nombre es 'lote.zip:carpeta/factura.pdf'. En los ZIP los
+    miembros van de mayor a menor tamaño (en TAR se leen en orden, sin saltar en el archivo).
+    Con `companions`, el contenido del XML con el mismo nombre que un PDF queda en
+    companions[nombre del PDF] antes de generarlo.
+    """
+    archive_name = os.path.basename(archive_path)
+    if archive_path.lower().endswith('.zip'):
+        with zipfile.ZipFile(archive_path) as zf:
+            infos = [info for info in zf.infolist() if not info.is_dir()]
+            xmls = {_stem(info.filename): info for info in infos if is_xml(info.filename)}
+            for info in sorted(infos, key=lambda info: (-info.file_size, info.filename)):
+                if not is_pdf(info.filename):
+                    continue
+                name, source = _member(archive_name, info.filename, zf.read(info))
+                if companions is not None and _stem(info.filename) in xmls:
+                    companions[name] = zf.read(xmls[_stem(info.filename)])
+                yield name, source
+    else:
+        with tarfile.open(archive_path, 'r:*') as tf:
+            xmls = {}
+            if companions is not None:
+                # 'factura.pdf' suele ir antes que 'factura.xml': los XML se leen en una primera
+                # pasada (son pequeños) y los PDFs en la segunda
+                members = tf.getmembers()
+                stems = {_stem(member.name) for member in members if member.isfile() and is_pdf(member.name)}
+                for member in members:
+                    if member.isfile() and is_xml(member.name) and _stem(member.name) in stems:
+                        xmls[_stem(member.name)] = tf.extractfile(member).read()
+            for member in tf:
+                if not member.isfile() or not is_pdf(member.name):
+                    continue
+                name, source = _member(archive_name, member.name, tf.extractfile(member).read())
+                if _stem(member.name) in xmls:
+                    companions[name] = xmls.pop(_stem(member.name))
+                yield name, source
+
+def count_archive_pdfs(archive_path):
+    """PDFs de un lote ZIP/TAR contados por el nombre de sus miembros, sin leer su contenido"""
+    if archive_path.lower().endswith('.zip'):
+        with zipfile.ZipFile(archive_path) as zf:
+            return sum(1 for info in zf.infolist() if not info.is_dir() and is_pdf(info.filename))
+    with tarfile.open(archive_path, 'r:*') as tf:
+        return sum(1 for member in tf.getmembers() if member.isfile() and is_pdf(member.name))
+
+def _stem(member_name):
+    return os.path.splitext(member_name)[0].lower()
+
+def read_member(archive_path, member_name):
+    """Lee un solo PDF de un lote ZIP/TAR y lo devuelve como BytesIO (mismo nombre que iter_archive)"""
+    if archive_path.lower().endswith('.zip'):
+        with zipfile.ZipFile(archive_path) as zf:
+            data = zf.read(member_name)
+    else:
+        with tarfile.open(archive_path, 'r:*') as tf:
+            data = tf.extractfile(member_name).read()
+    return _member(os.path.basename(archive_path), member_name, data)[1]
+
+def _member(archive_name, member_name, data):
+    name = f"{archive_name}:{member_name}"
+    source = io.BytesIO(data)
+    source.name = name
+    return name, source
+
+def iter_documents(pdfs, archives, failed=None, companions=None):
+    """
+    Genera (nombre, origen) para cada documento: ruta de un PDF suelto o BytesIO de un lote.
+    Los lotes que no se pueden leer se agregan a `failed` para no registrarlos como procesados.
+    Con `companions`, el XML de cada factura (ruta o contenido) queda en companions[nombre].
+    """
+    for path in pdfs:
+        xml = companion_xml(path) if companions is not None else None
+        if xml:
+            companions[os.path.basename(path)] = xml
+        yield os.path.basename(path), path
+    for archive in archives:
+        try:
+            yield from iter_archive(archive, companions)
+        except (zipfile.BadZipFile, tarfile.TarError, OSError) as e:
+            print(f"Error al leer el lote {os.path.basename(archive)}: {e}")
+            if failed is not None:
+                failed.append(archive)
+
+def file_digest(source):
+    """SHA-256 del contenido de un documento (ruta en disco o BytesIO de un lote)"""
+    digest = hashlib.sha256()
+    if isinstance(source, io.BytesIO):
+        digest.update(source.getbuffer())
+    else:
+        with open(source, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+def unique_documents(documents, aliases, seen=None):
+    """
+    Filtra documentos con contenido idéntico: solo se genera la primera aparición de cada
+    contenido y los demás nombres se acumulan en aliases[nombre_original] para el log.
+    Así el costo de parsear crece con los documentos únicos y no con los archivos.
+    `seen` (huella → nombre) puede venir con los documentos ya aplicados (por una corrida
+    interrumpida o registrados en un índice); esos se omiten y se llena con las huellas de los nuevos.
+    """
+    seen = {} if seen is None else seen
+    for name, source in documents:
+        try:
+            digest = file_digest(source)
+        except OSError as e:
+            # Sin huella no se puede deduplicar; el parser reportará el error del archivo
+            print(f"No se pudo leer {name} para calcular su huella: {e}")
+            yield name, source
+            continue
+        if seen.get(digest) == name:
+            print(f"Ya aplicado, se omite: {name}")
+            continue
+        if digest in seen:
+            aliases.setdefault(seen[digest], []).append(name)
+            print(f"Documento idéntico a {seen[digest]}, se omite: {name}")
+            continue
+        seen[digest] = name
+        yield name, source
+
+def alias_report_lines(aliases):
+    """Líneas del log con los documentos idénticos y el archivo cuyo resultado comparten"""
+    if not aliases:
+        return []
+    lines = [f"\nDocumentos idénticos (procesados una sola vez): {sum(len(v) for v in aliases.values())}"]
+    for name, copies in aliases.items():
+        lines.append(f"- {name}")
+        for copy in copies:
+            lines.append(f"    = {copy}")
+    return lines
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Archivo de documentos - Mueve los PDFs ya aplicados a archive/AAAA/MM/.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Ejemplo de uso:
+    python scripts/inputs.py archivar PDF-PEDIDOS output/data.xlsx --etapas extract
+    python scripts/inputs.py archivar PDF-FACTURAS output/data.xlsx --etapas detect detect2
+
+Estructura de carpetas:
+    PDF-FACTURAS/
+        archive/2026/10/  → Facturas ya aplicadas por todas las etapas indicadas
+        """
+    )
+    parser.add_argument("accion", choices=["archivar"], help="Acción a realizar")
+    parser.add_argument("carpeta", help="Carpeta de entrada (PDF-PEDIDOS o PDF-FACTURAS)")
+    parser.add_argument("excel_path", help="Ruta del archivo Excel (output/data.xlsx)")
+    parser.add_argument("--etapas", nargs='+', required=True, choices=["extract", "detect", "detect2"],
+                        help="Etapas que deben haber aplicado un documento para archivarlo")
+    parser.add_argument("--simular", action="store_true", help="Solo lista lo que se movería")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.carpeta):
+        print(f"No existe la carpeta {args.carpeta}")
+        sys.exit(1)
+    moved = archive_processed(args.carpeta, registry_path(args.excel_path), args.etapas, args.simular)
+    for name in moved:
+        print(f"{'Se archivaría' if args.simular else 'Archivado'}: {name}")
+    print(f"Documentos {'por archivar' if args.simular else 'archivados'}: {len(moved)}")
@@ -0,0 +1,371 @@
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import argparse
+import threading
+from pdftext import read_page_texts
+import inputs
+import extract
+import detect
+import detect2
+import cfdi
+import classify
+import keyindex
+from money import invoice_totals
+
+# Cola de trabajos compartida (SQLite): varios procesos o máquinas que ven el mismo disco
+# toman documentos con un lease que renuevan mientras trabajan. Si un worker muere, su
+# lease vence y otro worker retoma el documento. Un solo paso 'aplicar' escribe al almacén.
+DEFAULT_DB = 'output/cola.sqlite'
+DEFAULT_LEASE = 120  # segundos
+MAX_INTENTOS = 3
+ESPERA_SIN_TRABAJO = 5  # segundos entre revisiones mientras otros workers tienen trabajos
+# Formatos que se analizan según la clase de la factura (ver classify.py)
+INVOICE_LAYOUTS = {
+    classify.FACTURA_A: ('A',),
+    classify.FACTURA_B: ('B',),
+    classify.DESCONOCIDO: ('A', 'B'),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trabajos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tipo TEXT NOT NULL,                 -- 'pedido' o 'factura'
+    origen TEXT NOT NULL,               -- ruta del PDF o del lote ZIP/TAR
+    miembro TEXT NOT NULL DEFAULT '',   -- PDF dentro del lote ('' si es un PDF suelto)
+    nombre TEXT NOT NULL,
+    huella TEXT NOT NULL,               -- SHA-256 del contenido
+    estado TEXT NOT NULL DEFAULT 'pendiente',
+    worker TEXT,
+    lease_hasta REAL,
+    intentos INTEGER NOT NULL DEFAULT 0,
+    resultado TEXT,
+    error TEXT,
+    actualizado REAL,
+    UNIQUE (tipo, huella)
+);
+CREATE INDEX IF NOT EXISTS trabajos_estado ON trabajos (estado, id);
+"""
+
+def connect(db_path):
+    """Abre la cola; las transacciones se controlan a mano (BEGIN IMMEDIATE al tomar trabajos)"""
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+    conn.executescript(SCHEMA)
+    return conn
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def enqueue(conn, tipo, input_path):
+    """
+    Agrega a la cola los PDFs de una carpeta o lote (los lotes se expanden en un trabajo
+    por PDF). Un contenido ya encolado, aunque venga con otro nombre, no se vuelve a agregar.
+    Devuelve (agregados, omitidos).
+    """
+    pdf_paths, archives = inputs.discover(input_path)
+    agregados = omitidos = 0
+    for name, source in inputs.iter_documents(pdf_paths, archives):
+        if isinstance(source, str):
+            origen, miembro = os.path.abspath(source), ''
+        else:
+            lote, miembro = name.split(':', 1)
+            origen = os.path.abspath(next(a for a in archives if os.path.basename(a) == lote))
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO trabajos (tipo, origen, miembro, nombre, huella, actualizado) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (tipo, origen, miembro, name, inputs.file_digest(source), time.time()))
+        if cursor.rowcount:
+            agregados += 1
+        else:
+            omitidos += 1
+            print(f"Ya estaba en la cola (mismo contenido), se omite: {name}")
+    return agregados, omitidos
+
+def claim(conn, worker, lease):
+    """
+    Toma el siguiente trabajo pendiente o con lease vencido. Los que ya agotaron sus
+    intentos (el worker murió con ellos varias veces) pasan a 'error'.
+    """
+    while True:
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id, tipo, origen, miembro, nombre, intentos FROM trabajos "
+                "WHERE estado = 'pendiente' OR (estado = 'en_proceso' AND lease_hasta < ?) "
+                "ORDER BY id LIMIT 1", (now,)).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            if row[5] >= MAX_INTENTOS:
+                conn.execute(
+                    "UPDATE trabajos SET estado = 'error', worker = NULL, lease_hasta = NULL, actualizado = ?, "
+                    "error = COALESCE(error, 'El worker se detuvo sin terminar') WHERE id = ?", (now, row[0]))
+                conn.execute("COMMIT")
+                print(f"Trabajo {row[0]} ({row[4]}) agotó sus {MAX_INTENTOS} intentos")
+                continue
+            conn.execute(
+                "UPDATE trabajos SET estado = 'en_proceso', worker = ?, lease_hasta = ?, "
+                "intentos = intentos + 1, actualizado = ? WHERE id = ?",
+                (worker, now + lease, now, row[0]))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return {'id': row[0], 'tipo': row[1], 'origen': row[2], 'miembro': row[3], 'nombre': row[4]}
+
+def heartbeat(db_path, job_id, worker, lease, stop, lost):
+    """Renueva el lease cada tercio de su duración hasta que termine el trabajo"""
+    conn = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+    try:
+        while not stop.wait(lease / 3):
+            cursor = conn.execute(
+                "UPDATE trabajos SET lease_hasta = ? WHERE id = ? AND worker = ? AND estado = 'en_proceso'",
+                (time.time() + lease, job_id, worker))
+            if not cursor.rowcount:
+                lost.set()
+                return
+    finally:
+        conn.close()
+
+def run_job(job):
+    """Procesa un documento y devuelve el resultado que se guardará en la cola (JSON)"""
+    if job['miembro']:
+        source = inputs.read_member(job['origen'], job['miembro'])
+    else:
+        source = job['origen']
+    if job['tipo'] == 'pedido':
+        # Un PDF que no se puede leer lanza la excepción: work() lo devuelve a la cola con fail()
+        malformadas = []
+        reporte = extract.parse_texts(read_page_texts(source), malformadas)
+        return {'reporte': reporte, 'malformadas': malformadas}
+    # Una factura suelta con su XML (CFDI) al lado se lee de él para ambos formatos
+    xml = inputs.companion_xml(source) if isinstance(source, str) else None
+    analisis = cfdi.for_invoice(job['nombre'], xml) if xml else None
+    if analisis is not None:
+        campos = invoice_fields(analisis)
+        return {'A': campos, 'B': campos}
+    # Como en detect.py y detect2.py, la clasificación previa decide qué formato se aplica: el
+    # otro analizador también encuentra los pedidos pero sin folio, y al aplicarlo borraría el
+    # folio y la fecha que escribió el primero
+    clase, detalle = classify.classify(source)
+    if clase not in INVOICE_LAYOUTS:
+        return {'clase': clase, 'detalle': classify.describe(clase, detalle)}
+    page_texts = read_page_texts(source)
+    analisis = {}
+    for layout, modulo in (('A', detect), ('B', detect2)):
+        if layout in INVOICE_LAYOUTS[clase]:
+            analisis[layout] = invoice_fields(modulo.analyze_invoice(page_texts))
+    # Sin marcas conocidas se aplica el formato que encontró folio; si ninguno, ambos
+    con_folio = {layout: campos for layout, campos in analisis.items() if campos['folio']}
+    return dict(con_folio or analisis, clase=clase)
+
+def invoice_fields(resultado):
+    """Lo que se guarda en la cola de una factura analizada: lo que se aplica y lo que usa la conciliación"""
+    campos = {k: resultado[k] for k in ('folio', 'fecha', 'orders', 'expedientes')}
+    campos.update(formato=resultado['layout'], totales=invoice_totals(resultado))
+    return campos
+
+def submit(conn, job_id, worker, resultado):
+    """Guarda el resultado solo si el trabajo sigue siendo de este worker"""
+    cursor = conn.execute(
+        "UPDATE trabajos SET estado = 'hecho', resultado = ?, error = NULL, lease_hasta = NULL, actualizado = ? "
+        "WHERE id = ? AND worker = ? AND estado = 'en_proceso'",
+        (json.dumps(resultado, ensure_ascii=False), time.time(), job_id, worker))
+    return cursor.rowcount == 1
+
+def fail(conn, job_id, worker, error):
+    """Devuelve el trabajo a la cola o lo marca como error si ya agotó sus intentos"""
+    conn.execute(
+        "UPDATE trabajos SET estado = CASE WHEN intentos >= ? THEN 'error' ELSE 'pendiente' END, "
+        "error = ?, worker = NULL, lease_hasta = NULL, actualizado = ? "
+        "WHERE id = ? AND worker = ? AND estado = 'en_proceso'",
+        (MAX_INTENTOS, error, time.time(), job_id, worker))
+
+def work(db_path, lease=DEFAULT_LEASE):
+    """
+    Toma y procesa trabajos hasta vaciar la cola. Mientras otros workers tengan trabajos
+    en proceso se sigue esperando, para retomar los suyos si su lease vence.
+    """
+    conn = connect(db_path)
+    worker = worker_id()
+    procesados = 0
+    while True:
+        job = claim(conn, worker, lease)
+        if job is None:
+            en_proceso = conn.execute("SELECT COUNT(*) FROM trabajos WHERE estado = 'en_proceso'").fetchone()[0]
+            if not en_proceso:
+                break
+            time.sleep(ESPERA_SIN_TRABAJO)
+            continue
+
+        print(f"[{worker}] Procesando {job['tipo']}: {job['nombre']}")
+        stop, lost = threading.Event(), threading.Event()
+        latido = threading.Thread(target=heartbeat, args=(db_path, job['id'], worker, lease, stop, lost), daemon=True)
+        latido.start()
+        try:
+            resultado = run_job(job)
+        except Exception as e:
+            print(f"Error al procesar {job['nombre']}: {e}")
+            fail(conn, job['id'], worker, str(e))
+            continue
+        finally:
+            stop.set()
+            latido.join()
+
+        if lost.is_set() or not submit(conn, job['id'], worker, resultado):
+            print(f"Se perdió el lease de {job['nombre']}; otro worker lo procesará y este resultado se descarta")
+            continue
+        procesados += 1
+    conn.close()
+    print(f"[{worker}] Cola vacía. Documentos procesados por este worker: {procesados}")
+    return procesados
+
+def apply_results(db_path, excel_path):
+    """
+    Aplica al almacén los resultados terminados, en orden de la cola: primero los
+    registros de pedidos y después las facturas (formato de detect.py y luego de detect2.py).
+    Los trabajos se marcan 'aplicado' al final; si el proceso muere antes, volver a aplicar
+    no duplica nada porque los registros se deduplican y los estatus se sobrescriben.
+    """
+    conn = connect(db_path)
+    rows = conn.execute(
+        "SELECT id, tipo, nombre, huella, resultado FROM trabajos WHERE estado = 'hecho' ORDER BY id").fetchall()
+    if not rows:
+        print("No hay resultados nuevos para aplicar.")
+        conn.close()
+        return 0
+
+    reporte, sin_registros, malformadas, descartadas = [], [], {}, []
+    orders_a, expedientes_a, invoice_numbers = [], [], {}
+    orders_b, expedientes_b, invoice_info = [], [], {}
+    facturas = []  # Lo leído de cada factura para la conciliación (ver keyindex.record_invoices)
+    for job_id, tipo, nombre, huella, resultado in rows:
+        resultado = json.loads(resultado)
+        if tipo == 'pedido':
+            if not resultado['reporte']:
+                sin_registros.append(nombre)
+            reporte.extend(resultado['reporte'])
+            if resultado.get('malformadas'):
+                malformadas[nombre] = resultado['malformadas']
+            continue
+        if 'detalle' in resultado:
+            descartadas.append(f"{nombre}: clasificado como {resultado['detalle']}")
+        # Cada factura trae solo los formatos que le corresponden
+        a, b = resultado.get('A'), resultado.get('B')
+        if a:
+            for ref in a['orders'] + a['expedientes']:
+                if a['folio']:
+                    invoice_numbers[ref] = a['folio']
+            orders_a.extend(a['orders'])
+            expedientes_a.extend(a['expedientes'])
+        if b:
+            for ref in b['orders'] + b['expedientes']:
+                if b['folio']:
+                    invoice_info[ref] = {'folio': b['folio'], 'fecha': b['fecha'] or ''}
+            orders_b.extend(b['orders'])
+            expedientes_b.extend(b['expedientes'])
+        # Con ambos formatos se registra el mismo que elegiría reconcile.choose_layout
+        if a and b:
+            elegido = b if b['folio'] or not a['folio'] and (b['orders'] or b['expedientes']) else a
+        else:
+            elegido = a or b
+        if elegido:
+            facturas.append(dict(elegido, documento=nombre, huella=huella))
+
+    if reporte:
+        print(f"Aplicando {len(reporte)} registros de pedidos...")
+        extract.merge_records(excel_path, reporte)
+    if orders_a or expedientes_a:
+        detect.update_excel_with_status(excel_path, list(set(orders_a)), list(set(expedientes_a)), invoice_numbers)
+    if orders_b or expedientes_b:
+        detect2.update_excel_with_status(excel_path, list(set(orders_b)), list(set(expedientes_b)), invoice_info)
+    keyindex.record_invoices(excel_path, 'cola', facturas)
+
+    ids = [row[0] for row in rows]
+    conn.execute("BEGIN IMMEDIATE")
+    conn.executemany("UPDATE trabajos SET estado = 'aplicado', actualizado = ? WHERE id = ? AND estado = 'hecho'",
+                     [(time.time(), job_id) for job_id in ids])
+    conn.execute("COMMIT")
+    conn.close()
+
+    print(f"Trabajos aplicados: {len(ids)}")
+    if sin_registros:
+        print("Pedidos sin registros (revisar):")
+        for nombre in sin_registros:
+            print(f"- {nombre}")
+    if descartadas:
+        print("Facturas descartadas por la clasificación previa (revisar):")
+        for linea in descartadas:
+            print(f"- {linea}")
+    for line in extract.malformed_report_lines(
+            [{'documento': nombre, 'malformadas': lineas} for nombre, lineas in malformadas.items()]):
+        print(line)
+    return len(ids)
+
+def print_status(db_path):
+    conn = connect(db_path)
+    print("=== ESTADO DE LA COLA ===")
+    for tipo, estado, total in conn.execute(
+            "SELECT tipo, estado, COUNT(*) FROM trabajos GROUP BY tipo, estado ORDER BY tipo, estado"):
+        print(f"{tipo:8} {estado:11} {total}")
+    now = time.time()
+    for nombre, worker, lease_hasta in conn.execute(
+            "SELECT nombre, worker, lease_hasta FROM trabajos WHERE estado = 'en_proceso' ORDER BY id"):
+        vencido = " (lease vencido)" if lease_hasta < now else ""
+        print(f"En proceso: {nombre} - {worker}{vencido}")
+    for nombre, intentos, error in conn.execute(
+            "SELECT nombre, intentos, error FROM trabajos WHERE estado = 'error' ORDER BY id"):
+        print(f"Error: {nombre} ({intentos} intentos): {error}")
+    conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Cola de trabajos - Reparte los PDFs de una corrida entre varios procesos o máquinas.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Ejemplo de uso:
+    python scripts/jobs.py encolar --pedidos PDF-PEDIDOS --facturas PDF-FACTURAS
+    python scripts/jobs.py trabajar                  (en cada proceso o máquina)
+    python scripts/jobs.py aplicar output/data.xlsx  (una sola vez, al terminar)
+    python scripts/jobs.py estado
+
+Estructura de carpetas:
+    output/
+        cola.sqlite   → Cola de trabajos compartida (debe estar en el disco común)
+        data/         → Particiones mensuales que actualiza 'aplicar'
+        """
+    )
+    parser.add_argument("accion", choices=["encolar", "trabajar", "aplicar", "estado"], help="Acción a realizar")
+    parser.add_argument("excel_path", nargs='?', help="Ruta del archivo Excel (output/data.xlsx), para 'aplicar'")
+    parser.add_argument("--db", default=DEFAULT_DB, help=f"Ruta de la cola (default: {DEFAULT_DB})")
+    parser.add_argument("--pedidos", help="Carpeta PDF-PEDIDOS (o lote ZIP/TAR) a encolar")
+    parser.add_argument("--facturas", help="Carpeta PDF-FACTURAS (o lote ZIP/TAR) a encolar")
+    parser.add_argument("--lease", type=int, default=DEFAULT_LEASE,
+                        help=f"Segundos que dura el lease de un trabajo sin renovarse (default: {DEFAULT_LEASE})")
+    args = parser.parse_args()
+
+    if args.accion == "encolar":
+        if not args.pedidos and not args.facturas:
+            parser.error("encolar requiere --pedidos y/o --facturas")
+        conn = connect(args.db)
+        for tipo, carpeta in (('pedido', args.pedidos), ('factura', args.facturas)):
+            if carpeta:
+                agregados, omitidos = enqueue(conn, tipo, carpeta)
+                print(f"{carpeta}: {agregados} documentos encolados, {omitidos} ya estaban en la cola")
+        conn.close()
+    elif args.accion == "trabajar":
+        work(args.db, args.lease)
+    elif args.accion == "aplicar":
+        if not args.excel_path:
+            parser.error("aplicar requiere la ruta del Excel (output/data.xlsx)")
+        apply_results(args.db, args.excel_path)
+    else:
+        if not os.path.exists(args.db):
+            print(f"No existe la cola {args.db}")
+            sys.exit(1)
+        print_status(args.db)
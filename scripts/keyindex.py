@@ -0,0 +1,201 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+
+# Índice de claves junto a las particiones (output/data/claves.sqlite): por cada fila guarda
+# pedido, expediente, factura y estatus con su partición y número de fila en el libro.
+# Se actualiza cada vez que store.save_partitions reescribe una partición. Este módulo no
+# usa pandas para que las consultas desde la línea de comandos respondan al instante.
+# Las tablas facturas y referencias guardan lo que detect.py, detect2.py y jobs.py leyeron de
+# cada factura aplicada (folio, fecha, totales y pedidos/expedientes): reconcile.py cruza contra
+# ellas sin volver a extraer el texto de las facturas ya aplicadas, aunque estén archivadas.
+KEY_INDEX_FILE = 'claves.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS filas (
+    particion TEXT NOT NULL,
+    fila INTEGER NOT NULL,          -- fila en el libro de la partición (la 1 es el encabezado)
+    pedido TEXT,
+    expediente TEXT,
+    factura TEXT,
+    status TEXT
+);
+CREATE INDEX IF NOT EXISTS filas_pedido ON filas (pedido);
+CREATE INDEX IF NOT EXISTS filas_expediente ON filas (expediente);
+CREATE INDEX IF NOT EXISTS filas_factura ON filas (factura);
+CREATE INDEX IF NOT EXISTS filas_particion ON filas (particion);
+CREATE TABLE IF NOT EXISTS facturas (
+    huella TEXT PRIMARY KEY,        -- SHA-256 del PDF (ver inputs.file_digest)
+    archivo TEXT NOT NULL,
+    etapa TEXT,
+    formato TEXT,
+    folio TEXT,
+    fecha TEXT,                     -- fecha de emisión como la escribe detect2.py (dd/mm/aaaa)
+    subtotal INTEGER,               -- importes en centavos
+    impuesto INTEGER,
+    total INTEGER
+);
+CREATE INDEX IF NOT EXISTS facturas_archivo ON facturas (archivo);
+CREATE TABLE IF NOT EXISTS referencias (
+    huella TEXT NOT NULL,
+    tipo TEXT NOT NULL,             -- 'pedido' o 'expediente'
+    referencia TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS referencias_huella ON referencias (huella);
+"""
+
+def key_index_path(excel_path):
+    # Misma carpeta que store.partition_dir (sin importar store, que carga pandas)
+    return os.path.join(os.path.splitext(excel_path)[0], KEY_INDEX_FILE)
+
+def connect(excel_path):
+    conn = sqlite3.connect(key_index_path(excel_path), timeout=60)
+    conn.executescript(SCHEMA)
+    return conn
+
+def update_partitions(excel_path, rows_by_partition):
+    """
+    Reemplaza en el índice las filas de las particiones dadas ({partición: [(fila, pedido,
+    expediente, factura, status), ...]}) en una sola transacción
+    """
+    if not rows_by_partition:
+        return
+    conn = connect(excel_path)
+    try:
+        with conn:
+            for name, rows in rows_by_partition.items():
+                conn.execute("DELETE FROM filas WHERE particion = ?", (name,))
+                conn.executemany(
+                    "INSERT INTO filas (particion, fila, pedido, expediente, factura, status) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(name,) + tuple(row) for row in rows])
+    finally:
+        conn.close()
+
+def record_invoices(excel_path, etapa, entries):
+    """
+    Guarda el resultado de las facturas aplicadas: entradas como las de detect.py ('huella',
+    'documento', 'formato', 'folio', 'fecha', 'totales', 'orders', 'expedientes'). Las que no
+    tienen huella o formato (no se pudieron analizar) se omiten; una factura ya registrada, o
+    otra con el mismo nombre de archivo, se reemplaza.
+    """
+    entries = [entry for entry in entries if entry.get('huella') and entry.get('formato')]
+    if not entries:
+        return
+    os.makedirs(os.path.dirname(key_index_path(excel_path)), exist_ok=True)
+    conn = connect(excel_path)
+    try:
+        with conn:
+            for entry in entries:
+                anteriores = [row[0] for row in conn.execute(
+                    "SELECT huella FROM facturas WHERE huella = ? OR archivo = ?", (entry['huella'], entry['documento']))]
+                conn.executemany("DELETE FROM referencias WHERE huella = ?", [(h,) for h in anteriores])
+                conn.executemany("DELETE FROM facturas WHERE huella = ?", [(h,) for h in anteriores])
+                totales = entry.get('totales') or {}
+                conn.execute(
+                    "INSERT INTO facturas (huella, archivo, etapa, formato, folio, fecha, subtotal, impuesto, total) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (entry['huella'], entry['documento'], etapa, entry['formato'], entry['folio'] or None,
+                     entry.get('fecha') or None, totales.get('subtotal'), totales.get('impuesto'), totales.get('total')))
+                conn.executemany(
+                    "INSERT INTO referencias (huella, tipo, referencia) VALUES (?, ?, ?)",
+                    [(entry['huella'], 'pedido', ref) for ref in dict.fromkeys(entry['orders'])] +
+                    [(entry['huella'], 'expediente', ref) for ref in dict.fromkeys(entry['expedientes'])])
+    finally:
+        conn.close()
+
+def load_invoices(excel_path):
+    """
+    Facturas registradas con record_invoices: devuelve (facturas, referencias) como listas de
+    tuplas (huella, archivo, formato, folio, fecha, subtotal, impuesto, total) y
+    (archivo, folio, tipo, referencia). Sin índice, ambas vacías.
+    """
+    if not os.path.exists(key_index_path(excel_path)):
+        return [], []
+    conn = connect(excel_path)
+    try:
+        facturas = conn.execute(
+            "SELECT huella, archivo, formato, folio, fecha, subtotal, impuesto, total FROM facturas "
+            "ORDER BY archivo").fetchall()
+        referencias = conn.execute(
+            "SELECT f.archivo, f.folio, r.tipo, r.referencia FROM referencias r JOIN facturas f USING (huella) "
+            "ORDER BY f.archivo, r.rowid").fetchall()
+        return facturas, referencias
+    finally:
+        conn.close()
+
+def lookup(excel_path, keys):
+    """Filas cuyo pedido, expediente o número de factura coincide con alguna de las claves"""
+    conn = sqlite3.connect(f"file:{key_index_path(excel_path)}?mode=ro", uri=True)
+    try:
+        marks = ', '.join('?' for _ in keys)
+        return conn.execute(
+            f"SELECT pedido, expediente, factura, status, particion, fila FROM filas "
+            f"WHERE pedido IN ({marks}) OR expediente IN ({marks}) OR factura IN ({marks}) "
+            f"ORDER BY particion, fila", list(keys) * 3).fetchall()
+    finally:
+        conn.close()
+
+def stale_partitions(excel_path):
+    """Particiones cuyo número de filas en indice.json no coincide con el índice de claves"""
+    index_file = os.path.join(os.path.splitext(excel_path)[0], 'indice.json')
+    if not os.path.exists(index_file):
+        return []
+    with open(index_file, encoding='utf-8') as f:
+        particiones = json.load(f)['particiones']
+    conn = sqlite3.connect(f"file:{key_index_path(excel_path)}?mode=ro", uri=True)
+    try:
+        counts = dict(conn.execute("SELECT particion, COUNT(*) FROM filas GROUP BY particion"))
+    finally:
+        conn.close()
+    return sorted(name for name, info in particiones.items() if counts.get(name, 0) != info['filas'])
+
+def normalize(key):
+    key = key.strip()
+    return key[:-2] if key.endswith('.0') else key
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Consulta de claves - Busca pedidos, expedientes o facturas sin abrir el Excel.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Ejemplo de uso:
+    python scripts/keyindex.py 5100912345
+    python scripts/keyindex.py 12345678 A1234 --excel output/data.xlsx
+
+Estructura de carpetas:
+    output/
+        data/
+            claves.sqlite → Índice de claves (se actualiza con cada corrida)
+
+Si el índice no existe o está desactualizado:
+    python scripts/store.py reindexar output/data.xlsx
+        """
+    )
+    parser.add_argument("claves", nargs='+', help="Números de pedido, expediente o factura a buscar")
+    parser.add_argument("--excel", default="output/data.xlsx",
+                        help="Ruta del archivo Excel (default: output/data.xlsx)")
+    args = parser.parse_args()
+
+    if not os.path.exists(key_index_path(args.excel)):
+        print(f"No existe el índice de claves {key_index_path(args.excel)}")
+        print(f"Créelo con: python scripts/store.py reindexar {args.excel}")
+        sys.exit(1)
+
+    inicio = time.perf_counter()
+    keys = [normalize(key) for key in args.claves]
+    rows = lookup(args.excel, keys)
+    for pedido, expediente, factura, status, particion, fila in rows:
+        print(f"Pedido {pedido or '-'} | Expediente {expediente or '-'} | Factura {factura or '-'} | "
+              f"Status {status or '-'} | {os.path.splitext(args.excel)[0]}/{particion}.xlsx fila {fila}")
+    encontradas = {value for row in rows for value in row[:3]}
+    for key in keys:
+        if key not in encontradas:
+            print(f"Sin resultados: {key}")
+    print(f"{len(rows)} filas en {(time.perf_counter() - inicio) * 1000:.1f} ms")
+
+    stale = stale_partitions(args.excel)
+    if stale:
+        print(f"⚠️  Índice desactualizado en: {', '.join(stale)} (python scripts/store.py reindexar {args.excel})")
@@ -0,0 +1,76 @@
+import re
+from decimal import Decimal, ROUND_HALF_UP
+import pandas as pd
+
+# Columnas de importes; en memoria siempre son centavos enteros (int64)
+MONEY_COLUMNS = ['Precio por unidad', 'Subtotal', 'Impuesto']
+
+def parse_cents(value_str):
+    """
+    Convierte un importe de texto ('$1,234.56', '1.234,56 MXN', '$850') a centavos enteros.
+    El separador decimal es el último que aparece; con solo comas, la coma es decimal.
+    """
+    try:
+        clean_value = value_str.replace('$', '').replace('MXN', '').strip()
+        if '.' in clean_value and ',' in clean_value:
+            if clean_value.rfind(',') > clean_value.rfind('.'):
+                clean_value = clean_value.replace('.', '').replace(',', '.')
+            else:
+                clean_value = clean_value.replace(',', '')
+        elif ',' in clean_value:
+            clean_value = clean_value.replace(',', '.')
+        return int((Decimal(clean_value) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+    except Exception as e:
+        print(f"Error en parse_cents: {e} para valor: {value_str}")
+        return 0
+
+def to_cents(value):
+    """Convierte un valor suelto (centavos, pesos numéricos o texto) a centavos, o None si falta"""
+    if value is None or value is pd.NA:
+        return None
+    if isinstance(value, str):
+        return parse_cents(value) if value.strip() else None
+    if isinstance(value, float):
+        if value != value:  # NaN
+            return None
+        return int((Decimal(str(value)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+    return int(value)
+
+def format_cents(cents):
+    """Formatea centavos como texto con dos decimales ('1234.56'); vacío si falta el valor"""
+    if cents is None or pd.isna(cents):
+        return ''
+    cents = int(cents)
+    sign = '-' if cents < 0 else ''
+    return f"{sign}{abs(cents) // 100}.{abs(cents) % 100:02d}"
+
+def pesos_to_cents(serie):
+    """Convierte una columna en pesos (tal como se lee del Excel) a centavos Int64 en una pasada"""
+    pesos = pd.to_numeric(serie, errors='coerce').astype('float64')
+    return (pesos * 100).round().astype('Int64')
+
+def cents_to_pesos(serie):
+    """Convierte una columna de centavos a pesos para exportar; solo se usa al escribir"""
+    return pd.to_numeric(serie, errors='coerce').astype('float64') / 100
+
+# Renglones de totales de una factura CFDI ("Subtotal $1,000.00", "IVA 16% $160.00", "Total $1,160.00")
+TOTAL_PATTERNS = {
+    'subtotal': re.compile(r'\bSUB\s?-?\s?TOTAL\b[^\d$\n]*\$?\s*(\d[\d.,]*\d)', re.IGNORECASE),
+    'impuesto': re.compile(r'\b(?:IVA|I\.V\.A\.|IMPUESTOS?\s+TRASLADADOS?)[^$\n]*\$\s*(\d[\d.,]*\d)', re.IGNORECASE),
+    'total': re.compile(r'(?<!SUB)(?<!SUB )(?<!SUB-)\bTOTAL\b[^\d$\n]*\$?\s*(\d[\d.,]*\d)', re.IGNORECASE),
+}
+
+def find_invoice_totals(text):
+    """
+    Busca en el texto de una factura el subtotal, el impuesto trasladado y el total,
+    en centavos; se toma la última aparición de cada renglón (None si no aparece)
+    """
+    totals = {}
+    for name, pattern in TOTAL_PATTERNS.items():
+        matches = pattern.findall(text)
+        totals[name] = parse_cents(matches[-1]) if matches else None
+    return totals
+
+def invoice_totals(result):
+    """Totales en centavos de una factura analizada: los de su XML (CFDI) o los que trae su texto"""
+    return result.get('totals') or find_invoice_totals(result['text'])
@@ -0,0 +1,70 @@
+import io
+import atexit
+from concurrent.futures import ProcessPoolExecutor
+try:
+    import pypdfium2 as pdfium  # Se instala con pdfplumber; cuenta páginas sin recorrer el documento
+except ImportError:
+    pdfium = None
+import pdfplumber
+
+_pool = None
+
+def read_page_texts(source):
+    """
+    Abre un PDF (ruta o archivo en memoria) y devuelve el texto de cada página;
+    las páginas sin texto quedan como cadena vacía
+    """
+    with pdfplumber.open(source) as pdf:
+        return [page.extract_text() or '' for page in pdf.pages]
+
+def get_pool(workers):
+    """Pool de procesos compartido por todos los documentos de la corrida"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=workers)
+        atexit.register(_pool.shutdown)
+    return _pool
+
+def restart_pool():
+    """
+    Termina los procesos del pool (p. ej. uno atorado en un PDF) y crea otro con el mismo
+    número de procesos. Los trabajos que estaban en el pool anterior fallan con
+    BrokenProcessPool y hay que volver a enviarlos.
+    """
+    global _pool
+    workers = _pool._max_workers if _pool is not None else 1
+    if _pool is not None:
+        for process in list((getattr(_pool, '_processes', None) or {}).values()):
+            process.terminate()
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+    return get_pool(workers)
+
+def pool_pids():
+    """PIDs de los procesos del pool (para medir su memoria)"""
+    if _pool is None:
+        return []
+    return list(getattr(_pool, '_processes', None) or {})
+
+def page_ranges(num_pages, parts):
+    """Divide las páginas [0, num_pages) en a lo más `parts` rangos contiguos"""
+    size = max(1, -(-num_pages // parts))
+    return [(start, min(start + size, num_pages)) for start in range(0, num_pages, size)]
+
+def page_range_texts(source, start=0, stop=None):
+    """Trabajo de un proceso: texto de las páginas [start, stop) de un PDF (ruta o bytes)"""
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    pages = list(range(start + 1, stop + 1)) if stop is not None else None
+    with pdfplumber.open(source, pages=pages) as pdf:
+        return [page.extract_text() or '' for page in pdf.pages]
+
+def count_pages(source):
+    if pdfium is not None:
+        pdf = pdfium.PdfDocument(source.getvalue() if isinstance(source, io.BytesIO) else source)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+    with pdfplumber.open(source) as pdf:
+        return len(pdf.pages)
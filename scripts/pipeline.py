@@ -0,0 +1,255 @@
+import io
+import os
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+import inputs
+import scheduler
+import classify
+import quarantine
+import cfdi
+from pdftext import get_pool, restart_pool, pool_pids, page_ranges, page_range_texts, count_pages
+
+# Etapas de la corrida conectadas por colas acotadas:
+#   descubrir → leer bytes (hilo lector) → deduplicar → clasificar → extraer texto (procesos) → parsear → guardar
+# Mientras el proceso principal parsea y guarda, el hilo lector adelanta lectura de disco y los
+# procesos extraen el texto de los siguientes documentos; cada cola tiene un tope, así que
+# la memoria no crece con el tamaño del lote. Los documentos con más páginas entran primero y, si
+# la memoria se acerca al tope, no se envía trabajo nuevo hasta que termine el que está en curso
+# (ver scheduler.py). Un documento que pasa su tiempo límite se saca del pool terminando sus
+# procesos, sin detener el lote (ver quarantine.py). Las facturas con su XML timbrado al lado
+# se leen del XML y no pasan por la extracción de texto (ver cfdi.py).
+PREFETCH = 8  # documentos leídos por adelantado
+MIN_PAGES_SPLIT = 8  # páginas a partir de las cuales un documento se reparte entre procesos
+DOCUMENT_SECONDS = 120  # tiempo límite base de un documento
+PAGE_SECONDS = 10  # tiempo adicional por página
+
+_FIN = object()
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+class TimeLimitExceeded(Exception):
+    """Documento que pasó su tiempo límite (o que quedó en cuarentena)"""
+
+def bounded(iterable, maxsize):
+    """Recorre iterable en un hilo aparte y entrega sus elementos a través de una cola acotada"""
+    q = queue.Queue(maxsize)
+
+    def producer():
+        try:
+            for item in iterable:
+                q.put(item)
+        except Exception as e:
+            q.put(_Failure(e))
+        finally:
+            q.put(_FIN)
+
+    threading.Thread(target=producer, daemon=True).start()
+    while True:
+        item = q.get()
+        if item is _FIN:
+            return
+        if isinstance(item, _Failure):
+            raise item.error
+        yield item
+
+def read_documents(documents):
+    """Carga en memoria los PDFs sueltos; los de lotes ya vienen como BytesIO"""
+    for name, source in documents:
+        if isinstance(source, str):
+            try:
+                with open(source, 'rb') as f:
+                    data = io.BytesIO(f.read())
+                data.name = source
+                source = data
+            except OSError as e:
+                # Se deja la ruta; la extracción de texto reportará el error del archivo
+                print(f"No se pudo leer {name}: {e}")
+        yield name, source
+
+def preflight(documents, accept, skip=(), classes=None):
+    """
+    Clasifica cada documento antes de extraer su texto (ver classify.py) y genera
+    (nombre, origen, rechazo): los de una clase en `accept` o sin formato reconocido pasan
+    sin rechazo; los de una clase en `skip` (los procesa otra etapa) se omiten en silencio y
+    los demás (dañados, escaneados o de otro tipo) llevan su rechazo como error.
+    La clase de cada documento queda en classes[nombre].
+    """
+    for name, source in documents:
+        clase, detalle = classify.classify(source)
+        if classes is not None:
+            classes[name] = clase
+        if clase in accept or clase == classify.DESCONOCIDO:
+            yield name, source, None
+        elif clase in skip:
+            print(f"{name}: {classify.describe(clase, detalle)}; lo procesa otra etapa")
+        else:
+            rejection = classify.Rejected(clase, detalle)
+            print(f"{name}: {rejection}; no se procesa")
+            yield name, source, rejection
+
+def extract_texts(documents, workers, memory_limit=None, budget=None, quarantined=None, skip_text=(), pages=None):
+    """
+    Extrae el texto de los documentos (nombre, origen, rechazo) en el pool de procesos con a
+    lo más workers*2 documentos en vuelo (menos si la memoria pasa de memory_limit); los de
+    MIN_PAGES_SPLIT páginas o más se reparten por rangos de páginas y los rechazados no se
+    envían. Genera (nombre, origen, textos por página, error) en el orden de entrada.
+
+    Con budget = (segundos por documento, segundos por página), un documento que tarda más
+    que documento + página × páginas se da por perdido: se terminan los procesos del pool, el
+    documento pasa a cuarentena (ver quarantine.py) y los demás en curso se vuelven a enviar.
+    Los documentos cuyo nombre está en skip_text no se envían y salen sin textos. `pages`
+    trae las páginas ya contadas al ordenar los PDFs (ver scheduler.largest_first).
+    """
+    pool = get_pool(workers)
+    pending = deque()
+    throttled = False
+
+    def over_limit():
+        return bool(memory_limit) and scheduler.rss(pool_pids()) > memory_limit
+
+    def submit(item):
+        item['futures'] = [pool.submit(page_range_texts, item['data'], start, stop) for start, stop in item['ranges']]
+
+    def restart():
+        nonlocal pool
+        pool = restart_pool()
+        for item in pending:
+            # Los que ya terminaron conservan su resultado; los demás se vuelven a enviar
+            if item['error'] is None and not all(future.done() and not future.cancelled() and future.exception() is None
+                                                 for future in item['futures']):
+                submit(item)
+
+    def time_limit(item):
+        if not budget:
+            return None
+        por_documento, por_pagina = budget
+        # Cada reintento de un documento en cuarentena tiene el doble de tiempo
+        return (por_documento + por_pagina * item['pages']) * 2 ** quarantine.attempts(quarantined, item['name'])
+
+    def finish():
+        item = pending[0]
+        name, source = item['name'], item['source']
+        if item['error'] is not None:
+            pending.popleft()
+            return name, source, None, item['error']
+        # El tiempo cuenta desde que el documento es el siguiente en entregarse
+        seconds = time_limit(item)
+        deadline = time.monotonic() + seconds if seconds else None
+        try:
+            texts = []
+            for future in item['futures']:
+                texts.extend(future.result(None if deadline is None else max(0, deadline - time.monotonic())))
+        except FutureTimeout:
+            pending.popleft()
+            error = TimeLimitExceeded(f"pasó su tiempo límite de {seconds:.0f} s; se terminó su proceso")
+            print(f"{name}: {error}. Pasa a cuarentena y el lote continúa")
+            quarantine.add(quarantined, name, str(error))
+            restart()
+            return name, source, None, error
+        except BrokenProcessPool as e:
+            # Un proceso murió (p. ej. sin memoria): se reinicia el pool y el documento se reintenta una vez
+            if item['reintentado']:
+                pending.popleft()
+                restart()
+                return name, source, None, e
+            item['reintentado'] = True
+            restart()
+            return finish()
+        except Exception as e:
+            pending.popleft()
+            return name, source, None, e
+        pending.popleft()
+        quarantine.release(quarantined, name)
+        return name, source, texts, None
+
+    for name, source, rejection in documents:
+        item = {'name': name, 'source': source, 'error': rejection, 'pages': 0, 'reintentado': False}
+        pending.append(item)
+        if rejection is not None:
+            continue
+        if name in skip_text:
+            item['futures'] = []
+            continue
+        item['data'] = source.getvalue() if isinstance(source, io.BytesIO) else source
+        item['ranges'] = [(0, None)]
+        if workers > 1 or budget:
+            try:
+                item['pages'] = (pages or {}).get(name) or count_pages(source)
+                if workers > 1 and item['pages'] >= MIN_PAGES_SPLIT:
+                    item['ranges'] = page_ranges(item['pages'], workers * 2)
+            except Exception:
+                pass  # El error se reporta al extraer el texto
+        submit(item)
+        while len(pending) >= workers * 2:
+            yield finish()
+        # Cerca del tope de memoria se espera a que terminen los documentos en curso
+        while pending and over_limit():
+            if not throttled:
+                print(f"Memoria cerca del tope ({memory_limit // scheduler.MB} MB); "
+                      f"esperando a que terminen {len(pending)} documentos en curso")
+                throttled = True
+            yield finish()
+        throttled = throttled and over_limit()
+    while pending:
+        yield finish()
+
+def time_budget(por_documento=DOCUMENT_SECONDS, por_pagina=PAGE_SECONDS):
+    """Tiempo límite (segundos por documento, segundos por página); None si está desactivado"""
+    return (por_documento, por_pagina) if por_documento else None
+
+def hold_quarantined(documents, quarantined):
+    """Los documentos que agotaron sus reintentos de cuarentena se reportan sin procesarlos"""
+    for name, source, rejection in documents:
+        if rejection is None and quarantine.exhausted(quarantined, name):
+            rejection = TimeLimitExceeded(f"en cuarentena tras {quarantine.MAX_INTENTOS} intentos "
+                                          f"(python scripts/quarantine.py para liberarlo)")
+            print(f"{name}: {rejection}")
+        yield name, source, rejection
+
+def attach_cfdi(documents, companions, cfdis):
+    """
+    Lee el XML (CFDI) que acompaña a cada factura aceptada: sus campos quedan en
+    cfdis[nombre] y el PDF ya no pasa por la extracción de texto (ver cfdi.for_invoice)
+    """
+    for name, source, rejection in documents:
+        xml = companions.pop(name, None)
+        if xml is not None and rejection is None:
+            result = cfdi.for_invoice(name, xml)
+            if result is not None:
+                cfdis[name] = result
+        yield name, source, rejection
+
+def stream_documents(pdf_paths, archives, failed_archives, aliases, seen=None, workers=1, memory_limit=None,
+                     accept=None, skip=(), classes=None, budget=None, quarantined=None, cfdis=None):
+    """
+    Tubería completa para una etapa: genera (nombre, origen, textos por página, error) de
+    cada documento único, sin copias idénticas ni documentos ya aplicados (ver
+    inputs.unique_documents), a medida que su texto está listo. Los PDFs se recorren de más
+    a menos páginas y los lotes de mayor a menor tamaño; los PDFs en cuarentena, al final.
+    Con `accept` (clases de classify.py) se clasifica cada documento antes de extraer su texto
+    (ver preflight) y con `budget` cada documento tiene un tiempo límite (ver extract_texts). Con `cfdis` (un
+    diccionario) las facturas con su XML al lado se leen de él (ver attach_cfdi) y salen sin textos.
+    """
+    pages = {}  # Páginas de cada PDF suelto, contadas una sola vez al ordenarlos
+    pdf_paths = sorted(scheduler.largest_first(pdf_paths, pages),
+                       key=lambda path: quarantine.attempts(quarantined, os.path.basename(path)) > 0)
+    companions = {} if cfdis is not None else None
+    documents = inputs.iter_documents(pdf_paths, scheduler.largest_first(archives), failed_archives, companions)
+    loaded = bounded(read_documents(documents), PREFETCH)
+    unique = inputs.unique_documents(loaded, aliases, seen)
+    if accept is None:
+        routed = ((name, source, None) for name, source in unique)
+    else:
+        routed = preflight(unique, accept, skip, classes)
+    if quarantined:
+        routed = hold_quarantined(routed, quarantined)
+    if cfdis is not None:
+        routed = attach_cfdi(routed, companions, cfdis)
+    return extract_texts(routed, max(1, workers), memory_limit, budget, quarantined,
+                         cfdis if cfdis is not None else (), pages)
@@ -0,0 +1,122 @@
+import os
+import sys
+import json
+import argparse
+from datetime import datetime
+import store
+
+# Documentos que pasaron su tiempo límite (un PDF dañado o enorme puede tener a pdfminer
+# ocupado por minutos). La tubería termina su proceso y sigue con el lote; el documento queda
+# en output/data/cuarentena.json por etapa y se reintenta en las siguientes corridas al final
+# del lote y con el doble de tiempo en cada intento. Después de MAX_INTENTOS ya no se procesa
+# hasta que se libere (ver CLI).
+QUARANTINE_FILE = 'cuarentena.json'
+MAX_INTENTOS = 3
+
+def quarantine_path(excel_path):
+    return os.path.join(store.partition_dir(excel_path), QUARANTINE_FILE)
+
+def _load_all(excel_path):
+    path = quarantine_path(excel_path)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def _save_all(excel_path, data):
+    path = quarantine_path(excel_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def load(excel_path, stage):
+    """Documentos en cuarentena de una etapa: {nombre: {'motivo', 'intentos', 'fecha'}}"""
+    return _load_all(excel_path).get(stage, {})
+
+def save(excel_path, stage, quarantined):
+    # Las etapas comparten el archivo y pueden terminar a la vez
+    with store.locked(excel_path):
+        data = _load_all(excel_path)
+        if quarantined:
+            data[stage] = quarantined
+        else:
+            data.pop(stage, None)
+        _save_all(excel_path, data)
+
+def attempts(quarantined, name):
+    if quarantined is None:
+        return 0
+    return quarantined.get(name, {}).get('intentos', 0)
+
+def exhausted(quarantined, name):
+    return attempts(quarantined, name) >= MAX_INTENTOS
+
+def add(quarantined, name, motivo):
+    if quarantined is None:
+        return
+    quarantined[name] = {'motivo': motivo, 'intentos': attempts(quarantined, name) + 1,
+                         'fecha': datetime.now().isoformat(timespec='seconds')}
+
+def release(quarantined, name):
+    if quarantined is not None:
+        quarantined.pop(name, None)
+
+def report_lines(quarantined):
+    """Líneas para el log con los documentos que siguen en cuarentena"""
+    if not quarantined:
+        return []
+    lines = [f"\nDocumentos en cuarentena por tiempo límite ({len(quarantined)}):"]
+    for name, info in sorted(quarantined.items()):
+        estado = ("sin más reintentos; revisar a mano" if info['intentos'] >= MAX_INTENTOS
+                  else "se reintenta en la siguiente corrida")
+        lines.append(f"- {name}: {info['motivo']} (intento {info['intentos']}, {info['fecha']}; {estado})")
+    return lines
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Cuarentena - Lista o libera los documentos que pasaron su tiempo límite.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Ejemplo de uso:
+    python scripts/quarantine.py output/data.xlsx
+    python scripts/quarantine.py output/data.xlsx --liberar pedido_roto.pdf
+    python scripts/quarantine.py output/data.xlsx --liberar todos --etapa detect
+
+Estructura de carpetas:
+    output/
+        data/cuarentena.json → Documentos en cuarentena por etapa (extract, detect, detect2)
+        """
+    )
+    parser.add_argument("excel_path", help="Ruta del archivo Excel (output/data.xlsx)")
+    parser.add_argument("--liberar", metavar="DOCUMENTO",
+                        help="Quita un documento de la cuarentena ('todos' para vaciarla) para reintentarlo desde cero")
+    parser.add_argument("--etapa", choices=["extract", "detect", "detect2"],
+                        help="Solo esta etapa (default: todas)")
+    args = parser.parse_args()
+
+    data = _load_all(args.excel_path)
+    stages = [args.etapa] if args.etapa else sorted(data)
+    if args.liberar:
+        liberados = 0
+        with store.locked(args.excel_path):
+            data = _load_all(args.excel_path)
+            for stage in stages:
+                names = list(data.get(stage, {})) if args.liberar == 'todos' else [args.liberar]
+                for name in names:
+                    if data.get(stage, {}).pop(name, None) is not None:
+                        liberados += 1
+                        print(f"Liberado de la cuarentena de {stage}: {name}")
+                if stage in data and not data[stage]:
+                    del data[stage]
+            _save_all(args.excel_path, data)
+        if not liberados:
+            print("Ningún documento coincide.")
+            sys.exit(1)
+    else:
+        if not any(data.get(stage) for stage in stages):
+            print("No hay documentos en cuarentena.")
+        for stage in stages:
+            for line in report_lines(data.get(stage, {})):
+                print(line.replace("\nDocumentos", f"\n[{stage}] Documentos"))
@@ -0,0 +1,289 @@
+import os
+import argparse
+import pandas as pd
+from money import invoice_totals, cents_to_pesos
+import store
+import keyindex
+import checkpoint
+import schema
+import inputs
+import pipeline
+import classify
+import scheduler
+import detect
+import detect2
+
+FACTURA_COLUMNS = ['Archivo', 'Formato', 'No factura', 'Fecha emisión',
+                   'Subtotal factura', 'Impuesto factura', 'Total factura']
+REFERENCIA_COLUMNS = ['Archivo', 'No factura', 'Tipo', 'Referencia']
+
+def choose_layout(page_texts, clase=None):
+    """
+    Analiza la factura con el formato que indicó la clasificación previa; sin ella, corre
+    los analizadores de ambos formatos sobre el mismo texto y se queda con el que reconoce
+    el folio (primero el formato nuevo de detect2.py, luego el de detect.py)
+    """
+    if clase == classify.FACTURA_B:
+        return detect2.analyze_invoice(page_texts)
+    if clase == classify.FACTURA_A:
+        return detect.analyze_invoice(page_texts)
+    result_b = detect2.analyze_invoice(page_texts)
+    if result_b['folio']:
+        return result_b
+    result_a = detect.analyze_invoice(page_texts)
+    if result_a['folio'] or not (result_b['orders'] or result_b['expedientes']):
+        return result_a
+    return result_b
+
+def extract_invoices(pdf_folder, excel_path, workers=1, memory_limit=None, budget=None, include_archived=False):
+    """
+    Devuelve dos tablas (facturas con su folio, fecha y totales en centavos, y sus referencias
+    a pedidos/expedientes), los errores y las copias idénticas que se omitieron. Las facturas
+    que detect.py, detect2.py o la cola ya aplicaron, incluidas las archivadas, se leen del
+    índice de claves (keyindex.load_invoices); de la carpeta solo se extraen las que aún no
+    están registradas, y quedan registradas para la siguiente conciliación.
+    """
+    registradas, referencias_registradas = keyindex.load_invoices(excel_path)
+    nuevas = []
+    errores = []
+    # Solo las entradas actuales; con include_archived también archive/ (historial anterior al registro)
+    pdf_paths, archives = inputs.discover(pdf_folder, include_archived=include_archived)
+    aliases = {}
+    classes = {}
+    cfdis = {}
+    # Las registradas se omiten por su huella sin extraer su texto; una copia con otro nombre
+    # se reporta como copia idéntica de la registrada
+    seen = {row[0]: row[1] for row in registradas}
+
+    # Las copias idénticas de una factura se concilian una sola vez; los pedidos, escaneados y
+    # dañados se reportan como error sin extraer su texto. Las facturas con su XML (CFDI) al lado
+    # toman del XML el folio, la fecha, las referencias y los totales
+    for pdf_file, pdf_path, page_texts, error in pipeline.stream_documents(pdf_paths, archives, [], aliases, seen,
+                                                                           workers=workers,
+                                                                           memory_limit=memory_limit,
+                                                                           accept={classify.FACTURA_A,
+                                                                                   classify.FACTURA_B},
+                                                                           classes=classes, budget=budget,
+                                                                           cfdis=cfdis):
+        try:
+            print(f"Conciliando factura: {pdf_file}")
+            if error:
+                raise error
+            result = cfdis.pop(pdf_file, None) or choose_layout(page_texts, classes.get(pdf_file))
+        except Exception as e:
+            errores.append((pdf_file, str(e)))
+            continue
+        nuevas.append({'documento': pdf_file, 'formato': result['layout'], 'folio': result['folio'],
+                       'fecha': result['fecha'], 'totales': invoice_totals(result),
+                       'orders': result['orders'], 'expedientes': result['expedientes']})
+
+    digests = checkpoint.digests_by_name(seen)
+    for entry in nuevas:
+        entry['huella'] = digests.get(entry['documento'])
+    keyindex.record_invoices(excel_path, 'reconcile', nuevas)
+
+    # Una factura que cambió de contenido con el mismo nombre se concilia con su versión actual
+    extraidas = {entry['documento'] for entry in nuevas}
+    facturas = [dict(zip(FACTURA_COLUMNS, (archivo, formato, folio or '', fecha or '', subtotal, impuesto, total)))
+                for _, archivo, formato, folio, fecha, subtotal, impuesto, total in registradas
+                if archivo not in extraidas]
+    referencias = [dict(zip(REFERENCIA_COLUMNS, (archivo, folio or '', tipo, referencia)))
+                   for archivo, folio, tipo, referencia in referencias_registradas if archivo not in extraidas]
+    for entry in nuevas:
+        folio = entry['folio'] or ''
+        totals = entry['totales']
+        facturas.append({
+            'Archivo': entry['documento'],
+            'Formato': entry['formato'],
+            'No factura': folio,
+            'Fecha emisión': entry['fecha'] or '',
+            'Subtotal factura': totals['subtotal'],
+            'Impuesto factura': totals['impuesto'],
+            'Total factura': totals['total']
+        })
+        for order in dict.fromkeys(entry['orders']):
+            referencias.append({'Archivo': entry['documento'], 'No factura': folio, 'Tipo': 'pedido', 'Referencia': order})
+        for expediente in dict.fromkeys(entry['expedientes']):
+            referencias.append({'Archivo': entry['documento'], 'No factura': folio, 'Tipo': 'expediente',
+                                'Referencia': expediente})
+
+    df_facturas = pd.DataFrame(facturas, columns=FACTURA_COLUMNS)
+    for col in ['Subtotal factura', 'Impuesto factura', 'Total factura']:
+        df_facturas[col] = df_facturas[col].astype('Int64')
+    df_facturas['Copias idénticas'] = df_facturas['Archivo'].map(lambda a: ', '.join(aliases.get(a, [])))
+    return df_facturas, pd.DataFrame(referencias, columns=REFERENCIA_COLUMNS), errores, aliases
+
+def load_pedido_lines(excel_path, referencias=None):
+    """
+    Carga solo las columnas necesarias del Excel: claves enteras e importes en centavos. Con
+    `referencias` (tabla de extract_invoices) solo se leen las particiones que contienen
+    alguno de los pedidos/expedientes referidos; las demás no entran en ningún cruce.
+    """
+    columnas = ['Numero de Pedido', 'Nº de pieza', 'Subtotal', 'Impuesto']
+    if referencias is None:
+        df = store.load_all(excel_path, columnas)
+    else:
+        pedidos = referencias.loc[referencias['Tipo'] == 'pedido', 'Referencia']
+        expedientes = referencias.loc[referencias['Tipo'] == 'expediente', 'Referencia']
+        index = store.load_index(excel_path)
+        df = store.load_partitions(excel_path, store.partitions_for(index, pedidos, expedientes), columnas)
+    return pd.DataFrame({
+        'pedido': df['Numero de Pedido'],
+        'expediente': df['Nº de pieza'],
+        'Subtotal': df['Subtotal'],
+        'Impuesto': df['Impuesto']
+    })
+
+def reconcile(facturas, referencias, lineas, tolerancia=1):
+    """
+    Cruza facturas y líneas de pedido con joins por hash (merge) y devuelve las tablas
+    del reporte: diferencias de importes, doble facturación y referencias desconocidas.
+    La tolerancia está en centavos.
+    """
+    lineas = lineas.rename_axis('linea').reset_index()
+    # Las referencias detectadas se cruzan como enteros, igual que las claves del Excel
+    referencias = referencias.assign(Referencia=schema.key_series(referencias['Referencia'].astype(object)))
+
+    # Agrupar líneas de pedido por pedido y por expediente
+    grupos = {
+        'pedido': lineas.groupby('pedido').agg(Lineas=('linea', 'size'), Subtotal=('Subtotal', 'sum'),
+                                               Impuesto=('Impuesto', 'sum')),
+        'expediente': lineas.groupby('expediente').agg(Lineas=('linea', 'size'), Subtotal=('Subtotal', 'sum'),
+                                                       Impuesto=('Impuesto', 'sum')),
+    }
+
+    # Referencias que no existen en los pedidos
+    desconocidas = []
+    cubiertas = []
+    for tipo, grupo in grupos.items():
+        refs = referencias[referencias['Tipo'] == tipo]
+        cruce = refs.merge(grupo, left_on='Referencia', right_index=True, how='left', indicator=True)
+        desconocidas.append(cruce.loc[cruce['_merge'] == 'left_only', REFERENCIA_COLUMNS])
+        # Líneas cubiertas por cada factura (una línea cuenta una sola vez por factura)
+        cubiertas.append(refs.merge(lineas[['linea', tipo]], left_on='Referencia', right_on=tipo)[['Archivo', 'linea']])
+    desconocidas = pd.concat(desconocidas, ignore_index=True)
+    cubiertas = pd.concat(cubiertas, ignore_index=True).drop_duplicates()
+
+    # Importes esperados por factura según sus líneas de pedido
+    esperado = (cubiertas.merge(lineas[['linea', 'Subtotal', 'Impuesto']], on='linea')
+                .groupby('Archivo')
+                .agg(**{'Lineas pedido': ('linea', 'size'),
+                        'Subtotal pedidos': ('Subtotal', 'sum'),
+                        'Impuesto pedidos': ('Impuesto', 'sum')}))
+    comparacion = facturas.merge(esperado, left_on='Archivo', right_index=True, how='inner')
+    comparacion['Diferencia subtotal'] = comparacion['Subtotal factura'] - comparacion['Subtotal pedidos']
+    comparacion['Diferencia impuesto'] = comparacion['Impuesto factura'] - comparacion['Impuesto pedidos']
+    sin_importe = comparacion['Subtotal factura'].isna()
+    fuera_de_tolerancia = ((comparacion['Diferencia subtotal'].abs() > tolerancia).fillna(False) |
+                           (comparacion['Diferencia impuesto'].abs() > tolerancia).fillna(False))
+    diferencias = comparacion[sin_importe | fuera_de_tolerancia].copy()
+    diferencias['Estado'] = 'DIFERENCIA'
+    diferencias.loc[diferencias['Subtotal factura'].isna(), 'Estado'] = 'SIN IMPORTE EN FACTURA'
+
+    # Pedidos/expedientes facturados con más de un folio distinto
+    con_folio = referencias[referencias['No factura'] != ''].drop_duplicates(['Tipo', 'Referencia', 'No factura'])
+    folios_por_ref = con_folio.groupby(['Tipo', 'Referencia'])['No factura'].transform('size')
+    doble = (con_folio[folios_por_ref > 1]
+             .sort_values(['Tipo', 'Referencia', 'No factura'])
+             .groupby(['Tipo', 'Referencia'], as_index=False)
+             .agg(Facturas=('No factura', ', '.join), Archivos=('Archivo', ', '.join)))
+
+    return diferencias, doble, desconocidas
+
+def write_report(output_excel, log_file, facturas, diferencias, doble, desconocidas, errores, aliases=None):
+    """Escribe el reporte de conciliación (Excel con una hoja por tipo de hallazgo) y su log"""
+    montos = ['Subtotal factura', 'Impuesto factura', 'Total factura', 'Subtotal pedidos',
+              'Impuesto pedidos', 'Diferencia subtotal', 'Diferencia impuesto']
+
+    def en_pesos(df):
+        # Los importes se pasan de centavos a pesos solo al exportar
+        df = df.copy()
+        for col in montos:
+            if col in df.columns:
+                df[col] = cents_to_pesos(df[col])
+        return df
+
+    with pd.ExcelWriter(output_excel) as writer:
+        en_pesos(diferencias).to_excel(writer, sheet_name='Diferencias', index=False)
+        doble.to_excel(writer, sheet_name='Doble facturacion', index=False)
+        desconocidas.to_excel(writer, sheet_name='Desconocidos', index=False)
+        en_pesos(facturas).to_excel(writer, sheet_name='Facturas', index=False)
+
+    with open(log_file, 'w', encoding='utf-8') as log:
+        log.write("=== REPORTE DE CONCILIACIÓN DE FACTURAS ===\n\n")
+        log.write(f"Facturas analizadas: {len(facturas)}\n")
+        log.write(f"Facturas con diferencias de importe: {len(diferencias)}\n")
+        log.write(f"Pedidos/expedientes facturados con folios distintos: {len(doble)}\n")
+        log.write(f"Referencias a pedidos/expedientes desconocidos: {len(desconocidas)}\n")
+        log.write(f"Archivos con error: {len(errores)}\n")
+        if errores:
+            log.write("\nLista de archivos a revisar:\n")
+            for pdf_file, error in errores:
+                log.write(f"- {pdf_file}: {error}\n")
+        for line in inputs.alias_report_lines(aliases or {}):
+            log.write(f"{line}\n")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Conciliación de Facturas - Compara importes facturados contra las líneas de pedido.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Ejemplo de uso:
+    python scripts/reconcile.py PDF-FACTURAS output/data.xlsx --output output/conciliacion.xlsx --log_file output/log_conciliacion.txt
+
+Estructura de carpetas:
+    PDF-FACTURAS/     → Carpeta con las facturas a conciliar
+    output/           → Carpeta donde se guardan los resultados
+        data.xlsx     → Excel con las líneas de pedido
+        data/claves.sqlite → Facturas ya aplicadas por detect.py, detect2.py y la cola
+        conciliacion.xlsx → Reporte de diferencias
+        log_conciliacion.txt → Resumen del proceso
+        """
+    )
+
+    parser.add_argument("facturas_folder",
+                      help="Ruta de la carpeta PDF-FACTURAS (o lote ZIP/TAR) con los PDFs de facturas")
+    parser.add_argument("excel_path",
+                      help="Ruta del archivo Excel (output/data.xlsx) con las líneas de pedido")
+    parser.add_argument("--output",
+                      default="output/conciliacion.xlsx",
+                      help="Ruta del reporte de conciliación (default: output/conciliacion.xlsx)")
+    parser.add_argument("--log_file",
+                      default="output/log_conciliacion.txt",
+                      help="Ruta del archivo de logs (default: output/log_conciliacion.txt)")
+    parser.add_argument("--workers", type=int,
+                      help="Procesos para extraer el texto de las facturas (default: según núcleos y memoria disponibles)")
+    parser.add_argument("--memoria_max", type=int,
+                      help="Tope de memoria de la corrida en MB; cerca del tope no se envían más documentos a los procesos (default: 80%% de la memoria disponible)")
+    parser.add_argument("--limite_documento", type=int, default=pipeline.DOCUMENT_SECONDS,
+                      help=f"Segundos base que puede tardar una factura; al pasarlos se termina su proceso y se reporta como error (0 = sin límite; default: {pipeline.DOCUMENT_SECONDS})")
+    parser.add_argument("--limite_pagina", type=int, default=pipeline.PAGE_SECONDS,
+                      help=f"Segundos adicionales por cada página (default: {pipeline.PAGE_SECONDS})")
+    parser.add_argument("--tolerancia", type=int, default=1,
+                      help="Diferencia máxima aceptada en centavos (default: 1)")
+    parser.add_argument("--historial", action="store_true",
+                      help="Revisa también las facturas archivadas que aún no están registradas (las aplicadas antes del registro de facturas); basta con una vez")
+    args = parser.parse_args()
+
+    print("\n=== Iniciando Conciliación de Facturas ===")
+    print(f"Carpeta de facturas: {args.facturas_folder}")
+    print(f"Archivo Excel: {args.excel_path}")
+    print(f"Reporte: {args.output}")
+    memory_limit = scheduler.memory_limit(args.memoria_max)
+    workers = args.workers or scheduler.auto_workers(memory_limit)
+    print(scheduler.describe(workers, memory_limit))
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    os.makedirs(os.path.dirname(args.log_file) or '.', exist_ok=True)
+
+    facturas, referencias, errores, aliases = extract_invoices(args.facturas_folder, args.excel_path, workers, memory_limit,
+                                                               pipeline.time_budget(args.limite_documento, args.limite_pagina),
+                                                               args.historial)
+    lineas = load_pedido_lines(args.excel_path, referencias)
+    diferencias, doble, desconocidas = reconcile(facturas, referencias, lineas, args.tolerancia)
+    write_report(args.output, args.log_file, facturas, diferencias, doble, desconocidas, errores, aliases)
+
+    print(f"\n✓ Facturas con diferencias: {len(diferencias)}")
+    print(f"✓ Pedidos/expedientes con doble facturación: {len(doble)}")
+    print(f"✓ Referencias desconocidas: {len(desconocidas)}")
+    print(f"Reporte guardado en: {args.output}")
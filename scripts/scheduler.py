@@ -0,0 +1,94 @@
+import os
+try:
+    import psutil  # Opcional: mide la memoria también fuera de Linux
+except ImportError:
+    psutil = None
+from pdftext import count_pages
+
+# Planificación de la corrida según los recursos de la máquina:
+#   - los documentos con más páginas van primero, para que uno enorme no quede al final del
+#     lote con los demás procesos ya sin trabajo;
+#   - el número de procesos sale de los núcleos y de la memoria disponibles;
+#   - si la memoria de la corrida (proceso principal + procesos del pool) se acerca al tope,
+#     la tubería deja de enviar trabajo nuevo hasta que terminen los que están en curso.
+MEMORY_PER_WORKER = 500 * 1024 * 1024  # Estimación de lo que ocupa un proceso con un PDF grande
+MEMORY_FRACTION = 0.8  # Parte de la memoria disponible que usa la corrida si no se da un tope
+MB = 1024 * 1024
+
+def available_cpus():
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0)) or 1
+    return os.cpu_count() or 1
+
+def available_memory():
+    """Memoria disponible en bytes, o None si no se puede saber en este sistema"""
+    if psutil is not None:
+        return psutil.virtual_memory().available
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def memory_limit(limit_mb=None):
+    """Tope de memoria de la corrida en bytes: el indicado en MB o una parte de la disponible"""
+    if limit_mb:
+        return limit_mb * MB
+    available = available_memory()
+    return int(available * MEMORY_FRACTION) if available else None
+
+def auto_workers(limit=None):
+    """Procesos para la corrida: uno por núcleo, sin pasar de lo que cabe en el tope de memoria"""
+    workers = available_cpus()
+    if limit:
+        workers = min(workers, limit // MEMORY_PER_WORKER)
+    return max(1, workers)
+
+def rss(pids):
+    """Memoria residente (bytes) del proceso actual más la de los procesos dados"""
+    total = 0
+    for pid in [os.getpid()] + list(pids):
+        try:
+            if psutil is not None:
+                total += psutil.Process(pid).memory_info().rss
+                continue
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except Exception:
+            continue  # El proceso terminó o el sistema no expone su memoria
+    return total
+
+def largest_first(paths, pages=None):
+    """
+    Ordena rutas de la más pesada a la más ligera: los PDFs por número de páginas (lo que
+    tarda su extracción) y, a igual número, por tamaño; los lotes ZIP/TAR solo por tamaño.
+    A igual peso, por nombre. Con `pages` (un diccionario) deja ahí las páginas de cada PDF
+    por nombre de archivo, para que la extracción no las vuelva a contar.
+    """
+    def size(path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    def page_count(path):
+        if not path.lower().endswith('.pdf'):
+            return 0
+        try:
+            count = count_pages(path)
+        except Exception:
+            return 0  # El error se reporta al leer o clasificar el documento
+        if pages is not None:
+            pages[os.path.basename(path)] = count
+        return count
+    return sorted(paths, key=lambda path: (-page_count(path), -size(path), path))
+
+def describe(workers, limit):
+    tope = f"{limit // MB} MB" if limit else "sin tope (no se pudo medir la memoria)"
+    return f"Procesos: {workers} | Tope de memoria: {tope}"
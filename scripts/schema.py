@@ -0,0 +1,92 @@
+import pandas as pd
+from dates import to_datetime_column
+from money import MONEY_COLUMNS, pesos_to_cents, cents_to_pesos
+
+# Esquema canónico de la tabla de registros. Todas las etapas cargan y guardan a través de
+# store, que aplica estos tipos: las claves son enteros (sin el '5100912345.0' de las columnas
+# float), los textos repetidos son categorías y las fechas son datetime64. Así los cruces y
+# las actualizaciones comparan tipos nativos y no convierten la columna completa a texto.
+# Los importes son centavos enteros; solo los libros los guardan en pesos (from_excel/for_excel).
+INT_COLUMNS = ['Numero de Pedido', 'Numero de linea', 'Nº de pieza']
+CATEGORY_COLUMNS = ['Status', 'Tipo', 'Descripcion', 'Cantidad']
+DATE_COLUMNS = ['Fecha', 'Fecha emisión']
+TEXT_COLUMNS = ['No factura']
+CENTS_COLUMNS = MONEY_COLUMNS  # Centavos Int64; apply los conserva, no los vuelve a convertir
+
+# Valores de Status que escriben detect.py y detect2.py; siempre son categorías de la columna
+# para poder asignarlos sin convertirla
+STATUS_VALUES = ['NO FACTURADO', 'FACTURADO', 'FACTURADO POR EXPEDIENTE']
+SIN_FECHA = 'Sin fecha'  # Cómo se escribe en el Excel una 'Fecha' vacía
+
+def to_key(value):
+    """Clave de pedido/expediente como entero ('5100912345.0' → 5100912345); None si no es numérica"""
+    if value is None or pd.isna(value):
+        return None
+    try:
+        number = float(str(value).strip())
+    except ValueError:
+        return None
+    return int(number) if number.is_integer() else None
+
+def key_series(serie):
+    """Versión vectorizada de to_key para una columna completa (Int64, vacías como <NA>)"""
+    if pd.api.types.is_integer_dtype(serie):
+        return serie.astype('Int64')
+    if serie.dtype == object or pd.api.types.is_string_dtype(serie):
+        serie = serie.astype('string').str.strip()
+    numbers = pd.to_numeric(serie, errors='coerce')
+    return numbers.where(numbers == numbers.round()).astype('Int64')
+
+def category_series(serie, categories=()):
+    """Texto repetido como categoría; `categories` se agregan aunque aún no aparezcan"""
+    if not isinstance(serie.dtype, pd.CategoricalDtype):
+        serie = serie.astype('string').str.strip().replace('', pd.NA).astype('category')
+    missing = [value for value in categories if value not in serie.cat.categories]
+    return serie.cat.add_categories(missing) if missing else serie
+
+def cents_series(serie):
+    """Importes en centavos como Int64; los vacíos y los que no son número quedan como <NA>"""
+    if pd.api.types.is_integer_dtype(serie):
+        return serie.astype('Int64')
+    return pd.to_numeric(serie, errors='coerce').round().astype('Int64')
+
+def text_series(serie):
+    """Texto sin el '.0' que agrega Excel a los folios numéricos"""
+    return serie.astype('string').str.strip().str.replace(r'\.0$', '', regex=True).replace('', pd.NA)
+
+def apply(df):
+    """Convierte en su lugar las columnas presentes de df a los tipos del esquema"""
+    for col in INT_COLUMNS:
+        if col in df.columns:
+            df[col] = key_series(df[col])
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = category_series(df[col], STATUS_VALUES if col == 'Status' else ())
+    for col in DATE_COLUMNS:
+        if col in df.columns:
+            # 'Sin fecha' y los valores que no son fecha quedan como NaT
+            df[col] = to_datetime_column(df[col])
+    for col in TEXT_COLUMNS:
+        if col in df.columns:
+            df[col] = text_series(df[col])
+    for col in CENTS_COLUMNS:
+        if col in df.columns:
+            df[col] = cents_series(df[col])
+    return df
+
+def from_excel(df):
+    """Aplica el esquema a lo leído de un libro: sus importes vienen en pesos y pasan a centavos"""
+    for col in CENTS_COLUMNS:
+        if col in df.columns:
+            df[col] = pesos_to_cents(df[col])
+    return apply(df)
+
+def for_excel(df):
+    """Copia lista para escribir: importes en pesos y las 'Fecha' vacías como 'Sin fecha'"""
+    df = df.copy()
+    for col in CENTS_COLUMNS:
+        if col in df.columns:
+            df[col] = cents_to_pesos(df[col])
+    if 'Fecha' in df.columns and df['Fecha'].isna().any():
+        df['Fecha'] = df['Fecha'].astype(object).where(df['Fecha'].notna(), SIN_FECHA)
+    return df
@@ -0,0 +1,363 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+from contextlib import contextmanager
+from datetime import datetime
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+import pandas as pd
+from openpyxl import load_workbook
+from dates import to_datetime_column
+import schema
+import keyindex
+import summary
+
+# Los registros viven en particiones mensuales junto al Excel:
+#   output/data.xlsx  →  output/data/2024-10.xlsx, output/data/2024-11.xlsx, ... + indice.json
+INDEX_FILE = 'indice.json'
+PARTITION_COLUMN = '_particion'
+# extract.py, detect.py y detect2.py pueden correr a la vez: cada escritor toma el bloqueo del
+# almacén solo para leer, modificar y guardar las particiones que toca, así que aplica sus
+# cambios (registros nuevos o estatus de ciertas filas) sobre la última versión de cada una en
+# lugar de sobrescribir lo que otro proceso guardó mientras tanto
+LOCK_FILE = '.bloqueo'
+_held_locks = {}  # Bloqueos tomados por este proceso: ruta → [archivo, nivel]
+
+# Todo lo que se lee o escribe pasa por los tipos de schema.py
+KEY_COLUMNS = ['Numero de Pedido', 'Nº de pieza']
+STATUS_COLUMNS = ['Status', 'No factura', 'Fecha emisión']
+
+def normalize_key(value):
+    """Normaliza un número de pedido/expediente a texto ('5100912345.0' → '5100912345')"""
+    if value is None or pd.isna(value):
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    text = str(value).strip()
+    return text[:-2] if text.endswith('.0') else text
+
+def partition_dir(excel_path):
+    return os.path.splitext(excel_path)[0]
+
+@contextmanager
+def locked(excel_path):
+    """Bloqueo exclusivo del almacén de excel_path entre procesos (ver locked_dir)"""
+    # La migración va antes: locked_dir crea la carpeta de datos, que aún no trae el historial
+    ensure_partitioned(excel_path)
+    with locked_dir(partition_dir(excel_path)):
+        yield
+
+@contextmanager
+def locked_dir(directory):
+    """
+    Bloqueo exclusivo (advisory) de una carpeta de datos entre procesos: flock en Linux/macOS
+    y msvcrt en Windows. Es reentrante dentro del mismo proceso, así que un escritor puede
+    tomarlo alrededor de funciones que también lo toman (p. ej. save_partitions).
+    """
+    path = os.path.abspath(os.path.join(directory, LOCK_FILE))
+    if path in _held_locks:
+        _held_locks[path][1] += 1
+        try:
+            yield
+        finally:
+            _held_locks[path][1] -= 1
+        return
+    os.makedirs(directory, exist_ok=True)
+    f = open(path, 'a+')
+    try:
+        if not _try_lock(f):
+            print(f"Esperando a que otro proceso termine de guardar en {directory}/ ...")
+            _lock(f)
+        _held_locks[path] = [f, 1]
+        try:
+            yield
+        finally:
+            del _held_locks[path]
+            _unlock(f)
+    finally:
+        f.close()
+
+def _try_lock(f):
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+def _lock(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        return
+    while not _try_lock(f):  # LK_LOCK se rinde a los 10 s; se reintenta sin límite
+        time.sleep(0.1)
+
+def _unlock(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def partition_path(excel_path, name):
+    return os.path.join(partition_dir(excel_path), f"{name}.xlsx")
+
+def index_path(excel_path):
+    return os.path.join(partition_dir(excel_path), INDEX_FILE)
+
+def load_index(excel_path):
+    """
+    Carga el índice de particiones (qué pedidos y expedientes contiene cada una).
+    La primera vez migra el data.xlsx monolítico a particiones.
+    """
+    ensure_partitioned(excel_path)
+    return read_index(excel_path)
+
+def read_index(excel_path):
+    """Índice tal como está en disco (sin migrar)"""
+    path = index_path(excel_path)
+    if not os.path.exists(path):
+        return {'particiones': {}}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def save_index(excel_path, index):
+    path = index_path(excel_path)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def total_rows(index):
+    return sum(info['filas'] for info in index['particiones'].values())
+
+def partitions_for(index, pedidos=(), expedientes=()):
+    """Devuelve las particiones que contienen alguno de los pedidos o expedientes dados"""
+    pedidos = {normalize_key(p) for p in pedidos}
+    expedientes = {normalize_key(e) for e in expedientes}
+    return sorted(name for name, info in index['particiones'].items()
+                  if pedidos.intersection(info['pedidos']) or expedientes.intersection(info['expedientes']))
+
+def read_columns(path, columns):
+    """
+    Lee solo las columnas pedidas de un libro, fila por fila con openpyxl en modo de solo
+    lectura (sin estilos ni las demás columnas). Cada columna toma su tipo del esquema
+    (schema.apply); las que no existen en el libro quedan vacías.
+    """
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = next(rows, ())
+        positions = {name: i for i, name in enumerate(header) if name in columns}
+        names = list(positions)
+        indices = [positions[name] for name in names]
+        values = [tuple(row[i] if i < len(row) else None for i in indices)
+                  for row in rows if any(cell is not None for cell in row)]
+    finally:
+        wb.close()
+
+    df = pd.DataFrame(values, columns=names)
+    for name in columns:
+        if name not in df.columns:
+            df[name] = None
+    return schema.from_excel(df[list(columns)].copy())
+
+def load_partitions(excel_path, names, columns=None):
+    """
+    Carga las particiones indicadas en un solo DataFrame; cada fila conserva en
+    '_particion' el nombre de la partición de donde vino. Las columnas llegan con los
+    tipos del esquema; con `columns` se leen solo esas (ver read_columns).
+    """
+    frames = []
+    for name in names:
+        path = partition_path(excel_path, name)
+        if not os.path.exists(path):
+            continue
+        if columns:
+            df = read_columns(path, columns)
+        else:
+            df = schema.from_excel(pd.read_excel(path))
+        df[PARTITION_COLUMN] = name
+        frames.append(df)
+    if not frames:
+        return schema.apply(pd.DataFrame(columns=list(columns or []) + [PARTITION_COLUMN]))
+    # Las categorías pueden diferir entre particiones; al unirlas se vuelven a tipar
+    return schema.apply(pd.concat(frames, ignore_index=True))
+
+def load_all(excel_path, columns=None):
+    """Carga todas las particiones (vista combinada de todo el historial)"""
+    index = load_index(excel_path)
+    return load_partitions(excel_path, sorted(index['particiones']), columns)
+
+def assign_partitions(df, index):
+    """
+    Asigna partición a las filas que aún no tienen: el mes de 'Fecha'; para las filas
+    "Sin fecha", el mes de las demás líneas del mismo pedido (en esta corrida o en el
+    índice) y, si el pedido no tiene ninguna, el mes en que se registró
+    """
+    if PARTITION_COLUMN not in df.columns:
+        df[PARTITION_COLUMN] = None
+    pendientes = df[PARTITION_COLUMN].isna()
+    if not pendientes.any():
+        return df
+
+    fechas = to_datetime_column(df['Fecha']) if 'Fecha' in df.columns else pd.Series(pd.NaT, index=df.index)
+    df.loc[pendientes, PARTITION_COLUMN] = fechas[pendientes].dt.strftime('%Y-%m')
+
+    pendientes = df[PARTITION_COLUMN].isna()
+    if pendientes.any():
+        pedidos = df['Numero de Pedido'].map(normalize_key)
+        por_pedido = df.loc[~pendientes, PARTITION_COLUMN].groupby(pedidos[~pendientes]).min().to_dict()
+        buscados = set(pedidos[pendientes]) - set(por_pedido)
+        for name in sorted(index['particiones']):
+            for pedido in buscados.intersection(index['particiones'][name]['pedidos']):
+                por_pedido.setdefault(pedido, name)
+        df.loc[pendientes, PARTITION_COLUMN] = pedidos[pendientes].map(por_pedido)
+        df[PARTITION_COLUMN] = df[PARTITION_COLUMN].fillna(datetime.now().strftime('%Y-%m'))
+    return df
+
+def save_partitions(excel_path, df, index):
+    """
+    Reescribe solo las particiones presentes en df (deben estar completas) y actualiza
+    su entrada en el índice. Cada archivo se escribe aparte y se reemplaza al final. Las
+    entradas se agregan a la versión del índice en disco, así que las particiones que otro
+    proceso guardó después de que se cargó `index` no se pierden.
+    """
+    with locked(excel_path):
+        _save_partitions(excel_path, df, index)
+
+def _save_partitions(excel_path, df, index):
+    os.makedirs(partition_dir(excel_path), exist_ok=True)
+    schema.apply(df)
+    key_rows = {}
+    aggregates = {}
+    for name, part in df.groupby(PARTITION_COLUMN, sort=True):
+        part = part.drop(columns=[PARTITION_COLUMN])
+        path = partition_path(excel_path, name)
+        tmp_path = path + '.tmp.xlsx'
+        schema.for_excel(part).to_excel(tmp_path, index=False)
+        os.replace(tmp_path, path)
+        index['particiones'][name] = {
+            'filas': len(part),
+            'pedidos': key_strings(part['Numero de Pedido']),
+            'expedientes': key_strings(part['Nº de pieza']),
+        }
+        key_rows[name] = partition_key_rows(part)
+        aggregates[name] = summary.partition_aggregates(part)
+        print(f"Partición guardada: {path} ({len(part)} registros)")
+    latest = read_index(excel_path)
+    latest['particiones'].update({name: index['particiones'][name] for name in key_rows})
+    index['particiones'] = latest['particiones']
+    save_index(excel_path, index)
+    keyindex.update_partitions(excel_path, key_rows)
+    summary.update_cache(excel_path, aggregates)
+
+def key_strings(serie):
+    """Claves distintas de una columna Int64 como texto ordenado (para indice.json)"""
+    return sorted(str(key) for key in serie.dropna().unique())
+
+def partition_key_rows(part):
+    """Filas de una partición para el índice de claves: (fila, pedido, expediente, factura, status)"""
+    def text(col, normalize=True):
+        if col not in part.columns:
+            return [None] * len(part)
+        values = part[col].map(normalize_key) if normalize else part[col].astype('string').fillna('')
+        return [value or None for value in values]
+    return list(zip(range(2, len(part) + 2), text('Numero de Pedido'), text('Nº de pieza'),
+                    text('No factura'), text('Status', normalize=False)))
+
+def reindex_keys(excel_path):
+    """Reconstruye el índice de claves leyendo solo esas columnas de cada partición"""
+    index = load_index(excel_path)
+    columns = KEY_COLUMNS + ['No factura', 'Status']
+    key_rows = {name: partition_key_rows(read_columns(partition_path(excel_path, name), columns))
+                for name in sorted(index['particiones'])
+                if os.path.exists(partition_path(excel_path, name))}
+    keyindex.update_partitions(excel_path, key_rows)
+    print(f"Índice de claves reconstruido: {keyindex.key_index_path(excel_path)} "
+          f"({sum(len(rows) for rows in key_rows.values())} filas)")
+
+def ensure_partitioned(excel_path):
+    """
+    Migra un data.xlsx monolítico a particiones mensuales la primera vez que se usa. La
+    migración está hecha cuando existe indice.json: la carpeta de datos puede existir antes
+    (bloqueo, avances, cuarentena) sin tener todavía el historial.
+    """
+    if os.path.exists(index_path(excel_path)) or not os.path.exists(excel_path):
+        return
+    with locked_dir(os.path.dirname(partition_dir(excel_path)) or '.'):
+        # Otro proceso pudo migrarlo mientras se esperaba el bloqueo
+        if not os.path.exists(index_path(excel_path)):
+            _migrate(excel_path)
+
+def _migrate(excel_path):
+    """
+    Escribe las particiones en una carpeta temporal y después las pasa a la de datos, con
+    indice.json al final: si la migración se interrumpe, la siguiente corrida la repite
+    desde data.xlsx en lugar de partir de un almacén a medias.
+    """
+    target = partition_dir(excel_path)
+    print(f"Migrando {excel_path} a particiones mensuales en {target}/ ...")
+    staging_excel = target + '.migrando.xlsx'  # Sus particiones van en <data>.migrando/
+    staging = partition_dir(staging_excel)
+    shutil.rmtree(staging, ignore_errors=True)  # Restos de una migración interrumpida
+    df = schema.from_excel(pd.read_excel(excel_path))
+    index = {'particiones': {}}
+    assign_partitions(df, index)
+    _save_partitions(staging_excel, df, index)
+    if not os.path.isdir(target):
+        try:
+            os.replace(staging, target)
+            return
+        except OSError:
+            pass  # Otra etapa creó la carpeta mientras tanto (avances, cuarentena)
+    names = sorted(os.listdir(staging), key=lambda name: name == INDEX_FILE)
+    for name in names:
+        if name != LOCK_FILE:
+            os.replace(os.path.join(staging, name), os.path.join(target, name))
+    shutil.rmtree(staging, ignore_errors=True)
+
+def export_combined(excel_path, output_path=None):
+    """Escribe un solo libro con todas las particiones (por defecto en la ruta de data.xlsx)"""
+    df = load_all(excel_path).drop(columns=[PARTITION_COLUMN])
+    output_path = output_path or excel_path
+    schema.for_excel(df).to_excel(output_path, index=False)
+    print(f"Exportados {len(df)} registros a: {output_path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Almacén particionado por mes - Exporta la vista combinada o reconstruye el índice de claves.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Ejemplo de uso:
+    python scripts/store.py exportar output/data.xlsx
+    python scripts/store.py exportar output/data.xlsx --destino output/historial.xlsx
+    python scripts/store.py reindexar output/data.xlsx
+
+Estructura de carpetas:
+    output/
+        data/             → Particiones mensuales (2024-10.xlsx, ...), indice.json y claves.sqlite
+        data.xlsx         → Vista combinada (se genera con 'exportar')
+        """
+    )
+    parser.add_argument("accion", choices=["exportar", "reindexar"], help="Acción a realizar")
+    parser.add_argument("excel_path", help="Ruta del archivo Excel (output/data.xlsx)")
+    parser.add_argument("--destino", help="Ruta del libro combinado (default: la misma de excel_path)")
+    args = parser.parse_args()
+
+    if not os.path.isdir(partition_dir(args.excel_path)) and not os.path.exists(args.excel_path):
+        print(f"No existen datos en {partition_dir(args.excel_path)}/")
+        sys.exit(1)
+    if args.accion == "reindexar":
+        reindex_keys(args.excel_path)
+    else:
+        export_combined(args.excel_path, args.destino)
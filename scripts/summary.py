@@ -0,0 +1,143 @@
+import os
+import sys
+import json
+import argparse
+from datetime import datetime, timedelta
+import pandas as pd
+from dates import to_datetime_column
+from money import cents_to_pesos
+import store
+
+# Resumen para finanzas (output/resumen.xlsx): filas por status y mes, totales por status y
+# pedidos sin facturar con más de N días. Los agregados de cada partición se guardan en
+# output/data/resumen.json cuando store.save_partitions la reescribe, así que armar el
+# resumen solo combina esos agregados y no vuelve a leer el historial.
+SUMMARY_CACHE_FILE = 'resumen.json'
+SIN_STATUS = 'NO FACTURADO'
+
+def cache_path(excel_path):
+    return os.path.join(os.path.splitext(excel_path)[0], SUMMARY_CACHE_FILE)
+
+def partition_aggregates(part):
+    """
+    Agregados de una partición en una pasada: {'por_status': {status: {filas, subtotal,
+    impuesto}}, 'sin_facturar': [[pedido, fecha más antigua, líneas, subtotal]]}; centavos
+    """
+    def column(name):
+        return part[name] if name in part.columns else pd.Series(None, index=part.index, dtype=object)
+
+    status = column('Status').astype('string').str.strip().fillna(SIN_STATUS).replace('', SIN_STATUS)
+    df = pd.DataFrame({
+        'status': status,
+        'pedido': column('Numero de Pedido'),
+        'fecha': to_datetime_column(column('Fecha')),
+        'subtotal': pd.to_numeric(column('Subtotal')).fillna(0),
+        'impuesto': pd.to_numeric(column('Impuesto')).fillna(0),
+    })
+    por_status = df.groupby('status').agg(filas=('subtotal', 'size'), subtotal=('subtotal', 'sum'),
+                                          impuesto=('impuesto', 'sum'))
+    sin_facturar = (df[df['status'] == SIN_STATUS]
+                    .groupby('pedido').agg(fecha=('fecha', 'min'), lineas=('subtotal', 'size'),
+                                           subtotal=('subtotal', 'sum')))
+    return {
+        'por_status': {status: {'filas': int(row.filas), 'subtotal': int(row.subtotal), 'impuesto': int(row.impuesto)}
+                       for status, row in por_status.iterrows()},
+        'sin_facturar': [[str(pedido), row.fecha.strftime('%Y-%m-%d') if pd.notna(row.fecha) else None,
+                          int(row.lineas), int(row.subtotal)]
+                         for pedido, row in sin_facturar.iterrows()],
+    }
+
+def load_cache(excel_path):
+    path = cache_path(excel_path)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def update_cache(excel_path, aggregates):
+    """Reemplaza los agregados de las particiones reescritas ({partición: agregados})"""
+    if not aggregates:
+        return
+    with store.locked(excel_path):
+        cache = load_cache(excel_path)
+        cache.update(aggregates)
+        path = cache_path(excel_path)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+def build_summary(excel_path, dias=30):
+    """Combina los agregados por partición; calcula solo los de particiones que aún no los tienen"""
+    index = store.load_index(excel_path)
+    cache = load_cache(excel_path)
+    missing = [name for name in sorted(index['particiones']) if name not in cache]
+    if missing:
+        print(f"Calculando agregados de {len(missing)} particiones sin resumen previo...")
+        # Bloqueado para no pisar los agregados que otro proceso guarde al reescribir una partición
+        with store.locked(excel_path):
+            update_cache(excel_path, {name: partition_aggregates(store.load_partitions(excel_path, [name]))
+                                      for name in missing})
+        cache = load_cache(excel_path)
+
+    filas = [{'Mes': name, 'Status': status, 'Filas': valores['filas'],
+              'Subtotal': valores['subtotal'], 'Impuesto': valores['impuesto']}
+             for name in sorted(index['particiones']) if name in cache
+             for status, valores in cache[name]['por_status'].items()]
+    df = pd.DataFrame(filas, columns=['Mes', 'Status', 'Filas', 'Subtotal', 'Impuesto'])
+    por_mes = df.pivot_table(index='Mes', columns='Status', values='Filas', aggfunc='sum', fill_value=0)
+    por_mes['Total'] = por_mes.sum(axis=1)
+    totales = df.groupby('Status')[['Filas', 'Subtotal', 'Impuesto']].sum()
+
+    # Un pedido puede tener líneas en más de una partición
+    pendientes = pd.DataFrame([row for name in cache if name in index['particiones']
+                               for row in cache[name]['sin_facturar']],
+                              columns=['Numero de Pedido', 'Fecha', 'Lineas', 'Subtotal'])
+    pendientes['Fecha'] = pd.to_datetime(pendientes['Fecha'])
+    pendientes = pendientes.groupby('Numero de Pedido', as_index=False).agg(
+        Fecha=('Fecha', 'min'), Lineas=('Lineas', 'sum'), Subtotal=('Subtotal', 'sum'))
+    limite = pd.Timestamp(datetime.now().date() - timedelta(days=dias))
+    pendientes = pendientes[pendientes['Fecha'] <= limite].sort_values('Fecha')
+    pendientes['Dias'] = (pd.Timestamp(datetime.now().date()) - pendientes['Fecha']).dt.days
+
+    for tabla in (totales, pendientes):
+        for col in ('Subtotal', 'Impuesto'):
+            if col in tabla.columns:
+                tabla[col] = cents_to_pesos(tabla[col])
+    return por_mes, totales, pendientes
+
+def write_summary(excel_path, output_path, dias=30):
+    por_mes, totales, pendientes = build_summary(excel_path, dias)
+    with pd.ExcelWriter(output_path) as writer:
+        por_mes.to_excel(writer, sheet_name='Por mes')
+        totales.to_excel(writer, sheet_name='Totales por status')
+        pendientes.to_excel(writer, sheet_name=f'Sin facturar +{dias} dias', index=False)
+    print(f"Resumen guardado en: {output_path} ({len(pendientes)} pedidos sin facturar con más de {dias} días)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Resumen de Facturación - Status por mes, totales y pedidos sin facturar.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Ejemplo de uso:
+    python scripts/summary.py output/data.xlsx
+    python scripts/summary.py output/data.xlsx --dias 45 --output output/resumen.xlsx
+
+Estructura de carpetas:
+    output/
+        data/resumen.json → Agregados por partición (se actualizan al guardar cada partición)
+        resumen.xlsx      → Hojas 'Por mes', 'Totales por status' y 'Sin facturar +N dias'
+        """
+    )
+    parser.add_argument("excel_path", help="Ruta del archivo Excel (output/data.xlsx)")
+    parser.add_argument("--output", default="output/resumen.xlsx",
+                        help="Ruta del resumen (default: output/resumen.xlsx)")
+    parser.add_argument("--dias", type=int, default=30,
+                        help="Antigüedad mínima de los pedidos sin facturar a listar (default: 30)")
+    args = parser.parse_args()
+
+    if not os.path.isdir(store.partition_dir(args.excel_path)) and not os.path.exists(args.excel_path):
+        print(f"No existen datos en {store.partition_dir(args.excel_path)}/")
+        sys.exit(1)
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    write_summary(args.excel_path, args.output, args.dias)
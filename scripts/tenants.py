@@ -0,0 +1,177 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import inputs
+import scheduler
+
+# Corre el proceso completo (los mismos pasos que app.js) para varios clientes a la vez.
+# Cada cliente tiene su propia carpeta con PDF-PEDIDOS/, PDF-FACTURAS/ y output/, y cada paso
+# corre como proceso aparte dentro de esa carpeta, así que sus resultados y logs no se mezclan.
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+STEPS = [
+    ['extract.py', 'PDF-PEDIDOS', 'output/data.xlsx', 'output/log.txt'],
+    ['detect.py', 'PDF-FACTURAS', 'output/data.xlsx', '--log_file', 'output/log_facturas.txt'],
+    ['detect2.py', 'PDF-FACTURAS', 'output/data.xlsx', '--log_file', 'output/log_facturas_nuevas.txt'],
+    ['reconcile.py', 'PDF-FACTURAS', 'output/data.xlsx', '--output', 'output/conciliacion.xlsx',
+     '--log_file', 'output/log_conciliacion.txt'],
+    ['summary.py', 'output/data.xlsx', '--output', 'output/resumen.xlsx'],
+]
+NO_WORKERS = {'summary.py'}  # pasos que no usan procesos
+# Etapas que leen cada carpeta; un lote ya procesado por todas ellas no se vuelve a contar
+FOLDER_STAGES = {'PDF-PEDIDOS': ['extract'], 'PDF-FACTURAS': ['detect', 'detect2']}
+LOG_FILE = 'output/log_lote.txt'
+
+def load_config(config_path):
+    """
+    Lee la lista de clientes: {"clientes": [{"nombre": ..., "directorio": ...}, ...]}.
+    Los directorios relativos se toman respecto al archivo de configuración.
+    """
+    with open(config_path, encoding='utf-8') as f:
+        config = json.load(f)
+    base = os.path.dirname(os.path.abspath(config_path))
+    tenants = []
+    for tenant in config['clientes']:
+        directory = os.path.join(base, tenant['directorio'])
+        tenants.append({'nombre': tenant.get('nombre') or os.path.basename(directory), 'directorio': directory})
+    return tenants, config.get('presupuesto_workers')
+
+def count_documents(directory):
+    """PDFs a procesar de un cliente (sueltos y dentro de lotes) para medir el rendimiento"""
+    registry = inputs.registry_path(os.path.join(directory, STEPS[0][2]))
+    total = 0
+    for folder, stages in FOLDER_STAGES.items():
+        path = os.path.join(directory, folder)
+        if not os.path.isdir(path):
+            continue
+        processed = [inputs.load_processed(registry, stage) for stage in stages]
+        done = {name: fingerprint for name, fingerprint in processed[0].items()
+                if all(other.get(name) == fingerprint for other in processed[1:])}
+        pdfs, archives = inputs.discover(path, done)
+        total += len(pdfs)
+        for archive in archives:
+            try:
+                total += inputs.count_archive_pdfs(archive)
+            except Exception:
+                pass  # El paso correspondiente reportará el lote dañado
+    return total
+
+def run_tenant(tenant, workers, memory_mb, print_lock):
+    """Corre los pasos de un cliente en su carpeta; la salida de cada paso va a su log_lote.txt"""
+    directory = tenant['directorio']
+    result = {'nombre': tenant['nombre'], 'documentos': count_documents(directory), 'estado': 'OK', 'pasos': []}
+    os.makedirs(os.path.join(directory, 'output'), exist_ok=True)
+    start = time.perf_counter()
+    with open(os.path.join(directory, LOG_FILE), 'w', encoding='utf-8') as log:
+        for step in STEPS:
+            step_start = time.perf_counter()
+            with print_lock:
+                print(f"[{tenant['nombre']}] {step[0]} ...")
+            log.write(f"\n=== {step[0]} ===\n")
+            log.flush()
+            options = [] if step[0] in NO_WORKERS else ['--workers', str(workers)]
+            if memory_mb and step[0] not in NO_WORKERS:
+                options += ['--memoria_max', str(memory_mb)]
+            completed = subprocess.run(
+                [sys.executable, '-u', os.path.join(SCRIPTS_DIR, step[0])] + step[1:] + options,
+                cwd=directory, stdout=log, stderr=subprocess.STDOUT)
+            result['pasos'].append((step[0], time.perf_counter() - step_start, completed.returncode))
+            if completed.returncode != 0:
+                result['estado'] = f"ERROR en {step[0]} (código {completed.returncode})"
+                break
+    result['segundos'] = time.perf_counter() - start
+    with print_lock:
+        print(f"[{tenant['nombre']}] {result['estado']} en {result['segundos']:.0f} s")
+    return result
+
+def throughput(documents, seconds):
+    return documents / seconds * 60 if seconds > 0 else 0.0
+
+def write_summary(summary_path, results, total_seconds):
+    lines = ["=== RESUMEN DEL LOTE DE CLIENTES ===\n"]
+    for result in results:
+        lines.append(f"{result['nombre']}: {result['estado']}")
+        lines.append(f"   Documentos: {result['documentos']} en {result['segundos']:.0f} s "
+                     f"({throughput(result['documentos'], result['segundos']):.1f} documentos/min)")
+        for step, seconds, code in result['pasos']:
+            lines.append(f"   - {step}: {seconds:.1f} s" + (f" (código {code})" if code else ""))
+    total_documents = sum(result['documentos'] for result in results)
+    secuencial = sum(result['segundos'] for result in results)
+    lines.append(f"\nTotal: {total_documents} documentos de {len(results)} clientes en {total_seconds:.0f} s "
+                 f"({throughput(total_documents, total_seconds):.1f} documentos/min)")
+    lines.append(f"Suma de los tiempos por cliente (equivalente secuencial): {secuencial:.0f} s")
+    text = "\n".join(lines)
+    print("\n" + text)
+    if summary_path:
+        os.makedirs(os.path.dirname(summary_path) or '.', exist_ok=True)
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+        print(f"\nResumen guardado en: {summary_path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Lote de clientes - Procesa las carpetas de varios clientes en paralelo.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Ejemplo de uso:
+    python scripts/tenants.py clientes.json
+    python scripts/tenants.py clientes.json --presupuesto 16 --por_cliente 4
+    python scripts/tenants.py clientes.json --memoria_max 12000
+
+Formato de clientes.json:
+    {
+        "presupuesto_workers": 16,
+        "clientes": [
+            {"nombre": "Aseguradora A", "directorio": "clientes/aseguradora_a"},
+            {"nombre": "Flotilla B", "directorio": "clientes/flotilla_b"}
+        ]
+    }
+
+Estructura de cada carpeta de cliente:
+    PDF-PEDIDOS/      → Pedidos del cliente
+    PDF-FACTURAS/     → Facturas del cliente
+    output/           → Resultados del cliente (data.xlsx, logs, conciliacion.xlsx, resumen.xlsx)
+        log_lote.txt  → Salida de todos los pasos de este cliente
+        """
+    )
+    parser.add_argument("config", help="Archivo JSON con la lista de clientes")
+    parser.add_argument("--presupuesto", type=int,
+                        help="Procesos en total para todos los clientes (default: presupuesto_workers "
+                             "del archivo, o los núcleos disponibles)")
+    parser.add_argument("--por_cliente", type=int,
+                        help="Procesos para cada cliente (default: presupuesto / número de clientes, mínimo 1)")
+    parser.add_argument("--memoria_max", type=int,
+                        help="Memoria en MB para todos los clientes; se reparte entre los que corren a la vez "
+                             "(default: 80%% de la memoria disponible)")
+    parser.add_argument("--resumen", default="output/resumen_clientes.txt",
+                        help="Archivo con el rendimiento por cliente y total (default: output/resumen_clientes.txt)")
+    args = parser.parse_args()
+
+    tenants, config_budget = load_config(args.config)
+    if not tenants:
+        print("El archivo de configuración no tiene clientes.")
+        sys.exit(1)
+    budget = max(1, args.presupuesto or config_budget or os.cpu_count() or 1)
+    per_tenant = max(1, min(args.por_cliente or budget // len(tenants), budget))
+    # Clientes en paralelo sin pasar del presupuesto de procesos
+    concurrent_tenants = max(1, min(len(tenants), budget // per_tenant))
+    # Cada cliente recibe su parte del tope de memoria para que juntos no lo pasen
+    memory_limit = scheduler.memory_limit(args.memoria_max)
+    memory_mb = memory_limit // concurrent_tenants // scheduler.MB if memory_limit else None
+
+    print("\n=== Iniciando Lote de Clientes ===")
+    print(f"Clientes: {len(tenants)} | Presupuesto: {budget} procesos | "
+          f"{per_tenant} por cliente | {concurrent_tenants} clientes a la vez"
+          + (f" | {memory_mb} MB por cliente" if memory_mb else ""))
+
+    print_lock = threading.Lock()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrent_tenants) as executor:
+        results = list(executor.map(lambda tenant: run_tenant(tenant, per_tenant, memory_mb, print_lock), tenants))
+    write_summary(args.resumen, results, time.perf_counter() - start)
+    if any(result['estado'] != 'OK' for result in results):
+        sys.exit(1)
@@ -0,0 +1,255 @@
+import os
+import re
+import sys
+import time
+import sqlite3
+import argparse
+
+# Índice de texto completo de los documentos procesados (output/data/textos.sqlite, SQLite FTS5):
+# por cada PDF guarda su nombre, etapa, formato y folio con el texto que se le extrajo.
+# extract.py, detect.py y detect2.py lo actualizan al guardar cada bloque, así que una búsqueda
+# como "¿qué documentos mencionan 5100912345?" responde sobre todo el historial sin volver a
+# extraer el texto de las carpetas. Como keyindex.py, no usa pandas.
+TEXT_INDEX_FILE = 'textos.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documentos (
+    id INTEGER PRIMARY KEY,         -- rowid del documento en la tabla textos
+    huella TEXT NOT NULL UNIQUE,    -- SHA-256 del PDF: el mismo contenido se indexa una vez
+    nombre TEXT NOT NULL,
+    etapa TEXT,
+    formato TEXT,
+    folio TEXT,
+    indexado REAL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS textos USING fts5(texto, numeros, tokenize = 'unicode61 remove_diacritics 2');
+CREATE VIRTUAL TABLE IF NOT EXISTS textos_vocab USING fts5vocab(textos, 'col');
+"""
+
+# Números separados por un espacio, punto o guion ('1234 5678', '5100-912345'): además de cada
+# grupo se indexa su unión, para encontrarlos aunque se busquen sin separadores
+DIGIT_CHAIN = re.compile(r'\d+(?:[ .\-_/]\d+)*')
+DIGIT_GROUP = re.compile(r'\d+')
+MIN_JOINED, MAX_JOINED = 6, 12  # largo de las uniones que se indexan (expedientes y pedidos)
+SNIPPET_TOKENS = 20
+FRAGMENT_CHARS = 60  # contexto a cada lado de un número encontrado
+SEPARATORS = re.compile(r'[ .\-_/]')
+
+_unavailable = False
+
+def text_index_path(excel_path):
+    # Misma carpeta que store.partition_dir (sin importar store, que carga pandas)
+    return os.path.join(os.path.splitext(excel_path)[0], TEXT_INDEX_FILE)
+
+def connect(excel_path):
+    conn = sqlite3.connect(text_index_path(excel_path), timeout=60)
+    conn.executescript(SCHEMA)
+    return conn
+
+def number_tokens(text):
+    """Números del texto para la columna 'numeros': cada grupo de dígitos y las uniones de grupos contiguos"""
+    tokens = []
+    for chain in DIGIT_CHAIN.findall(text):
+        groups = DIGIT_GROUP.findall(chain)
+        tokens.extend(groups)
+        for start in range(len(groups)):
+            joined = groups[start]
+            for group in groups[start + 1:]:
+                joined += group
+                if len(joined) > MAX_JOINED:
+                    break
+                if len(joined) >= MIN_JOINED:
+                    tokens.append(joined)
+    return ' '.join(tokens)
+
+def add_documents(excel_path, documents):
+    """
+    Agrega o reemplaza documentos en el índice: [(huella, nombre, etapa, formato, folio, texto)].
+    Los que no tienen huella se omiten. Si este SQLite no trae FTS5 se avisa una vez y no se indexa.
+    """
+    global _unavailable
+    documents = [doc for doc in documents if doc[0]]
+    if not documents or _unavailable:
+        return
+    os.makedirs(os.path.dirname(text_index_path(excel_path)), exist_ok=True)
+    try:
+        conn = connect(excel_path)
+    except sqlite3.OperationalError as e:
+        _unavailable = True
+        print(f"⚠️  No se actualiza el índice de texto ({e}); este Python no trae SQLite con FTS5")
+        return
+    try:
+        with conn:
+            now = time.time()
+            for huella, nombre, etapa, formato, folio, texto in documents:
+                row = conn.execute("SELECT id FROM documentos WHERE huella = ?", (huella,)).fetchone()
+                if row:
+                    doc_id = row[0]
+                    conn.execute("UPDATE documentos SET nombre = ?, etapa = ?, formato = ?, folio = ?, indexado = ? "
+                                 "WHERE id = ?", (nombre, etapa, formato, folio, now, doc_id))
+                    conn.execute("DELETE FROM textos WHERE rowid = ?", (doc_id,))
+                else:
+                    doc_id = conn.execute(
+                        "INSERT INTO documentos (huella, nombre, etapa, formato, folio, indexado) VALUES (?, ?, ?, ?, ?, ?)",
+                        (huella, nombre, etapa, formato, folio, now)).lastrowid
+                conn.execute("INSERT INTO textos (rowid, texto, numeros) VALUES (?, ?, ?)",
+                             (doc_id, texto or '', number_tokens(texto or '')))
+    finally:
+        conn.close()
+
+def indexed_digests(excel_path):
+    """Huellas ya indexadas ({huella: nombre}), para no volver a extraer esos documentos"""
+    if not os.path.exists(text_index_path(excel_path)):
+        return {}
+    conn = sqlite3.connect(f"file:{text_index_path(excel_path)}?mode=ro", uri=True)
+    try:
+        return dict(conn.execute("SELECT huella, nombre FROM documentos"))
+    finally:
+        conn.close()
+
+def match_expression(term):
+    """
+    Expresión FTS5 de un término: si solo tiene dígitos y separadores se busca el número
+    completo en la columna 'numeros' ('1234 5678' → 12345678); si no, la frase en el texto
+    """
+    digits = SEPARATORS.sub('', term)
+    if digits.isdigit():
+        return f'numeros : "{digits}"'
+    return 'texto : "' + term.replace('"', '""') + '"'
+
+def near_numbers(conn, number):
+    """Números indexados a una edición de distancia (un dígito de más, de menos, distinto o dos invertidos)"""
+    candidates = conn.execute(
+        "SELECT DISTINCT term FROM textos_vocab WHERE col = 'numeros' AND length(term) BETWEEN ? AND ?",
+        (len(number) - 1, len(number) + 1))
+    return [term for (term,) in candidates if term != number and within_one_edit(term, number)]
+
+def within_one_edit(a, b):
+    if len(a) == len(b):
+        diff = [i for i in range(len(a)) if a[i] != b[i]]
+        return len(diff) == 1 or (len(diff) == 2 and diff[1] == diff[0] + 1
+                                   and a[diff[0]] == b[diff[1]] and a[diff[1]] == b[diff[0]])
+    if len(a) > len(b):
+        a, b = b, a
+    i = next((i for i in range(len(a)) if a[i] != b[i]), len(a))
+    return a[i:] == b[i + 1:]
+
+def number_fragment(texto, number):
+    """Texto alrededor de un número, aunque en el documento venga con separadores ('1234 5678')"""
+    match = re.search(r'[ .\-_/]?'.join(number), texto)
+    if not match:
+        return ''
+    start, end = match.span()
+    return (texto[max(0, start - FRAGMENT_CHARS):start] + '[' + match.group() + ']'
+            + texto[end:end + FRAGMENT_CHARS])
+
+def search(excel_path, term, approximate=False, limit=50):
+    """
+    Documentos que mencionan un término: [(nombre, etapa, formato, folio, fragmento, número
+    aproximado o None)]. Con approximate, un número también se busca con un dígito de diferencia.
+    """
+    conn = sqlite3.connect(f"file:{text_index_path(excel_path)}?mode=ro", uri=True)
+    try:
+        digits = SEPARATORS.sub('', term)
+        if not digits.isdigit():
+            return [row + (None,) for row in conn.execute(
+                "SELECT d.nombre, d.etapa, d.formato, d.folio, "
+                f"snippet(textos, 0, '[', ']', '…', {SNIPPET_TOKENS}) "
+                "FROM textos JOIN documentos d ON d.id = textos.rowid "
+                "WHERE textos MATCH ? ORDER BY rank LIMIT ?", (match_expression(term), limit))]
+        numbers = [digits] + (near_numbers(conn, digits) if approximate else [])
+        results = []
+        for number in numbers:
+            rows = conn.execute(
+                "SELECT d.nombre, d.etapa, d.formato, d.folio, textos.texto "
+                "FROM textos JOIN documentos d ON d.id = textos.rowid "
+                "WHERE textos MATCH ? ORDER BY rank LIMIT ?", (f'numeros : "{number}"', limit)).fetchall()
+            results.extend(row[:4] + (number_fragment(row[4], number), number if number != digits else None)
+                           for row in rows)
+        return results
+    finally:
+        conn.close()
+
+def backfill(input_path, excel_path, workers=1):
+    """
+    Indexa los PDFs de una carpeta o lote (incluidos los archivados) que aún no están en el
+    índice, p. ej. el historial procesado antes de que existiera. Devuelve cuántos se indexaron.
+    """
+    import inputs
+    import pipeline
+    import classify
+    import reconcile
+
+    pdf_paths, archives = inputs.discover(input_path, include_archived=True)
+    seen = indexed_digests(excel_path)  # Los ya indexados se omiten sin extraer su texto
+    classes = {}
+    batch = []
+    total = 0
+    documents = pipeline.stream_documents(pdf_paths, archives, [], {}, seen, workers,
+                                          accept={classify.PEDIDO, classify.FACTURA_A, classify.FACTURA_B},
+                                          classes=classes)
+    for name, source, page_texts, error in documents:
+        if error:
+            print(f"{name}: {error}")
+            continue
+        clase = classes.get(name)
+        texto = '\n'.join(page_texts)
+        if clase == classify.PEDIDO:
+            formato, folio = 'pedido', ', '.join(dict.fromkeys(re.findall(r'Pedido de compra:\s*(\d+)', texto)))
+        else:
+            result = reconcile.choose_layout(page_texts, clase)
+            formato, folio = result['layout'], result['folio']
+        batch.append((inputs.file_digest(source), name, 'indexar', formato, folio, texto))
+        if len(batch) >= 100:
+            add_documents(excel_path, batch)
+            total += len(batch)
+            batch = []
+    add_documents(excel_path, batch)
+    return total + len(batch)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Búsqueda de texto - Encuentra los pedidos y facturas que mencionan un número o texto.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Ejemplo de uso:
+    python scripts/textindex.py buscar 5100912345
+    python scripts/textindex.py buscar "1234 5678" 12345678 --aproximado
+    python scripts/textindex.py buscar "arrastre de grua" --excel output/data.xlsx
+    python scripts/textindex.py indexar PDF-FACTURAS     (historial anterior al índice)
+
+Estructura de carpetas:
+    output/
+        data/
+            textos.sqlite → Índice de texto (se actualiza con extract.py, detect.py y detect2.py)
+        """
+    )
+    parser.add_argument("accion", choices=["buscar", "indexar"], help="Acción a realizar")
+    parser.add_argument("terminos", nargs='+',
+                        help="Números o textos a buscar ('buscar'), o carpetas/lotes a indexar ('indexar')")
+    parser.add_argument("--excel", default="output/data.xlsx",
+                        help="Ruta del archivo Excel (default: output/data.xlsx)")
+    parser.add_argument("--aproximado", action="store_true",
+                        help="Busca también los números con un dígito de diferencia (errores de captura)")
+    parser.add_argument("--limite", type=int, default=50, help="Documentos por término (default: 50)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Procesos para extraer el texto al indexar (default: núcleos disponibles)")
+    args = parser.parse_args()
+
+    if args.accion == "indexar":
+        for folder in args.terminos:
+            print(f"Documentos indexados de {folder}: {backfill(folder, args.excel, args.workers)}")
+        sys.exit(0)
+
+    if not os.path.exists(text_index_path(args.excel)):
+        print(f"No existe el índice de texto {text_index_path(args.excel)}")
+        print("Se crea al correr extract.py, detect.py o detect2.py, o con: python scripts/textindex.py indexar CARPETA")
+        sys.exit(1)
+    for term in args.terminos:
+        inicio = time.perf_counter()
+        rows = search(args.excel, term, args.aproximado, args.limite)
+        print(f"\n=== {term}: {len(rows)} documentos en {(time.perf_counter() - inicio) * 1000:.1f} ms ===")
+        for nombre, etapa, formato, folio, fragmento, near in rows:
+            aproximado = f" (aproximado: {near})" if near else ""
+            print(f"- {nombre} | {formato or '-'} | Folio {folio or '-'} | {etapa}{aproximado}")
+            print(f"    {' '.join(fragmento.split())}")
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Los scripts se importan entre sí por su nombre (import store, import schema...), como al
+# correrlos desde scripts/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
@@ -0,0 +1,53 @@
+import io
+import unittest
+from contextlib import redirect_stdout
+import cfdi
+
+CFDI_40 = b"""<?xml version="1.0" encoding="UTF-8"?>
+<cfdi:Comprobante xmlns:cfdi="http://www.sat.gob.mx/cfd/4" xmlns:tfd="http://www.sat.gob.mx/TimbreFiscalDigital"
+    Serie="A" Folio="1234" Fecha="2024-10-08T12:34:56" SubTotal="1000.00" Total="1160.00">
+  <cfdi:Conceptos>
+    <cfdi:Concepto ClaveProdServ="78101803" Descripcion="Arrastre pedido 5100912345 expediente 1234 5678">
+      <cfdi:Impuestos><cfdi:Traslados><cfdi:Traslado Importe="160.00"/></cfdi:Traslados></cfdi:Impuestos>
+    </cfdi:Concepto>
+    <cfdi:Concepto Descripcion="Servicio 78101803 exp 87654321 y 5100912345"/>
+  </cfdi:Conceptos>
+  <cfdi:Impuestos TotalImpuestosTrasladados="160.00"/>
+  <cfdi:Complemento><tfd:TimbreFiscalDigital UUID="ABC-123"/></cfdi:Complemento>
+</cfdi:Comprobante>"""
+
+CFDI_32 = b"""<cfdi:Comprobante xmlns:cfdi="http://www.sat.gob.mx/cfd/3" serie="B" folio="7"
+    fecha="2016-01-31T10:00:00" subTotal="100" total="116">
+  <cfdi:Conceptos><cfdi:Concepto descripcion="Pedido 5100000001"/></cfdi:Conceptos>
+</cfdi:Comprobante>"""
+
+class AnalyzeInvoiceTest(unittest.TestCase):
+    def test_cfdi_40(self):
+        result = cfdi.analyze_invoice(CFDI_40)
+        self.assertEqual(result['layout'], 'CFDI')
+        self.assertEqual(result['folio'], 'A1234')
+        self.assertEqual(result['fecha'], '08/10/2024')
+        self.assertEqual(result['orders'], ['5100912345'])
+        # La clave SAT del servicio no es un expediente; '1234 5678' se une
+        self.assertEqual(result['expedientes'], ['12345678', '87654321'])
+        self.assertEqual(result['totals'], {'subtotal': 100000, 'impuesto': 16000, 'total': 116000})
+        self.assertEqual(result['uuid'], 'ABC-123')
+
+    def test_cfdi_32_lowercase_attributes(self):
+        result = cfdi.analyze_invoice(io.BytesIO(CFDI_32))
+        self.assertEqual((result['folio'], result['fecha'], result['orders']), ('B7', '31/01/2016', ['5100000001']))
+        self.assertIsNone(result['totals']['impuesto'])
+
+    def test_not_a_cfdi(self):
+        with self.assertRaises(ValueError):
+            cfdi.analyze_invoice(b'<Factura/>')
+
+class ForInvoiceTest(unittest.TestCase):
+    def test_falls_back_to_the_pdf(self):
+        with redirect_stdout(io.StringIO()):
+            self.assertIsNone(cfdi.for_invoice('rota.pdf', b'<cfdi:Comprobante'))
+            self.assertIsNone(cfdi.for_invoice('sin_refs.pdf', CFDI_32.replace(b'Pedido 5100000001', b'Arrastre')))
+            self.assertEqual(cfdi.for_invoice('a.pdf', CFDI_40)['folio'], 'A1234')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+import checkpoint
+import extract
+import store
+
+class CheckpointTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.excel_path = os.path.join(self.dir, 'data.xlsx')
+        self.path = checkpoint.checkpoint_path(self.excel_path, 'extract')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_resume_discards_a_partial_last_line(self):
+        checkpoint.append_checkpoint(self.path, [{'documento': 'a.pdf', 'huella': 'h1'}])
+        checkpoint.append_checkpoint(self.path, [{'documento': 'b.pdf', 'huella': 'h2'}])
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write('{"documento": "c.pd')  # El proceso murió escribiendo
+        with redirect_stdout(io.StringIO()):
+            entries = checkpoint.load_checkpoint(self.path)
+        self.assertEqual([entry['documento'] for entry in entries], ['a.pdf', 'b.pdf'])
+        self.assertEqual(checkpoint.seen_digests(entries), {'h1': 'a.pdf', 'h2': 'b.pdf'})
+        with open(self.path, encoding='utf-8') as f:
+            self.assertEqual(len(f.readlines()), 2)
+        checkpoint.clear_checkpoint(self.path)
+        self.assertEqual(checkpoint.load_checkpoint(self.path), [])
+
+    def test_applied_chunk_is_recorded_after_the_store(self):
+        record = {"Numero de Pedido": 5100000001, "Numero de linea": 10, "Nº de pieza": 11112222,
+                  "Tipo": "Material", "Fecha": "08/10/2024", "Precio por unidad": 10000,
+                  "Subtotal": 10000, "Impuesto": 1600}
+        chunk = [('a.pdf', [record]), ('vacio.pdf', [])]
+        with redirect_stdout(io.StringIO()):
+            extract.apply_chunk(self.excel_path, self.path, chunk, {'h1': 'a.pdf'},
+                                malformed={'vacio.pdf': ['Pos. Material']})
+            # Una corrida reanudada ve el bloque aplicado y los registros ya guardados
+            entries = checkpoint.load_checkpoint(self.path)
+            self.assertEqual(len(store.load_all(self.excel_path)), 1)
+            # Al repetir el bloque el almacén no duplica el registro
+            extract.apply_chunk(self.excel_path, self.path, chunk[:1], {'h1': 'a.pdf'})
+            self.assertEqual(len(store.load_all(self.excel_path)), 1)
+        self.assertEqual([(e['documento'], e['huella'], e['invalido']) for e in entries],
+                         [('a.pdf', 'h1', False), ('vacio.pdf', None, True)])
+        self.assertEqual(entries[0]['pedidos'], ['5100000001'])
+        self.assertEqual(entries[1]['malformadas'], ['Pos. Material'])
+
+if __name__ == '__main__':
+    unittest.main()
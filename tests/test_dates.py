@@ -0,0 +1,46 @@
+import datetime
+import unittest
+import pandas as pd
+from dates import month_number, parse_date, find_required_date, to_datetime_column
+
+class ParseDateTest(unittest.TestCase):
+    def test_month_names_and_abbreviations(self):
+        self.assertEqual(month_number('oct'), '10')
+        self.assertEqual(month_number('Sept.'), '09')
+        self.assertEqual(month_number('diciembre'), '12')
+        self.assertIsNone(month_number('pieza'))
+
+    def test_parse_date(self):
+        self.assertEqual(parse_date('8 oct 2024'), '08/10/2024')
+        self.assertEqual(parse_date('15 Sept. 2023'), '15/09/2023')
+        self.assertIsNone(parse_date('8 oct'))
+        self.assertIsNone(parse_date('8 oct 24'))
+
+    def test_required_date_is_searched_below_the_keywords(self):
+        lines = ['Pos. Material', 'Fecha para la que se requiere', '10 1 12345678 5 oct 2024', 'Total']
+        self.assertEqual(find_required_date(lines), '05/10/2024')
+        self.assertIsNone(find_required_date(['10 1 12345678 5 oct 2024']))
+
+class ToDatetimeColumnTest(unittest.TestCase):
+    def check(self, serie):
+        result = to_datetime_column(serie)
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(result))
+        self.assertEqual(result.iloc[0], pd.Timestamp(2024, 10, 8))
+        self.assertTrue(result.iloc[1:].isna().all())
+
+    def test_object_column(self):
+        self.check(pd.Series(['08/10/2024', 'Sin fecha', None], dtype=object))
+
+    def test_text_columns(self):
+        # pandas 3 lee los textos de un Excel como 'str'
+        self.check(pd.Series(['08/10/2024', 'Sin fecha', None], dtype='string'))
+        self.check(pd.Series(['08/10/2024', 'Sin fecha', None], dtype='str'))
+
+    def test_mixed_dates_and_text(self):
+        self.check(pd.Series([datetime.datetime(2024, 10, 8), 'Sin fecha'], dtype=object))
+
+    def test_numeric_column_is_not_a_date(self):
+        self.assertTrue(to_datetime_column(pd.Series([1.0, 2.0])).isna().all())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import io
+import unittest
+from contextlib import redirect_stdout
+import extract
+
+class MaterialRowsTest(unittest.TestCase):
+    def test_columns_of_well_formed_rows(self):
+        text = ("Pedido de compra: 5100000001\n"
+                "10 1 12345678 87654321 Material Arrastre $1,500.50 $240.08\n"
+                "texto libre\n"
+                "  20\t2 12345679 ABC-12 Material Grua $850 IVA $136.00\n"
+                "30 1 12345680 5555 Material sin importes\n"
+                "40 1 12345681 7777 Material MXN$1.234,56 x $10 y $20.10")
+        columns, malformed = extract.parse_material_rows(text)
+        self.assertEqual(malformed, [])
+        self.assertEqual(columns, {
+            'linea': [10, 20, 30, 40],
+            'repartos': [1, 2, 1, 1],
+            'pieza': [12345678, 12345679, 12345680, 12345681],
+            'pieza_cliente': [87654321, 12, 5555, 7777],  # Como convert_to_number
+            'precio': [150050, 85000, 0, 123456],  # Primer importe con '$'
+            'impuesto': [24008, 13600, 0, 2010],  # Último importe con '$'
+        })
+
+    def test_malformed_rows_are_reported(self):
+        text = "Pos. Rep. Material Descripción\n10 1 Material $5\nMaterial\n10 1 22223333 4 Material $1"
+        columns, malformed = extract.parse_material_rows(text)
+        self.assertEqual(malformed, ["Pos. Rep. Material Descripción", "10 1 Material $5", "Material"])
+        self.assertEqual(columns['pieza'], [22223333])
+
+    def test_parse_texts_builds_records(self):
+        pages = ["Pedido de compra: 5100000001\n10 1 12345678 5 Material $100.00 $16.00",
+                 "Pos. Material\n20 1 12345679 6 Material $50.00 $8.00"]
+        malformed = []
+        with redirect_stdout(io.StringIO()):
+            records = extract.parse_texts(pages, malformed)
+        self.assertEqual([(r["Numero de Pedido"], r["Nº de pieza"], r["Precio por unidad"], r["Impuesto"])
+                          for r in records], [(5100000001, 12345678, 10000, 1600), (5100000001, 12345679, 5000, 800)])
+        self.assertEqual(records[0]["Fecha"], "Sin fecha")
+        self.assertEqual(malformed, ["Pos. Material"])
+
+    def test_malformed_report_lines(self):
+        completed = [{'documento': 'a.pdf', 'malformadas': ['Pos. Material']}, {'documento': 'b.pdf'}]
+        lines = extract.malformed_report_lines(completed)
+        self.assertIn("- a.pdf:", lines)
+        self.assertEqual(extract.malformed_report_lines([{'documento': 'b.pdf'}]), [])
+
+if __name__ == '__main__':
+    unittest.main()
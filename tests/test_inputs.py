@@ -0,0 +1,69 @@
+import io
+import os
+import shutil
+import tarfile
+import zipfile
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+import inputs
+import tenants
+
+def write_zip(path, members):
+    with zipfile.ZipFile(path, 'w') as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+
+def write_tar(path, members):
+    with tarfile.open(path, 'w:gz') as tf:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+
+MEMBERS = {'a/pedido1.pdf': b'%PDF-1', 'a/pedido1.xml': b'<x/>', 'pedido2.PDF': b'%PDF-2', 'notas.txt': b'-'}
+
+class ArchiveTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_count_archive_pdfs(self):
+        write_zip(os.path.join(self.dir, 'lote.zip'), MEMBERS)
+        write_tar(os.path.join(self.dir, 'lote.tar.gz'), MEMBERS)
+        self.assertEqual(inputs.count_archive_pdfs(os.path.join(self.dir, 'lote.zip')), 2)
+        self.assertEqual(inputs.count_archive_pdfs(os.path.join(self.dir, 'lote.tar.gz')), 2)
+
+    def test_iter_archive_reads_companion_xml(self):
+        for name, write in (('lote.zip', write_zip), ('lote.tar.gz', write_tar)):
+            path = os.path.join(self.dir, name)
+            write(path, MEMBERS)
+            companions = {}
+            names = {member: source.getvalue() for member, source in inputs.iter_archive(path, companions)}
+            self.assertEqual(names, {f'{name}:a/pedido1.pdf': b'%PDF-1', f'{name}:pedido2.PDF': b'%PDF-2'})
+            self.assertEqual(companions, {f'{name}:a/pedido1.pdf': b'<x/>'})
+
+    def test_count_documents_skips_processed_archives(self):
+        pedidos = os.path.join(self.dir, 'PDF-PEDIDOS')
+        facturas = os.path.join(self.dir, 'PDF-FACTURAS')
+        os.makedirs(pedidos)
+        os.makedirs(facturas)
+        write_zip(os.path.join(pedidos, 'lote.zip'), MEMBERS)
+        write_zip(os.path.join(facturas, 'lote.zip'), MEMBERS)
+        with open(os.path.join(pedidos, 'suelto.pdf'), 'wb') as f:
+            f.write(b'%PDF-3')
+        self.assertEqual(tenants.count_documents(self.dir), 5)
+
+        registry = inputs.registry_path(os.path.join(self.dir, 'output', 'data.xlsx'))
+        with redirect_stdout(io.StringIO()):
+            inputs.mark_processed(registry, 'extract', [os.path.join(pedidos, 'lote.zip')])
+            # Las facturas siguen pendientes mientras detect2 no procese el lote
+            inputs.mark_processed(registry, 'detect', [os.path.join(facturas, 'lote.zip')])
+            self.assertEqual(tenants.count_documents(self.dir), 3)
+            inputs.mark_processed(registry, 'detect2', [os.path.join(facturas, 'lote.zip')])
+            self.assertEqual(tenants.count_documents(self.dir), 1)
+
+if __name__ == '__main__':
+    unittest.main()
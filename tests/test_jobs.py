@@ -0,0 +1,134 @@
+import io
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+import classify
+import extract
+import jobs
+import keyindex
+import store
+
+class LeaseTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        folder = os.path.join(self.dir, 'PDF-PEDIDOS')
+        os.makedirs(folder)
+        for name, data in (('a.pdf', b'%PDF-a'), ('b.pdf', b'%PDF-b'), ('copia_a.pdf', b'%PDF-a')):
+            with open(os.path.join(folder, name), 'wb') as f:
+                f.write(data)
+        self.conn = jobs.connect(os.path.join(self.dir, 'cola.sqlite'))
+        with redirect_stdout(io.StringIO()):
+            self.added = jobs.enqueue(self.conn, 'pedido', folder)
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.dir)
+
+    def state(self, job_id):
+        return self.conn.execute("SELECT estado, worker, intentos FROM trabajos WHERE id = ?", (job_id,)).fetchone()
+
+    def test_same_content_is_enqueued_once(self):
+        self.assertEqual(self.added, (2, 1))
+
+    def test_leased_job_is_not_taken_twice(self):
+        first = jobs.claim(self.conn, 'w1', 60)
+        second = jobs.claim(self.conn, 'w2', 60)
+        self.assertNotEqual(first['id'], second['id'])
+        self.assertIsNone(jobs.claim(self.conn, 'w3', 60))
+
+    def test_expired_lease_is_taken_over(self):
+        job = jobs.claim(self.conn, 'w1', -1)  # Lease ya vencido: como si w1 hubiera muerto
+        retaken = jobs.claim(self.conn, 'w2', 60)
+        self.assertEqual(retaken['id'], job['id'])
+        self.assertEqual(self.state(job['id']), ('en_proceso', 'w2', 2))
+        # El resultado tardío del worker que perdió el lease se descarta
+        self.assertFalse(jobs.submit(self.conn, job['id'], 'w1', {'reporte': []}))
+        self.assertTrue(jobs.submit(self.conn, job['id'], 'w2', {'reporte': [1]}))
+        estado, resultado = self.conn.execute("SELECT estado, resultado FROM trabajos WHERE id = ?",
+                                              (job['id'],)).fetchone()
+        self.assertEqual((estado, json.loads(resultado)), ('hecho', {'reporte': [1]}))
+
+    def test_job_that_keeps_dying_ends_in_error(self):
+        for _ in range(jobs.MAX_INTENTOS):
+            job_id = jobs.claim(self.conn, 'w1', -1)['id']
+            self.conn.execute("UPDATE trabajos SET estado = 'hecho' WHERE id != ?", (job_id,))
+        with redirect_stdout(io.StringIO()):
+            self.assertIsNone(jobs.claim(self.conn, 'w2', 60))
+        self.assertEqual(self.state(job_id)[0], 'error')
+
+    def test_failed_job_goes_back_to_the_queue(self):
+        job = jobs.claim(self.conn, 'w1', 60)
+        jobs.fail(self.conn, job['id'], 'w1', 'PDF dañado')
+        self.assertEqual(self.state(job['id']), ('pendiente', None, 1))
+        self.assertEqual(jobs.claim(self.conn, 'w2', 60)['id'], job['id'])
+
+    def test_unreadable_pedido_is_retried_and_ends_in_error(self):
+        # Los PDFs de prueba no son PDFs válidos: cada intento falla y vuelve a la cola
+        with redirect_stdout(io.StringIO()):
+            procesados = jobs.work(os.path.join(self.dir, 'cola.sqlite'))
+        self.assertEqual(procesados, 0)
+        rows = self.conn.execute("SELECT estado, intentos, error FROM trabajos").fetchall()
+        self.assertEqual([(estado, intentos) for estado, intentos, _ in rows], [('error', jobs.MAX_INTENTOS)] * 2)
+        self.assertTrue(all(error for _, _, error in rows))
+
+# Texto de cada factura de prueba, por ruta (sin generar PDFs)
+INVOICE_TEXTS = {
+    'fa.pdf': 'SERIE: A\nFOLIO: 123\nDESCRIPCIÓN\nPEDIDO 5100912345',
+    'fb.pdf': 'Folio A456\nFecha emisión 2024-11-01 10:00:00\nARRASTRE DE GRUA PEDIDO DE COMPRA 5100000002',
+    'otra.pdf': 'Factura sin marcas\nPEDIDO 5100912345',
+}
+
+def fake_classify(source):
+    if source not in INVOICE_TEXTS:
+        return classify.IMAGEN, '1 página, sin texto al inicio'
+    return classify.classify_text(INVOICE_TEXTS[source]), '1 página'
+
+@mock.patch.object(jobs, 'read_page_texts', lambda source: [INVOICE_TEXTS[source]])
+@mock.patch.object(jobs.classify, 'classify', fake_classify)
+class InvoiceRoutingTest(unittest.TestCase):
+    def run_invoice(self, name):
+        with redirect_stdout(io.StringIO()):
+            return jobs.run_job({'tipo': 'factura', 'miembro': '', 'origen': name, 'nombre': name})
+
+    def test_only_the_layout_of_the_class_is_analysed(self):
+        self.assertEqual(set(self.run_invoice('fa.pdf')) - {'clase'}, {'A'})
+        self.assertEqual(set(self.run_invoice('fb.pdf')) - {'clase'}, {'B'})
+
+    def test_unknown_layout_uses_both_when_neither_has_a_folio(self):
+        resultado = self.run_invoice('otra.pdf')
+        self.assertEqual(resultado['clase'], classify.DESCONOCIDO)
+        self.assertEqual(set(resultado) - {'clase'}, {'A', 'B'})
+
+    def test_rejected_documents_are_not_analysed(self):
+        self.assertEqual(set(self.run_invoice('scan.pdf')), {'clase', 'detalle'})
+
+    def test_applying_a_layout_a_invoice_keeps_its_folio(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        excel_path = os.path.join(tmp, 'data.xlsx')
+        db_path = os.path.join(tmp, 'cola.sqlite')
+        record = {"Numero de Pedido": 5100912345, "Numero de linea": 10, "Nº de pieza": 11112222,
+                  "Tipo": "Material", "Fecha": "08/10/2024", "Precio por unidad": 10000,
+                  "Subtotal": 10000, "Impuesto": 1600}
+        conn = jobs.connect(db_path)
+        conn.execute("INSERT INTO trabajos (tipo, origen, nombre, huella, estado, resultado) "
+                     "VALUES ('factura', 'fa.pdf', 'fa.pdf', 'h1', 'hecho', ?)",
+                     (json.dumps(self.run_invoice('fa.pdf')),))
+        conn.close()
+        with redirect_stdout(io.StringIO()):
+            extract.merge_records(excel_path, [record])
+            jobs.apply_results(db_path, excel_path)
+            df = store.load_all(excel_path)
+        self.assertEqual(df['No factura'].tolist(), ['A123'])
+        self.assertEqual(df['Status'].tolist(), ['FACTURADO'])
+        # Queda registrada para la conciliación
+        registradas, refs = keyindex.load_invoices(excel_path)
+        self.assertEqual([row[:4] for row in registradas], [('h1', 'fa.pdf', 'A', 'A123')])
+        self.assertEqual(refs, [('fa.pdf', 'A123', 'pedido', '5100912345')])
+
+if __name__ == '__main__':
+    unittest.main()
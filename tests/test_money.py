@@ -0,0 +1,51 @@
+import io
+import unittest
+from contextlib import redirect_stdout
+import pandas as pd
+from money import parse_cents, to_cents, format_cents, pesos_to_cents, cents_to_pesos, find_invoice_totals
+
+class ParseCentsTest(unittest.TestCase):
+    def test_separators(self):
+        self.assertEqual(parse_cents('$1,234.56'), 123456)
+        self.assertEqual(parse_cents('1.234,56 MXN'), 123456)
+        self.assertEqual(parse_cents('$850'), 85000)
+        self.assertEqual(parse_cents('12,5'), 1250)  # Solo comas: la coma es decimal
+
+    def test_rounding_is_exact(self):
+        self.assertEqual(parse_cents('0.005'), 1)
+        self.assertEqual(parse_cents('1.115'), 112)
+
+    def test_invalid_text_is_zero(self):
+        with redirect_stdout(io.StringIO()):
+            self.assertEqual(parse_cents('$'), 0)
+
+class ConversionTest(unittest.TestCase):
+    def test_to_cents(self):
+        self.assertEqual(to_cents(1.1), 110)
+        self.assertEqual(to_cents('$2.50'), 250)
+        self.assertEqual(to_cents(250), 250)
+        self.assertIsNone(to_cents(None))
+        self.assertIsNone(to_cents(float('nan')))
+        self.assertIsNone(to_cents('  '))
+
+    def test_format_cents(self):
+        self.assertEqual(format_cents(123456), '1234.56')
+        self.assertEqual(format_cents(-5), '-0.05')
+        self.assertEqual(format_cents(None), '')
+
+    def test_excel_round_trip(self):
+        cents = pesos_to_cents(pd.Series([1500.5, 0.1 + 0.2, None]))
+        self.assertEqual(cents.tolist()[:2], [150050, 30])
+        self.assertTrue(pd.isna(cents.iloc[2]))
+        self.assertEqual(cents_to_pesos(cents).tolist()[:2], [1500.5, 0.3])
+
+class InvoiceTotalsTest(unittest.TestCase):
+    def test_last_occurrence_of_each_total(self):
+        text = "Subtotal $1,000.00\nIVA 16% $160.00\nTotal $1,160.00\nSub-total $2,000.00\nTOTAL 2,320.00"
+        self.assertEqual(find_invoice_totals(text), {'subtotal': 200000, 'impuesto': 16000, 'total': 232000})
+
+    def test_missing_totals(self):
+        self.assertEqual(find_invoice_totals("Sin importes"), {'subtotal': None, 'impuesto': None, 'total': None})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+import inputs
+import keyindex
+import reconcile
+
+def invoice_entry(documento, huella, folio, orders, subtotal):
+    return {'documento': documento, 'huella': huella, 'formato': 'A', 'folio': folio, 'fecha': None,
+            'totales': {'subtotal': subtotal, 'impuesto': None, 'total': None},
+            'orders': orders, 'expedientes': []}
+
+class RegisteredInvoicesTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.folder = os.path.join(self.dir, 'PDF-FACTURAS')
+        os.makedirs(self.folder)
+        self.excel_path = os.path.join(self.dir, 'output', 'data.xlsx')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, data):
+        path = os.path.join(self.folder, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return inputs.file_digest(path)
+
+    def extract(self):
+        with redirect_stdout(io.StringIO()):
+            return reconcile.extract_invoices(self.folder, self.excel_path)
+
+    def test_registered_invoices_are_not_extracted_again(self):
+        huella = self.write('fa.pdf', b'%PDF-fa')
+        self.write('copia_fa.pdf', b'%PDF-fa')
+        # Ya archivada: no está en la carpeta, pero sigue registrada
+        keyindex.record_invoices(self.excel_path, 'detect', [
+            invoice_entry('fa.pdf', huella, 'A123', ['5100912345'], 150050),
+            invoice_entry('archivada.pdf', 'h-archivada', 'A100', ['5100912346'], 1000)])
+        with mock.patch.object(reconcile, 'choose_layout', side_effect=AssertionError('se volvió a extraer')):
+            facturas, referencias, errores, aliases = self.extract()
+        self.assertEqual(facturas['Archivo'].tolist(), ['archivada.pdf', 'fa.pdf'])
+        self.assertEqual(facturas['Subtotal factura'].tolist(), [1000, 150050])
+        self.assertEqual(referencias['Referencia'].tolist(), ['5100912346', '5100912345'])
+        self.assertEqual(aliases, {'fa.pdf': ['copia_fa.pdf']})
+        self.assertEqual(errores, [])
+
+    def test_new_invoices_are_registered(self):
+        def stream(pdf_paths, archives, failed, aliases, seen, **kwargs):
+            seen['h-nueva'] = 'nueva.pdf'
+            yield 'nueva.pdf', None, ['Subtotal $10.00'], None
+
+        result = {'layout': 'B', 'folio': 'B7', 'fecha': '01/11/2024', 'orders': ['5100912345'],
+                  'expedientes': [], 'text': 'Subtotal $10.00'}
+        with mock.patch.object(reconcile.pipeline, 'stream_documents', stream), \
+                mock.patch.object(reconcile, 'choose_layout', return_value=result):
+            facturas, referencias, _, _ = self.extract()
+        self.assertEqual(facturas['Subtotal factura'].tolist(), [1000])
+        registradas, refs = keyindex.load_invoices(self.excel_path)
+        self.assertEqual(registradas, [('h-nueva', 'nueva.pdf', 'B', 'B7', '01/11/2024', 1000, None, None)])
+        self.assertEqual(refs, [('nueva.pdf', 'B7', 'pedido', '5100912345')])
+
+    def test_archive_is_only_scanned_on_request(self):
+        self.write('actual.pdf', b'%PDF-actual')
+        archivo = os.path.join(self.folder, inputs.ARCHIVE_DIR, '2026', '10')
+        os.makedirs(archivo)
+        with open(os.path.join(archivo, 'vieja.pdf'), 'wb') as f:
+            f.write(b'%PDF-vieja')
+        vistos = []
+
+        def stream(pdf_paths, archives, failed, aliases, seen, **kwargs):
+            vistos.append(sorted(os.path.basename(path) for path in pdf_paths))
+            return iter(())
+
+        with mock.patch.object(reconcile.pipeline, 'stream_documents', stream), redirect_stdout(io.StringIO()):
+            reconcile.extract_invoices(self.folder, self.excel_path)
+            reconcile.extract_invoices(self.folder, self.excel_path, include_archived=True)
+        self.assertEqual(vistos, [['actual.pdf'], ['actual.pdf', 'vieja.pdf']])
+
+    def test_same_name_replaces_the_registered_invoice(self):
+        keyindex.record_invoices(self.excel_path, 'detect', [invoice_entry('fa.pdf', 'h1', 'A1', ['5100912345'], 1)])
+        keyindex.record_invoices(self.excel_path, 'detect', [invoice_entry('fa.pdf', 'h2', 'A2', ['5100912346'], 2)])
+        registradas, refs = keyindex.load_invoices(self.excel_path)
+        self.assertEqual([row[:4] for row in registradas], [('h2', 'fa.pdf', 'A', 'A2')])
+        self.assertEqual(refs, [('fa.pdf', 'A2', 'pedido', '5100912346')])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import scheduler
+
+class LargestFirstTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, size):
+        path = os.path.join(self.dir, name)
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+        return path
+
+    def test_pdfs_by_pages_then_size(self):
+        paginas = {'pesado.pdf': 30, 'chico.pdf': 2, 'grande.pdf': 2, 'roto.pdf': None}
+
+        def count_pages(path):
+            count = paginas[os.path.basename(path)]
+            if count is None:
+                raise ValueError('no es un PDF')
+            return count
+
+        paths = [self.write('chico.pdf', 10), self.write('grande.pdf', 500),
+                 self.write('pesado.pdf', 100), self.write('roto.pdf', 1000)]
+        pages = {}
+        with mock.patch.object(scheduler, 'count_pages', count_pages):
+            ordered = scheduler.largest_first(paths, pages)
+        self.assertEqual([os.path.basename(p) for p in ordered], ['pesado.pdf', 'grande.pdf', 'chico.pdf', 'roto.pdf'])
+        self.assertEqual(pages, {'pesado.pdf': 30, 'chico.pdf': 2, 'grande.pdf': 2})
+
+    def test_archives_by_size(self):
+        paths = [self.write('a.zip', 10), self.write('b.zip', 20)]
+        with mock.patch.object(scheduler, 'count_pages', side_effect=AssertionError('no se abre un lote')):
+            ordered = scheduler.largest_first(paths)
+        self.assertEqual([os.path.basename(p) for p in ordered], ['b.zip', 'a.zip'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+import pandas as pd
+import schema
+
+class ApplyTest(unittest.TestCase):
+    def test_types_of_a_text_workbook(self):
+        # Así llegan las columnas de un Excel leído con pandas 3: todo el texto como 'str'
+        df = pd.DataFrame({
+            'Numero de Pedido': pd.Series(['5100912345.0', '5100912346', 'abc'], dtype='str'),
+            'Status': pd.Series(['FACTURADO', ' ', None], dtype='str'),
+            'Fecha': pd.Series(['08/10/2024', 'Sin fecha', None], dtype='str'),
+            'No factura': pd.Series(['1234.0', 'A77', None], dtype='str'),
+            'Precio por unidad': pd.Series(['10050', '', None], dtype='str'),  # Centavos
+        })
+        schema.apply(df)
+        self.assertEqual(df['Numero de Pedido'].dtype, 'Int64')
+        self.assertEqual(df['Numero de Pedido'].tolist()[:2], [5100912345, 5100912346])
+        self.assertTrue(pd.isna(df['Numero de Pedido'].iloc[2]))
+        self.assertIsInstance(df['Status'].dtype, pd.CategoricalDtype)
+        self.assertEqual(set(schema.STATUS_VALUES), set(df['Status'].cat.categories))
+        self.assertEqual(df['Fecha'].iloc[0], pd.Timestamp(2024, 10, 8))
+        self.assertTrue(df['Fecha'].iloc[1:].isna().all())
+        self.assertEqual(df['No factura'].iloc[0], '1234')
+        self.assertEqual(df['Precio por unidad'].dtype, 'Int64')
+        self.assertEqual(df['Precio por unidad'].iloc[0], 10050)
+        self.assertTrue(df['Precio por unidad'].iloc[1:].isna().all())
+
+    def test_apply_keeps_cents(self):
+        df = schema.apply(pd.DataFrame({'Subtotal': [150050, None]}))
+        self.assertEqual(schema.apply(df)['Subtotal'].tolist()[0], 150050)
+        self.assertEqual(df['Subtotal'].dtype, 'Int64')
+
+    def test_empty_dates_are_written_as_sin_fecha(self):
+        df = schema.apply(pd.DataFrame({'Fecha': ['08/10/2024', 'Sin fecha']}))
+        self.assertEqual(schema.for_excel(df)['Fecha'].iloc[1], schema.SIN_FECHA)
+
+    def test_workbook_pesos_round_trip_as_cents(self):
+        df = schema.from_excel(pd.DataFrame({'Subtotal': [1500.5, None], 'Impuesto': ['240.08', '']}))
+        self.assertEqual(df['Subtotal'].tolist()[0], 150050)
+        self.assertEqual(df['Impuesto'].tolist()[0], 24008)
+        # Volver a aplicar el esquema no toca los centavos
+        self.assertEqual(schema.apply(df)['Subtotal'].tolist()[0], 150050)
+        escrito = schema.for_excel(df)
+        self.assertEqual(escrito['Subtotal'].tolist()[0], 1500.5)
+        self.assertEqual(escrito['Impuesto'].tolist()[0], 240.08)
+        self.assertEqual(df['Subtotal'].tolist()[0], 150050)  # for_excel trabaja sobre una copia
+
+    def test_to_key(self):
+        self.assertEqual(schema.to_key('5100912345.0'), 5100912345)
+        self.assertEqual(schema.to_key(12345678.0), 12345678)
+        self.assertIsNone(schema.to_key('12.5'))
+        self.assertIsNone(schema.to_key(None))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+import pandas as pd
+import schema
+import detect
+import detect2
+
+def history():
+    return schema.apply(pd.DataFrame({
+        'Numero de Pedido': ['5100000001', '5100000001', '5100000002', '5100000003', None],
+        'Nº de pieza': ['11110001', '11110002', '11110003', '11110004', '11110005'],
+        'Status': ['NO FACTURADO', 'FACTURADO', 'FACTURADO', 'NO FACTURADO', None],
+        'No factura': [None, 'A10', 'A20', None, None],
+    }))
+
+class DetectRowsToUpdateTest(unittest.TestCase):
+    def test_by_order_then_by_expediente(self):
+        df = history()
+        por_pedido, por_expediente, factura = detect.rows_to_update(
+            df, [5100000001], [11110004, 11110005], {'5100000001': 'A10', '11110005': 'A30'})
+        # La fila ya FACTURADO con el mismo folio no cambia
+        self.assertEqual(por_pedido.tolist(), [True, False, False, False, False])
+        # El expediente 11110004 no trae folio pero su pedido no fue detectado: se marca igual
+        self.assertEqual(por_expediente.tolist(), [False, False, False, True, True])
+        self.assertEqual(factura.tolist(), ['A10', 'A10', '', '', 'A30'])
+
+    def test_invoiced_row_changes_with_a_different_folio(self):
+        df = history()
+        por_pedido, _, factura = detect.rows_to_update(df, [5100000002], [], {'5100000002': 'A99'})
+        self.assertEqual(por_pedido.tolist(), [False, False, True, False, False])
+        self.assertEqual(factura.iloc[2], 'A99')
+
+    def test_expediente_of_a_detected_order_is_not_counted_twice(self):
+        df = history()
+        por_pedido, por_expediente, _ = detect.rows_to_update(df, [5100000001], [11110001], {})
+        self.assertTrue(por_pedido.iloc[0])
+        self.assertFalse(por_expediente.iloc[0])
+
+class Detect2RowsToUpdateTest(unittest.TestCase):
+    def test_by_order_then_by_expediente(self):
+        df = history()
+        por_pedido, por_expediente, referencia = detect2.rows_to_update(df, [5100000002], [11110003, 11110004])
+        self.assertEqual(por_pedido.tolist(), [False, False, True, False, False])
+        self.assertEqual(por_expediente.tolist(), [False, False, False, True, False])
+        self.assertEqual(referencia[por_pedido | por_expediente].tolist(), [5100000002, 11110004])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import io
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+import pandas as pd
+import store
+import extract
+
+def legacy_row(pedido, pieza, fecha):
+    return {"Numero de Pedido": pedido, "Numero de linea": 10, "Nº de pieza": pieza, "Tipo": "Material",
+            "Fecha": fecha, "Descripcion": "Arrastre/M (SER)", "Precio por unidad": 100.0,
+            "Subtotal": 100.0, "Impuesto": 16.0}
+
+def new_record(pedido, pieza, fecha):
+    # Como los deja parse_page: importes en centavos
+    return {"Numero de Pedido": pedido, "Numero de linea": 10, "Nº de pieza": pieza, "Tipo": "Material",
+            "Fecha": fecha, "Descripcion": "Arrastre/M (SER)", "Precio por unidad": 10000,
+            "Subtotal": 10000, "Impuesto": 1600}
+
+class MigrationTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.excel_path = os.path.join(self.dir, 'output', 'data.xlsx')
+        os.makedirs(os.path.dirname(self.excel_path))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write_legacy(self, rows):
+        pd.DataFrame(rows).to_excel(self.excel_path, index=False)
+
+    def partitions(self):
+        with open(store.index_path(self.excel_path), encoding='utf-8') as f:
+            return sorted(json.load(f)['particiones'])
+
+    def test_first_writer_keeps_legacy_history(self):
+        self.write_legacy([legacy_row(5100000001, 11112222, '08/10/2024')])
+        with redirect_stdout(io.StringIO()):
+            extract.merge_records(self.excel_path, [new_record(5100000002, 11113333, '01/01/2025')])
+            df = store.load_all(self.excel_path)
+        self.assertEqual(sorted(df['Nº de pieza'].tolist()), [11112222, 11113333])
+        self.assertEqual(self.partitions(), ['2024-10', '2025-01'])
+
+    def test_migration_splits_history_by_month(self):
+        self.write_legacy([legacy_row(5100000001, 11112222, '08/10/2024'),
+                           legacy_row(5100000002, 11113333, '15/03/2023'),
+                           legacy_row(5100000002, 11114444, 'Sin fecha'),  # Va con su pedido
+                           legacy_row(5100000003, 11115555, '31/10/2024')])
+        with redirect_stdout(io.StringIO()):
+            df = store.load_all(self.excel_path)
+        self.assertEqual(self.partitions(), ['2023-03', '2024-10'])
+        by_piece = dict(zip(df['Nº de pieza'], df[store.PARTITION_COLUMN]))
+        self.assertEqual(by_piece, {11112222: '2024-10', 11113333: '2023-03',
+                                    11114444: '2023-03', 11115555: '2024-10'})
+        self.assertEqual(df.loc[df['Nº de pieza'] == 11113333, 'Fecha'].iloc[0], pd.Timestamp(2023, 3, 15))
+        self.assertTrue(pd.isna(df.loc[df['Nº de pieza'] == 11114444, 'Fecha'].iloc[0]))
+
+    def test_assign_partitions_on_text_dates(self):
+        # Fechas como texto 'str', tal como las lee pandas 3 de un Excel sin tipar
+        df = pd.DataFrame({'Numero de Pedido': [1, 2], 'Fecha': pd.Series(['08/10/2024', '15/03/2023'], dtype='str')})
+        store.assign_partitions(df, {'particiones': {}})
+        self.assertEqual(df[store.PARTITION_COLUMN].tolist(), ['2024-10', '2023-03'])
+
+    def test_money_is_cents_in_memory_and_pesos_in_the_workbooks(self):
+        self.write_legacy([legacy_row(5100000001, 11112222, '08/10/2024')])  # 100.0 pesos
+        with redirect_stdout(io.StringIO()):
+            extract.merge_records(self.excel_path, [new_record(5100000002, 11113333, '09/10/2024')])
+            df = store.load_all(self.excel_path)
+        self.assertEqual(df['Subtotal'].dtype, 'Int64')
+        self.assertEqual(df['Subtotal'].tolist(), [10000, 10000])
+        partition = pd.read_excel(store.partition_path(self.excel_path, '2024-10'))
+        self.assertEqual(partition['Subtotal'].tolist(), [100.0, 100.0])
+        self.assertEqual(partition['Impuesto'].tolist(), [16.0, 16.0])
+
+    def test_migrates_when_data_folder_already_exists(self):
+        # Los avances o la cuarentena pueden crear la carpeta antes de la migración
+        self.write_legacy([legacy_row(5100000001, 11112222, '08/10/2024')])
+        os.makedirs(store.partition_dir(self.excel_path))
+        with open(os.path.join(store.partition_dir(self.excel_path), 'cuarentena.json'), 'w') as f:
+            f.write('{}')
+        with redirect_stdout(io.StringIO()):
+            df = store.load_all(self.excel_path)
+        self.assertEqual(len(df), 1)
+        self.assertTrue(os.path.exists(os.path.join(store.partition_dir(self.excel_path), 'cuarentena.json')))
+
+    def test_interrupted_migration_is_repeated(self):
+        self.write_legacy([legacy_row(5100000001, 11112222, '08/10/2024')])
+        staging = store.partition_dir(self.excel_path) + '.migrando'
+        os.makedirs(staging)
+        open(os.path.join(staging, '2020-01.xlsx'), 'w').close()
+        with redirect_stdout(io.StringIO()):
+            df = store.load_all(self.excel_path)
+        self.assertEqual(len(df), 1)
+        self.assertEqual(self.partitions(), ['2024-10'])
+        self.assertFalse(os.path.exists(staging))
+
+if __name__ == '__main__':
+    unittest.main()